@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Listing, Booking, Review, Payment
+from .models import Listing, Booking, Review, Payment, PaymentEvent
+from .search import get_backend as get_search_backend
 
 @admin.register(Listing)
 class ListingAdmin(admin.ModelAdmin):
@@ -8,6 +9,12 @@ class ListingAdmin(admin.ModelAdmin):
     search_fields = ('title', 'description', 'location')
     readonly_fields = ('created_at',)
 
+    def get_search_results(self, request, queryset, search_term):
+        # Go through the full-text index rather than icontains scans
+        if not search_term:
+            return queryset, False
+        return get_search_backend().filter_queryset(queryset, search_term), False
+
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
     list_display = ('user', 'listing', 'start_date', 'end_date', 'guests', 'created_at')
@@ -45,3 +52,10 @@ class PaymentAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ('tx_ref', 'event', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('event', 'received_at')
+    search_fields = ('tx_ref',)
+    readonly_fields = ('tx_ref', 'event', 'payload', 'digest', 'received_at')
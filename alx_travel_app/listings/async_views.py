@@ -0,0 +1,182 @@
+"""
+Async payment views for ASGI deployments
+
+Same contract as initiate_payment/verify_payment in views.py, but the
+Chapa round trip is awaited on a pooled httpx client and the ORM is used
+through its async API, so a single ASGI process can hold hundreds of
+in-flight Chapa calls without a thread per request. DRF has no async
+views, so these are plain Django views that run DRF's authentication
+classes themselves: CSRF is enforced for session logins only, and errors
+are the same JSON 401/403 responses the DRF views return.
+"""
+import json
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .chapa import get_async_client
+from .models import Booking, Payment
+from .payments import (
+    PROVIDER_UNAVAILABLE,
+    apply_initialize_response,
+    apply_verify_response,
+    initialize_payload,
+    mark_unreachable,
+    save_with_notification
+)
+from .serializers import PaymentInitiationSerializer, PaymentVerificationSerializer
+
+
+def _authenticate(request, required):
+    drf_request = Request(
+        request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    )
+    try:
+        user = drf_request.user
+        if required and not user.is_authenticated:
+            raise exceptions.NotAuthenticated()
+    except exceptions.APIException as e:
+        response = JsonResponse({'detail': e.detail}, status=e.status_code)
+        if isinstance(e, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            # As APIView: 401 with a challenge when the first authenticator has one
+            authenticators = drf_request.authenticators
+            header = authenticators[0].authenticate_header(drf_request) if authenticators else None
+            if header:
+                response['WWW-Authenticate'] = header
+            else:
+                response.status_code = status.HTTP_403_FORBIDDEN
+        return None, response
+    return user, None
+
+
+async def authenticate(request, required=True):
+    """
+    Authenticate with DEFAULT_AUTHENTICATION_CLASSES, as the DRF views do
+
+    Returns (user, None), or (None, error response) for bad credentials, a
+    session request without a CSRF token, or no user when one is required.
+    """
+    # Session lookups and password checks use the sync ORM
+    return await sync_to_async(_authenticate)(request, required)
+
+
+def parse_json(request):
+    try:
+        return json.loads(request.body or b'{}'), None
+    except ValueError as e:
+        return None, JsonResponse({'detail': f'JSON parse error - {e}'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@csrf_exempt
+@require_POST
+async def initiate_payment_async(request):
+    """
+    Initiate payment with Chapa API without holding a worker thread
+    """
+    user, error = await authenticate(request)
+    if error:
+        return error
+
+    data, error = parse_json(request)
+    if error:
+        return error
+    serializer = PaymentInitiationSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        booking = await Booking.objects.select_related('listing').aget(
+            id=serializer.validated_data['booking_id'],
+            user=user
+        )
+
+        if await Payment.objects.filter(booking=booking).aexists():
+            return JsonResponse(
+                {'error': 'Payment already exists for this booking'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            payment = await Payment.objects.acreate(
+                booking=booking,
+                amount=serializer.validated_data['amount'],
+                currency=serializer.validated_data['currency']
+            )
+        except IntegrityError:
+            return JsonResponse(
+                {'error': 'Payment already exists for this booking'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        chapa_data = initialize_payload(
+            payment, booking, serializer.validated_data, request.build_absolute_uri('/')
+        )
+        try:
+            response = await get_async_client().initialize(chapa_data)
+        except httpx.HTTPError as e:
+            payload, http_status = mark_unreachable(payment, e)
+        else:
+            body = response.json() if response.status_code == 200 else {}
+            payload, http_status = apply_initialize_response(
+                payment, response.status_code, body, response.text
+            )
+        await payment.asave()
+        return JsonResponse(payload, status=http_status)
+
+    except Booking.DoesNotExist:
+        return JsonResponse({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'An error occurred: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@csrf_exempt
+@require_POST
+async def verify_payment_async(request):
+    """
+    Verify payment status with Chapa API without holding a worker thread
+    """
+    _, error = await authenticate(request, required=False)
+    if error:
+        return error
+    data, error = parse_json(request)
+    if error:
+        return error
+    serializer = PaymentVerificationSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        payment = await Payment.objects.aget(
+            payment_reference=serializer.validated_data['payment_reference']
+        )
+        try:
+            response = await get_async_client().verify(payment.chapa_transaction_id)
+        except httpx.HTTPError:
+            return JsonResponse(PROVIDER_UNAVAILABLE, status=status.HTTP_502_BAD_GATEWAY)
+
+        body = response.json() if response.status_code == 200 else {}
+        payload, http_status, changed = apply_verify_response(
+            payment, response.status_code, body, response.text
+        )
+        if changed:
+            # Transactions need the sync ORM; the outbox sends the email
+            await sync_to_async(save_with_notification)(payment)
+        return JsonResponse(payload, status=http_status)
+
+    except Payment.DoesNotExist:
+        return JsonResponse({'error': 'Payment not found'}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'An error occurred: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
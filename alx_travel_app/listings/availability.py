@@ -0,0 +1,154 @@
+"""
+Date-range availability backed by per-listing occupancy bitmaps
+
+A listing is free for [start_date, end_date) when none of the bits for
+those nights are set in its ListingOccupancy bitmap. Checking a range is
+a shift and a mask, so search cost depends on the number of candidate
+listings and never on how many bookings they have.
+"""
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Booking, Listing, ListingOccupancy
+
+
+def nights_mask(origin, start_date, end_date):
+    """
+    Bits for the nights [start_date, end_date) relative to origin
+    """
+    first = (start_date - origin).days
+    last = (end_date - origin).days
+    first = max(first, 0)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def is_free(origin, mask, start_date, end_date):
+    """
+    True when no night in [start_date, end_date) is set in mask
+    """
+    if origin is None or not mask:
+        return True
+    return not (mask & nights_mask(origin, start_date, end_date))
+
+
+def guest_filter(guests):
+    if not guests:
+        return Q()
+    return Q(max_guests__isnull=True) | Q(max_guests__gte=guests)
+
+
+def available_listings(queryset, start_date, end_date, guests=None, chunk_size=2000):
+    """
+    Yield the ids of listings in queryset that are free for the whole range
+
+    queryset order is preserved; bitmaps are read in chunks alongside the
+    listing ids so memory stays bounded however many listings match.
+    """
+    rows = (
+        queryset.filter(guest_filter(guests))
+        .values_list('id', 'occupancy__origin', 'occupancy__bitmap')
+        .iterator(chunk_size=chunk_size)
+    )
+    for listing_id, origin, bitmap in rows:
+        mask = int.from_bytes(bitmap, 'little') if bitmap else 0
+        if is_free(origin, mask, start_date, end_date):
+            yield listing_id
+
+
+def naive_available_listings(queryset, start_date, end_date, guests=None):
+    """
+    Reference implementation using an ORM overlap query against Booking
+    """
+    return (
+        queryset.filter(guest_filter(guests))
+        .exclude(id__in=Booking.objects.filter(
+            start_date__lt=end_date, end_date__gt=start_date
+        ).values('listing_id'))
+        .values_list('id', flat=True)
+    )
+
+
+def refresh_occupancy(listing_id, start_date, end_date):
+    """
+    Recompute the bits for [start_date, end_date) of one listing
+
+    Called after a booking in that range is created, moved or deleted.
+    Only bookings overlapping the window are read.
+    """
+    if end_date <= start_date:
+        return
+    with transaction.atomic():
+        occupancy = (
+            ListingOccupancy.objects.select_for_update()
+            .filter(listing_id=listing_id)
+            .first()
+        )
+        overlapping = list(
+            Booking.objects.filter(
+                listing_id=listing_id, start_date__lt=end_date, end_date__gt=start_date
+            ).values_list('start_date', 'end_date')
+        )
+        if occupancy is None:
+            if not overlapping:
+                # Nothing to record, e.g. bookings removed by a listing cascade
+                return
+            occupancy = ListingOccupancy(listing_id=listing_id, origin=start_date)
+        mask = occupancy.mask
+        if start_date < occupancy.origin:
+            mask <<= (occupancy.origin - start_date).days
+            occupancy.origin = start_date
+
+        origin = occupancy.origin
+        mask &= ~nights_mask(origin, start_date, end_date)
+        for booked_start, booked_end in overlapping:
+            mask |= nights_mask(origin, max(booked_start, start_date), min(booked_end, end_date))
+
+        occupancy.mask = mask
+        occupancy.save()
+
+
+def rebuild_occupancy(listing_ids=None, batch_size=1000):
+    """
+    Rebuild bitmaps from scratch with one ordered pass over Booking
+
+    Returns the number of listings that have at least one booking.
+    """
+    bookings = Booking.objects.order_by('listing_id')
+    occupancies = ListingOccupancy.objects.all()
+    if listing_ids is not None:
+        bookings = bookings.filter(listing_id__in=listing_ids)
+        occupancies = occupancies.filter(listing_id__in=listing_ids)
+    rows = bookings.values_list('listing_id', 'start_date', 'end_date').iterator(chunk_size=10000)
+
+    built = 0
+    batch = []
+    with transaction.atomic():
+        occupancies.delete()
+        for listing_id, ranges in groupby(rows, key=lambda row: row[0]):
+            ranges = [(start, end) for _, start, end in ranges]
+            origin = min(start for start, _ in ranges)
+            occupancy = ListingOccupancy(listing_id=listing_id, origin=origin)
+            mask = 0
+            for start, end in ranges:
+                mask |= nights_mask(origin, start, end)
+            occupancy.mask = mask
+            batch.append(occupancy)
+            built += 1
+            if len(batch) >= batch_size:
+                ListingOccupancy.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            ListingOccupancy.objects.bulk_create(batch)
+    return built
+
+
+def listings_for_ids(ids):
+    """
+    Fetch listings by id, keeping the order of ids
+    """
+    by_id = Listing.objects.in_bulk(ids)
+    return [by_id[pk] for pk in ids if pk in by_id]
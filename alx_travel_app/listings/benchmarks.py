@@ -0,0 +1,185 @@
+"""
+Small timing helpers shared by the bench_* management commands
+"""
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+
+def percentile(samples, pct):
+    """
+    Nearest-rank percentile of a list of numbers
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples_ms):
+    """
+    Latency summary, in milliseconds, for a list of samples
+    """
+    return {
+        'count': len(samples_ms),
+        'mean_ms': round(statistics.fmean(samples_ms), 3) if samples_ms else 0.0,
+        'p50_ms': round(percentile(samples_ms, 50), 3),
+        'p95_ms': round(percentile(samples_ms, 95), 3),
+        'p99_ms': round(percentile(samples_ms, 99), 3),
+        'max_ms': round(max(samples_ms), 3) if samples_ms else 0.0,
+    }
+
+
+def time_calls(func, args_list):
+    """
+    Call func(*args) for every entry of args_list, returning samples in ms
+    """
+    samples = []
+    for args in args_list:
+        started = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def run_concurrently(workers, target):
+    """
+    Run target(worker_index) on `workers` threads; returns elapsed seconds
+
+    Each thread closes its own database connections when it finishes.
+    """
+    from django.db import connections
+
+    errors = []
+
+    def run(index):
+        try:
+            target(index)
+        except Exception as e:  # surfaced after join
+            errors.append(e)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise errors[0]
+    return elapsed
+
+
+def booking_stress(listings, users, writers, attempts, seed=0, first_day=None, days=60):
+    """
+    Hammer save_booking from `writers` threads with random overlapping ranges
+
+    Returns a dict with attempts, created, conflicts, overlaps found
+    afterwards and throughput in attempts per second.
+    """
+    from datetime import date, timedelta
+
+    from .bookings import BookingConflict, save_booking
+    from .models import Booking
+    from .serializers import BookingSerializer
+
+    first_day = first_day or date(2030, 1, 1)
+    created = []
+    conflicts = []
+
+    def writer(index):
+        rng = random.Random(seed * 1000 + index)
+        user = users[index % len(users)]
+        for _ in range(attempts):
+            start = first_day + timedelta(days=rng.randrange(days))
+            serializer = BookingSerializer(data={
+                'listing': rng.choice(listings).pk,
+                'start_date': start,
+                'end_date': start + timedelta(days=rng.randint(1, 5)),
+                'guests': 1,
+            })
+            if not serializer.is_valid():
+                # Same user, listing and dates as an earlier booking
+                conflicts.append(index)
+                continue
+            try:
+                save_booking(serializer, user)
+                created.append(index)
+            except BookingConflict:
+                conflicts.append(index)
+
+    elapsed = run_concurrently(writers, writer)
+    listing_ids = [listing.pk for listing in listings]
+    return {
+        'writers': writers,
+        'attempts': writers * attempts,
+        'created': len(created),
+        'conflicts': len(conflicts),
+        'overlaps': count_overlaps(Booking.objects.filter(listing_id__in=listing_ids)),
+        'seconds': round(elapsed, 3),
+        'attempts_per_sec': round(writers * attempts / elapsed, 1),
+    }
+
+
+def count_overlaps(bookings):
+    """
+    Number of bookings whose nights overlap an earlier booking on the same listing
+    """
+    overlaps = 0
+    previous_listing, previous_end = None, None
+    rows = bookings.order_by('listing_id', 'start_date').values_list('listing_id', 'start_date', 'end_date')
+    for listing_id, start, end in rows.iterator():
+        if listing_id == previous_listing and start < previous_end:
+            overlaps += 1
+            previous_end = max(previous_end, end)
+        else:
+            previous_listing, previous_end = listing_id, end
+    return overlaps
+
+
+def use_memory_broker():
+    """
+    Point Celery at kombu's in-memory transport, so benchmarks can publish
+    tasks without a Redis broker; returns the Celery app
+    """
+    from alx_travel_app.celery import app
+
+    # Celery reads these environment variables ahead of any configuration
+    os.environ['CELERY_BROKER_URL'] = 'memory://'
+    os.environ['CELERY_RESULT_BACKEND'] = 'cache+memory://'
+    return app
+
+
+@contextmanager
+def scratch_database():
+    """
+    Point the default SQLite database at a freshly migrated temporary file
+
+    What a benchmark writes inside the block never reaches the real
+    database, and the file is removed afterwards.
+    """
+    from django.core.management import call_command
+    from django.db import connections
+
+    connection = connections['default']
+    if connection.vendor != 'sqlite':
+        raise RuntimeError('scratch_database() needs an SQLite default database')
+    original = dict(connection.settings_dict)
+    directory = tempfile.mkdtemp()
+    connections.close_all()
+    connection.settings_dict['NAME'] = os.path.join(directory, 'scratch.sqlite3')
+    try:
+        call_command('migrate', verbosity=0)
+        yield connection.settings_dict['NAME']
+    finally:
+        connections.close_all()
+        connection.settings_dict.update(original)
+        shutil.rmtree(directory)
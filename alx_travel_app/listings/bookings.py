@@ -0,0 +1,81 @@
+"""
+Overlap-safe booking creation
+
+Two requests for overlapping nights on the same listing must not both
+succeed, so the overlap check and the insert run inside one transaction
+holding a per-listing lock:
+
+- PostgreSQL: a transaction-scoped advisory lock keyed on the listing id
+- MySQL/Oracle: SELECT ... FOR UPDATE on the listing row
+- SQLite: a process-wide lock; SQLite only ever has one writer anyway, and
+  lock errors from other processes are retried
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import OperationalError, connection, transaction
+
+from .models import Booking, Listing
+
+# Keeps our advisory lock ids apart from any other pg_advisory_* users
+ADVISORY_LOCK_NAMESPACE = 0x4C53
+
+_sqlite_write_lock = threading.Lock()
+
+
+class BookingConflict(Exception):
+    """
+    Raised when the requested nights overlap an existing booking
+    """
+
+
+@contextmanager
+def listing_transaction(listing_id):
+    """
+    Open a transaction that holds the booking lock for one listing
+
+    The lock is only released once the transaction has committed or
+    rolled back, so the next writer always sees the previous one's rows.
+    """
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        with _sqlite_write_lock, transaction.atomic():
+            yield
+        return
+
+    with transaction.atomic():
+        if vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT pg_advisory_xact_lock(%s, %s)', [ADVISORY_LOCK_NAMESPACE, listing_id]
+                )
+        else:
+            list(Listing.objects.select_for_update().filter(pk=listing_id).values_list('pk'))
+        yield
+
+
+def overlapping_bookings(listing_id, start_date, end_date):
+    return Booking.objects.filter(
+        listing_id=listing_id, start_date__lt=end_date, end_date__gt=start_date
+    )
+
+
+def save_booking(serializer, user, attempts=3):
+    """
+    Save a validated BookingSerializer unless its nights are already taken
+    """
+    data = serializer.validated_data
+    listing_id = data['listing'].pk
+    for attempt in range(attempts):
+        try:
+            with listing_transaction(listing_id):
+                if overlapping_bookings(listing_id, data['start_date'], data['end_date']).exists():
+                    raise BookingConflict('Listing is already booked for some of these dates')
+                return serializer.save(user=user)
+        except OperationalError as e:
+            # SQLite reports writer contention from other processes this way
+            if 'locked' not in str(e) or attempt == attempts - 1:
+                raise
+            time.sleep(random.uniform(0.01, 0.05) * (attempt + 1))
@@ -0,0 +1,239 @@
+"""
+Two-tier read-through cache for serialized payloads
+
+Reads go to a small in-process LRU first, then to Django's cache framework
+(Redis in production), and only then to the database. Each key belongs to
+a version group whose counter lives in the shared cache: invalidating a
+group bumps the counter, so entries computed from stale rows are never
+read again, even if the recompute finishes after the invalidation.
+
+The in-process tier cannot hear about writes made by other processes, so
+its TTL bounds how stale another worker can be; keep it short.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+MISSING = object()
+
+
+class LocalLRUCache:
+    """
+    Thread-safe LRU with a per-entry TTL and hit/miss/eviction counters
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # Bumped by delete_prefix(), so fills that raced it can be dropped
+        self.generation = 0
+
+    def get(self, key, count=True):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                item = None
+            if item is None:
+                self.misses += count
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += count
+            return item[1]
+
+    def set(self, key, value, generation=None):
+        """
+        Store value, unless delete_prefix() ran since generation was read
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            self.generation += 1
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class TwoTierCache:
+    """
+    In-process LRU in front of a Django cache, with stampede protection
+
+    On a miss in both tiers only one thread per process, and one process
+    per key via a short-lived lock in the shared cache, runs compute();
+    everyone else waits for its result.
+    """
+
+    def __init__(self, prefix, local_maxsize, local_ttl, ttl, lock_timeout=10, alias='default'):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.alias = alias
+        self.local = LocalLRUCache(local_maxsize, local_ttl)
+        self._key_locks = [threading.Lock() for _ in range(64)]
+        self._stats_lock = threading.Lock()
+        self.shared_hits = 0
+        self.computes = 0
+        self.stampede_waits = 0
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _version_key(self, group):
+        return f'{self.prefix}:version:{group}'
+
+    def get_or_set(self, key, compute, group=None, share=True):
+        """
+        Return the cached value for key, computing and storing it on a miss
+
+        compute() returning None is treated as "nothing to cache". With
+        share=False a computed value only goes to the in-process tier, for
+        values other processes must not be served.
+        """
+        group = group or key
+        local_key = f'{group}|{key}'
+        value = self.local.get(local_key)
+        if value is not MISSING:
+            return value
+
+        with self._key_locks[hash(local_key) % len(self._key_locks)]:
+            # Another thread may have filled it while we waited
+            value = self.local.get(local_key, count=False)
+            if value is not MISSING:
+                return value
+
+            # Read before the version: an invalidate() from here on bumps the
+            # version before clearing the local tier, so the value computed
+            # below is either current or dropped by local.set()
+            generation = self.local.generation
+            version = self.shared.get(self._version_key(group), 0)
+            shared_key = f'{self.prefix}:{group}:{version}:{key}'
+            value = self.shared.get(shared_key, MISSING)
+            if value is not MISSING:
+                self._count('shared_hits')
+            elif share:
+                value = self._compute_once(shared_key, compute)
+            else:
+                self._count('computes')
+                value = compute()
+            if value is not None:
+                self.local.set(local_key, value, generation)
+            return value
+
+    def _compute_once(self, shared_key, compute):
+        lock_key = f'{shared_key}:lock'
+        deadline = time.monotonic() + self.lock_timeout
+        locked = self.shared.add(lock_key, 1, self.lock_timeout)
+        while not locked:
+            self._count('stampede_waits')
+            time.sleep(0.02)
+            value = self.shared.get(shared_key, MISSING)
+            if value is not MISSING:
+                return value
+            if time.monotonic() > deadline:
+                # The lock holder died or is slow; compute ourselves
+                break
+            locked = self.shared.add(lock_key, 1, self.lock_timeout)
+        try:
+            self._count('computes')
+            value = compute()
+            if value is not None:
+                self.shared.set(shared_key, value, self.ttl)
+            return value
+        finally:
+            # Without the lock, it is someone else's to release
+            if locked:
+                self.shared.delete(lock_key)
+
+    def invalidate(self, group):
+        """
+        Drop every entry of a version group from both tiers
+        """
+        version_key = self._version_key(group)
+        self.shared.add(version_key, 0, None)
+        try:
+            self.shared.incr(version_key)
+        except ValueError:
+            # Evicted between add() and incr(); any new version will do
+            self.shared.set(version_key, int(time.time()), None)
+        # After the bump, see get_or_set()
+        self.local.delete_prefix(f'{group}|')
+
+    def stats(self):
+        local = self.local.stats()
+        with self._stats_lock:
+            return {
+                'local': local,
+                'shared_hits': self.shared_hits,
+                'misses': self.computes,
+                'stampede_waits': self.stampede_waits,
+            }
+
+
+listing_cache = TwoTierCache(
+    'listings',
+    local_maxsize=settings.LISTING_CACHE_LOCAL_SIZE,
+    local_ttl=settings.LISTING_CACHE_LOCAL_TTL,
+    ttl=settings.LISTING_CACHE_TTL,
+)
+
+LISTING_LIST_GROUP = 'listing-list'
+
+
+def listing_detail_group(pk):
+    return f'listing-{pk}'
+
+
+def invalidate_listing(pk):
+    """
+    Forget a listing's detail payload and every cached listing page
+    """
+    listing_cache.invalidate(listing_detail_group(pk))
+    listing_cache.invalidate(LISTING_LIST_GROUP)
+
+
+def listing_reviews_group(pk):
+    return f'reviews-{pk}'
+
+
+def invalidate_reviews(pk):
+    """
+    Forget a listing's cached review feed page and rating histogram
+    """
+    listing_cache.invalidate(listing_reviews_group(pk))
@@ -0,0 +1,288 @@
+"""
+Shared HTTP clients for the Chapa API
+
+One pooled, keep-alive requests.Session per process instead of a fresh
+TCP+TLS handshake per payment, and one httpx.AsyncClient per event loop
+for the async views. Every call has connect/read timeouts; idempotent
+calls (verification) are retried with jittered exponential backoff,
+initialization only when the connection was never made.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+
+from .benchmarks import percentile
+from .metrics import record_chapa
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class CallStats:
+    """
+    Latency and outcome counters for one Chapa operation
+    """
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_ms = 0.0
+        self.samples = deque(maxlen=window)
+
+    def record(self, elapsed_ms, error=False, retries=0):
+        with self._lock:
+            self.calls += 1
+            self.errors += error
+            self.retries += retries
+            self.total_ms += elapsed_ms
+            self.samples.append(elapsed_ms)
+
+    def snapshot(self):
+        with self._lock:
+            samples = list(self.samples)
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'retries': self.retries,
+                'total_ms': round(self.total_ms, 3),
+                'p50_ms': round(percentile(samples, 50), 3),
+                'p99_ms': round(percentile(samples, 99), 3),
+            }
+
+
+def new_call_stats():
+    return {'initialize': CallStats(), 'verify': CallStats()}
+
+
+# Process-wide counters shared by the sync and async clients
+CHAPA_STATS = new_call_stats()
+
+
+def backoff_delay(backoff, attempt):
+    """
+    Full-jitter exponential backoff
+    """
+    return random.uniform(0, backoff * 2 ** attempt)
+
+
+class ChapaClient:
+    def __init__(self, base_url, secret_key, connect_timeout=3.05, read_timeout=10,
+                 max_retries=2, backoff=0.25, pool_size=20, stats=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'Bearer {secret_key}',
+            'Content-Type': 'application/json',
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.stats = stats or new_call_stats()
+
+    def initialize(self, payload):
+        """
+        POST /transaction/initialize; returns the requests.Response
+        """
+        return self._call('initialize', 'POST', '/transaction/initialize', idempotent=False, json=payload)
+
+    def verify(self, reference):
+        """
+        GET /transaction/verify/<reference>; returns the requests.Response
+        """
+        return self._call('verify', 'GET', f'/transaction/verify/{reference}', idempotent=True)
+
+    def _call(self, operation, method, path, idempotent, **kwargs):
+        url = f'{self.base_url}{path}'
+        started = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+                except requests.ConnectionError as e:
+                    # A refused or timed-out connect never reached Chapa, so
+                    # even a POST is safe to resend
+                    retryable = idempotent or _not_sent(e)
+                    if not retryable or attempt >= self.max_retries:
+                        raise
+                    logger.warning('Chapa %s failed (%s), retrying', operation, e)
+                except requests.Timeout:
+                    if not idempotent or attempt >= self.max_retries:
+                        raise
+                    logger.warning('Chapa %s timed out, retrying', operation)
+                else:
+                    if not (idempotent and response.status_code in RETRY_STATUSES and attempt < self.max_retries):
+                        self._record(operation, started, response.status_code >= 500, attempt)
+                        return response
+                    logger.warning('Chapa %s returned %s, retrying', operation, response.status_code)
+                time.sleep(backoff_delay(self.backoff, attempt))
+                attempt += 1
+        except requests.RequestException:
+            self._record(operation, started, True, attempt)
+            raise
+
+    def _record(self, operation, started, error, retries):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stats[operation].record(elapsed_ms, error, retries)
+        record_chapa(elapsed_ms)
+        logger.info('Chapa %s took %.1fms (retries=%d)', operation, elapsed_ms, retries)
+
+    def stats_snapshot(self):
+        return {operation: stats.snapshot() for operation, stats in self.stats.items()}
+
+    def close(self):
+        self.session.close()
+
+
+def _not_sent(error):
+    """
+    True when the request failed while connecting, before any byte was sent
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    cause = error.args[0] if error.args else None
+    # urllib3's NewConnectionError (refused, DNS failure) subclasses this too
+    return isinstance(getattr(cause, 'reason', None), ConnectTimeoutError)
+
+
+class AsyncChapaClient:
+    """
+    asyncio twin of ChapaClient built on a pooled httpx.AsyncClient
+
+    An AsyncClient is bound to the event loop it was first used on, so
+    use get_async_client() rather than sharing instances across loops.
+    """
+
+    def __init__(self, base_url, secret_key, connect_timeout=3.05, read_timeout=10,
+                 max_retries=2, backoff=0.25, pool_size=100, stats=None):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip('/'),
+            headers={'Authorization': f'Bearer {secret_key}'},
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        self.stats = stats or new_call_stats()
+
+    async def initialize(self, payload):
+        return await self._call('initialize', 'POST', '/transaction/initialize', idempotent=False, json=payload)
+
+    async def verify(self, reference):
+        return await self._call('verify', 'GET', f'/transaction/verify/{reference}', idempotent=True)
+
+    async def _call(self, operation, method, path, idempotent, **kwargs):
+        started = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    response = await self.client.request(method, path, **kwargs)
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    # Never reached Chapa, so even a POST is safe to resend
+                    if attempt >= self.max_retries:
+                        raise
+                    logger.warning('Chapa %s failed (%s), retrying', operation, e)
+                except httpx.TimeoutException:
+                    if not idempotent or attempt >= self.max_retries:
+                        raise
+                    logger.warning('Chapa %s timed out, retrying', operation)
+                else:
+                    if not (idempotent and response.status_code in RETRY_STATUSES and attempt < self.max_retries):
+                        elapsed_ms = (time.perf_counter() - started) * 1000
+                        self.stats[operation].record(elapsed_ms, response.status_code >= 500, attempt)
+                        record_chapa(elapsed_ms)
+                        return response
+                    logger.warning('Chapa %s returned %s, retrying', operation, response.status_code)
+                await asyncio.sleep(backoff_delay(self.backoff, attempt))
+                attempt += 1
+        except httpx.HTTPError:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.stats[operation].record(elapsed_ms, True, attempt)
+            record_chapa(elapsed_ms)
+            raise
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def client_options():
+    return {
+        'connect_timeout': settings.CHAPA_CONNECT_TIMEOUT,
+        'read_timeout': settings.CHAPA_READ_TIMEOUT,
+        'max_retries': settings.CHAPA_MAX_RETRIES,
+        'backoff': settings.CHAPA_RETRY_BACKOFF,
+        'stats': CHAPA_STATS,
+    }
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """
+    AsyncChapaClient for the running event loop
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncChapaClient(
+            settings.CHAPA_BASE_URL,
+            settings.CHAPA_SECRET_KEY,
+            pool_size=settings.CHAPA_ASYNC_POOL_SIZE,
+            **client_options(),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Process-wide ChapaClient, recreated after fork (e.g. Celery prefork)
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = ChapaClient(
+                    settings.CHAPA_BASE_URL,
+                    settings.CHAPA_SECRET_KEY,
+                    pool_size=settings.CHAPA_POOL_SIZE,
+                    **client_options(),
+                )
+                _client_pid = os.getpid()
+    return _client
+
+
+def reset_client():
+    """
+    Drop the shared clients, e.g. after CHAPA_* settings change in tests
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _async_clients.clear()
@@ -0,0 +1,120 @@
+"""
+In-process fake of the Chapa API for tests and benchmarks
+
+    with ChapaStubServer(latency=0.05) as stub:
+        settings.CHAPA_BASE_URL = stub.base_url
+
+Serves /transaction/initialize and /transaction/verify/<reference> over
+HTTP/1.1 keep-alive, records every request and the number of TCP
+connections opened, and can be told to fail or delay calls.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ChapaStubServer:
+    def __init__(self, latency=0.0, verify_status='success'):
+        self.latency = latency
+        self.verify_status = verify_status
+        self.fail_next = 0
+        self.requests = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _take_failure(self):
+        with self._lock:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return True
+            return False
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Send headers and body in one segment; split writes hit the
+            # client's delayed ACK and add ~40ms to every call
+            wbufsize = 64 * 1024
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}')
+                self.handle_call('POST', body)
+
+            def do_GET(self):
+                self.handle_call('GET', None)
+
+            def handle_call(self, method, body):
+                with stub._lock:
+                    stub.requests.append((method, self.path, body))
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub._take_failure():
+                    return self.respond(503, {'status': 'failed', 'message': 'Service unavailable'})
+
+                if method == 'POST' and self.path == '/transaction/initialize':
+                    tx_ref = body.get('tx_ref')
+                    return self.respond(200, {
+                        'status': 'success',
+                        'message': 'Hosted Link',
+                        'data': {
+                            'checkout_url': f'https://checkout.chapa.test/{tx_ref}',
+                            'reference': f'chapa-{tx_ref}',
+                        },
+                    })
+                if method == 'GET' and self.path.startswith('/transaction/verify/'):
+                    reference = self.path.rsplit('/', 1)[-1]
+                    return self.respond(200, {
+                        'status': 'success',
+                        'message': 'Payment details',
+                        'data': {
+                            'status': stub.verify_status,
+                            'reference': reference,
+                            'payment_method': 'test',
+                        },
+                    })
+                self.respond(404, {'status': 'failed', 'message': 'Not found'})
+
+            def respond(self, code, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
@@ -0,0 +1,41 @@
+"""
+Conditional GET helpers
+
+Endpoints compute cheap validators (a version counter, an updated_at
+timestamp) before doing any serialization, and answer If-None-Match /
+If-Modified-Since with 304 when the client's copy is still current.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    """
+    Opaque strong ETag derived from the given validator parts
+    """
+    raw = '|'.join(str(part) for part in parts).encode()
+    return quote_etag(hashlib.md5(raw, usedforsecurity=False).hexdigest())
+
+
+def not_modified(request, etag=None, last_modified=None):
+    """
+    Return a 304 (or 412) response if the request's validators match
+
+    last_modified is an aware datetime. Returns None when the full
+    response has to be built.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag=None, last_modified=None):
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
@@ -0,0 +1,157 @@
+"""
+Compiled serializers for hot read endpoints
+
+Building a DRF serializer for every page, and calling each field's
+to_representation through its get_attribute machinery for every row, is
+most of the CPU a listing or payment page costs once the query is fast.
+compile_serializer() reads a flat ModelSerializer's fields once and keeps,
+per field, the model column to select and a converter that turns the
+database value into exactly what the field would have rendered: Decimals
+quantized and formatted as strings, datetimes in the current time zone as
+ISO 8601, UUIDs as strings. Strings, integers, booleans and foreign keys
+render as the database returns them, so they get no converter at all.
+
+Rows come from values_list(*compiled.columns); render() turns a list of
+them into the same dicts the serializer's .data would have produced.
+Serializers with fields it cannot reproduce (nested serializers, method
+fields, dotted sources, custom formats) are refused at compile time with a
+TypeError, rather than rendered differently.
+"""
+import decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import fields as drf_fields, relations
+from rest_framework.settings import ISO_8601, api_settings
+
+from .metrics import timed
+
+# Fields whose to_representation returns database values unchanged
+PLAIN_FIELDS = (
+    drf_fields.BooleanField,
+    drf_fields.CharField,
+    drf_fields.ChoiceField,
+    drf_fields.FloatField,
+    drf_fields.IntegerField,
+)
+
+
+def decimal_converter(field):
+    if field.localize or field.normalize_output or field.decimal_places is None:
+        return None
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+    if getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING):
+        return lambda value, tz: '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+    return lambda value, tz: value.quantize(exponent, rounding=rounding, context=context)
+
+
+def datetime_converter(field):
+    if getattr(field, 'format', api_settings.DATETIME_FORMAT).lower() != ISO_8601:
+        return None
+    if hasattr(field, 'timezone') or not settings.USE_TZ:
+        return None
+
+    def convert(value, tz):
+        value = value.astimezone(tz) if value.utcoffset() is not None else timezone.make_aware(value, tz)
+        value = value.isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+def date_converter(field):
+    if getattr(field, 'format', api_settings.DATE_FORMAT).lower() != ISO_8601:
+        return None
+    return lambda value, tz: value.isoformat()
+
+
+def uuid_converter(field):
+    if field.uuid_format != 'hex_verbose':
+        return None
+    return lambda value, tz: str(value)
+
+
+# Field class -> factory returning its converter, or None when the field
+# is configured in a way the converter would not reproduce. Converters take
+# the value and the current time zone, looked up once per render(): asking
+# for it per value would cost more than the conversion itself.
+CONVERTERS = (
+    (drf_fields.DecimalField, decimal_converter),
+    (drf_fields.DateTimeField, datetime_converter),
+    (drf_fields.DateField, date_converter),
+    (drf_fields.UUIDField, uuid_converter),
+)
+
+
+class CompiledSerializer:
+    """
+    A flat ModelSerializer reduced to columns and per-column converters
+    """
+
+    def __init__(self, serializer):
+        self.names = []
+        self.columns = []
+        self.converters = []
+        for index, field in enumerate(serializer._readable_fields):
+            if '.' in field.source or field.source == '*':
+                raise self.unsupported(serializer, field)
+            self.names.append(field.field_name)
+            self.columns.append(field.source)
+            converter = self.converter(field)
+            if converter is False:
+                raise self.unsupported(serializer, field)
+            if converter is not None:
+                self.converters.append((index, converter))
+        self.names = tuple(self.names)
+        self.columns = tuple(self.columns)
+
+    @staticmethod
+    def converter(field):
+        """
+        The field's converter, None when values pass through, False when unsupported
+        """
+        for field_class, factory in CONVERTERS:
+            if isinstance(field, field_class):
+                return factory(field) or False
+        if isinstance(field, relations.PrimaryKeyRelatedField) and field.pk_field is None:
+            # values_list() of a foreign key is already the related id
+            return None
+        if isinstance(field, PLAIN_FIELDS):
+            return None
+        return False
+
+    @staticmethod
+    def unsupported(serializer, field):
+        return TypeError(
+            f"{type(serializer).__name__}.{field.field_name} ({type(field).__name__}) can't be compiled"
+        )
+
+    def render(self, rows):
+        """
+        Serialize values_list(*self.columns) rows; extra trailing values are ignored
+        """
+        names, converters, width = self.names, self.converters, len(self.names)
+        tz = timezone.get_current_timezone()
+        results = []
+        with timed('serializer'):
+            for row in rows:
+                values = list(row[:width])
+                for index, convert in converters:
+                    value = values[index]
+                    if value is not None:
+                        values[index] = convert(value, tz)
+                results.append(dict(zip(names, values)))
+        return results
+
+
+@lru_cache(maxsize=None)
+def compile_serializer(serializer_class, fields=None):
+    """
+    The CompiledSerializer of serializer_class, restricted to fields if given
+    """
+    serializer = serializer_class(fields=fields) if fields else serializer_class()
+    return CompiledSerializer(serializer)
@@ -0,0 +1,130 @@
+"""
+Idempotency-Key support for unsafe API views
+
+A client that retries a POST with the same Idempotency-Key header gets the
+first response replayed byte for byte instead of running the view again.
+Keys are scoped to the user and path. While the first request is still
+running, duplicates wait for its result rather than calling out to Chapa a
+second time. Results live in CACHES['default'] (Redis in production), so
+the guarantee holds across workers only with a shared cache backend.
+
+5xx responses are not stored: the client may retry them for real.
+
+A view that outlives IDEMPOTENCY_LOCK_TIMEOUT loses its lock to the next
+duplicate. It then must not delete the lock, which is no longer its own,
+so the lock is only released while it certainly has not expired; past
+that it is left to expire or to the duplicate holding it.
+"""
+import hashlib
+import json
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+REPLAYED_HEADER = 'Idempotent-Replayed'
+REPLAYED_HEADERS = ('Content-Type', 'Location')
+# Seconds before the lock's expiry after which we no longer release it
+LOCK_MARGIN = 1
+
+
+def request_fingerprint(request):
+    """
+    Hash of the parsed request body, to catch a key reused for another request
+    """
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def cache_key(request, key):
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f'idempotency:{request.user.pk}:{request.path}:{digest}'
+
+
+def replay(stored, fingerprint):
+    if stored['fingerprint'] != fingerprint:
+        return Response(
+            {'error': f'{HEADER} was already used for a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    response = HttpResponse(stored['content'], status=stored['status'])
+    for name, value in stored['headers'].items():
+        response[name] = value
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def idempotent(view):
+    """
+    Make a DRF function view honour the Idempotency-Key header
+
+    Apply below @api_view/@permission_classes so request.user is resolved.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        result_key = cache_key(request, key)
+        lock_key = f'{result_key}:lock'
+        fingerprint = request_fingerprint(request)
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+
+        while True:
+            stored = cache.get(result_key)
+            if stored is not None:
+                return replay(stored, fingerprint)
+            acquired = time.monotonic()
+            if cache.add(lock_key, 1, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+                break
+            if time.monotonic() >= deadline:
+                return Response(
+                    {'error': f'A request with this {HEADER} is still in progress'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            time.sleep(0.05)
+
+        def release():
+            # Measured from before add(), so the cached lock expires later still
+            if time.monotonic() - acquired < settings.IDEMPOTENCY_LOCK_TIMEOUT - LOCK_MARGIN:
+                cache.delete(lock_key)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            release()
+            raise
+        if response.status_code >= 500:
+            release()
+            return response
+
+        def store(rendered):
+            cache.set(result_key, {
+                'fingerprint': fingerprint,
+                'status': rendered.status_code,
+                'headers': {name: rendered[name] for name in REPLAYED_HEADERS if rendered.has_header(name)},
+                'content': rendered.content,
+            }, settings.IDEMPOTENCY_TTL)
+            release()
+
+        # The stored bytes must be exactly what the first caller received,
+        # so capture them after DRF has rendered the response
+        if hasattr(response, 'add_post_render_callback'):
+            response.add_post_render_callback(store)
+        else:
+            store(response)
+        return response
+
+    return wrapper
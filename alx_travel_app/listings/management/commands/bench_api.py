@@ -0,0 +1,386 @@
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+
+from listings.availability import rebuild_occupancy
+from listings.benchmarks import run_concurrently, summarize
+from listings.cache import LISTING_LIST_GROUP, listing_cache
+from listings.chapa import reset_client
+from listings.chapa_stub import ChapaStubServer
+from listings.metrics import (
+    CHAPA_SECONDS,
+    COUNT,
+    DB_SECONDS,
+    QUERIES,
+    REGISTRY,
+    SERIALIZER_SECONDS
+)
+from listings.models import Booking, Listing, OutboxMessage, Payment, PaymentEvent, Review
+from listings.ratings import recompute_ratings
+from listings.search import get_backend as get_search_backend
+from listings.webhooks import sign
+
+User = get_user_model()
+
+WORDS = (
+    'cozy bright spacious quiet modern rustic charming luxury family historic apartment villa '
+    'cottage cabin loft studio suite bungalow beach ocean lake river mountain forest garden '
+    'terrace balcony rooftop pool fireplace kitchen workspace parking breakfast market view'
+).split()
+LOCATIONS = ('Addis Ababa', 'Bahir Dar', 'Gondar', 'Lalibela', 'Hawassa', 'Nairobi', 'Kigali', 'Zanzibar')
+FIRST_DAY = date(2040, 1, 1)
+NEW_BOOKINGS_FROM = date(2060, 1, 1)
+
+
+def initiation_body(booking_id):
+    return {
+        'booking_id': booking_id, 'amount': '100.00', 'currency': 'ETB',
+        'email': 'bench@example.com', 'first_name': 'Bench', 'last_name': 'User',
+        'phone_number': '0911000000',
+    }
+
+
+def signed_webhook(data, i):
+    body = json.dumps({'event': 'charge.success', 'tx_ref': f"{data['references'][i % len(data['references'])]}-{i}"})
+    return body, {'HTTP_X_CHAPA_SIGNATURE': sign(body.encode())}
+
+
+def metrics_headers():
+    return {'HTTP_AUTHORIZATION': f'Bearer {settings.METRICS_TOKEN}'} if settings.METRICS_TOKEN else {}
+
+
+# URL name -> (who calls it, method, expected status,
+#              request(data, i) -> (path, body, extra headers))
+# Every route in listings/urls.py needs an entry
+ROUTES = {
+    'listing-list': ('guest', 'get', 200, lambda data, i: (
+        f'/listings/?page_size={10 + i % 20}', None, {})),
+    'listing-search': ('guest', 'get', 200, lambda data, i: (
+        f'/listings/search/?q={WORDS[i % len(WORDS)]}', None, {})),
+    'listing-availability': ('guest', 'get', 200, lambda data, i: (
+        f'/listings/available/?start_date={FIRST_DAY + timedelta(days=i % 60)}'
+        f'&end_date={FIRST_DAY + timedelta(days=i % 60 + 3)}&guests=2', None, {})),
+    'listing-cache-stats': ('admin', 'get', 200, lambda data, i: (
+        '/listings/cache/stats/', None, {})),
+    'listing-detail': ('guest', 'get', 200, lambda data, i: (
+        f"/listings/{data['listings'][i % len(data['listings'])]}/", None, {})),
+    'listing-reviews': ('guest', 'get', 200, lambda data, i: (
+        f"/listings/{data['listings'][i % len(data['listings'])]}/reviews/", None, {})),
+    'create-booking': ('guest', 'post', 201, lambda data, i: (
+        '/bookings/', {
+            'listing': data['listings'][i % len(data['listings'])],
+            'start_date': str(NEW_BOOKINGS_FROM + timedelta(days=3 * (i // len(data['listings'])))),
+            'end_date': str(NEW_BOOKINGS_FROM + timedelta(days=3 * (i // len(data['listings'])) + 2)),
+            'guests': 1,
+        }, {})),
+    'initiate-payment': ('guest', 'post', 201, lambda data, i: (
+        '/payments/initiate/', initiation_body(data['unpaid'][0][i]), {})),
+    'verify-payment': ('guest', 'post', 200, lambda data, i: (
+        '/payments/verify/', {'payment_reference': data['pending'][0][i]}, {})),
+    'outbox-stats': ('admin', 'get', 200, lambda data, i: (
+        '/payments/outbox/stats/', None, {})),
+    'chapa-webhook': (None, 'post', 200, lambda data, i: (
+        '/payments/webhook/', *signed_webhook(data, i))),
+    'initiate-payment-async': ('guest', 'post', 201, lambda data, i: (
+        '/payments/async/initiate/', initiation_body(data['unpaid'][1][i]), {})),
+    'verify-payment-async': ('guest', 'post', 200, lambda data, i: (
+        '/payments/async/verify/', {'payment_reference': data['pending'][1][i]}, {})),
+    'payment-status': ('guest', 'get', 200, lambda data, i: (
+        f"/payments/{data['references'][i % len(data['references'])]}/", None, {})),
+    'user-payments': ('guest', 'get', 200, lambda data, i: (
+        f'/payments/user/?page_size={10 + i % 20}', None, {})),
+    'metrics': (None, 'get', 200, lambda data, i: (
+        '/metrics', None, metrics_headers())),
+}
+
+
+def listing_route_names():
+    from listings import urls
+
+    return [pattern.name for pattern in urls.urlpatterns]
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a dataset, start a local fake Chapa and drive every listings route with '
+        'concurrent clients; reports latency, throughput and queries per request as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=5000)
+        parser.add_argument('--bookings-per-listing', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per route')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--latency', type=float, default=0.005, help='Fake Chapa latency in seconds')
+        parser.add_argument('--route', action='append', dest='routes', help='Only this URL name (repeatable)')
+        parser.add_argument('--output', default='-', help="JSON report file, '-' for stdout")
+        parser.add_argument('--compare', help='Earlier JSON report to diff against')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.3,
+            help='Allowed relative p95 increase before --compare reports a regression',
+        )
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        missing = sorted(set(listing_route_names()) - set(ROUTES))
+        if missing:
+            raise CommandError(f'No load-test scenario for: {", ".join(missing)}')
+        routes = options['routes'] or list(ROUTES)
+        unknown = sorted(set(routes) - set(ROUTES))
+        if unknown:
+            raise CommandError(f'Unknown route: {", ".join(unknown)}')
+
+        # Tables go to stderr when stdout carries the JSON
+        log = self.stderr if options['output'] == '-' else self.stdout
+        outbox_mark = OutboxMessage.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        event_mark = PaymentEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        users = {}
+        results = {}
+        try:
+            data = self.seed(random.Random(options['seed']), options, users, log)
+            with ChapaStubServer(latency=options['latency']) as stub, override_settings(
+                CHAPA_BASE_URL=stub.base_url, ALLOWED_HOSTS=['testserver'],
+            ):
+                reset_client()
+                cookies = self.sessions(users)
+                for name in routes:
+                    results[name] = self.run_route(name, data, cookies, options)
+                    log.write(self.format_row(name, results[name]))
+                reset_client()
+        finally:
+            for user in users.values():
+                user.delete()
+            OutboxMessage.objects.filter(id__gt=outbox_mark).delete()
+            PaymentEvent.objects.filter(id__gt=event_mark).delete()
+            listing_cache.invalidate(LISTING_LIST_GROUP)
+
+        report = {
+            'meta': self.meta(options),
+            'routes': results,
+        }
+        if options['output'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+        if options['compare']:
+            self.compare(report, options['compare'], options['tolerance'], log)
+
+    def seed(self, rng, options, users, log):
+        """
+        Create the dataset; fills `users` as it goes so the caller can clean up
+        """
+        started = time.perf_counter()
+        requests = options['requests']
+        host = users['host'] = User.objects.create_user(username='bench-api-host')
+        guest = users['guest'] = User.objects.create_user(username='bench-api-guest', email='bench@example.com')
+        users['admin'] = User.objects.create_user(username='bench-api-admin', is_staff=True)
+
+        with transaction.atomic():
+            listings = Listing.objects.bulk_create([
+                Listing(
+                    title=' '.join(rng.sample(WORDS, 3)).title(),
+                    description=' '.join(rng.choices(WORDS, k=40)),
+                    location=rng.choice(LOCATIONS),
+                    price_per_night='100.00',
+                    max_guests=rng.choice((None, 2, 4, 6)),
+                    owner=host,
+                )
+                for _ in range(options['listings'])
+            ], batch_size=5000)
+            # Existing bookings, for the availability search to work around:
+            # one per slot of the first 90 days, so they never overlap
+            taken = []
+            slot = max(2, 90 // max(1, options['bookings_per_listing']))
+            for listing in listings:
+                for n in range(options['bookings_per_listing']):
+                    start = FIRST_DAY + timedelta(days=n * slot + rng.randrange(slot - 1))
+                    taken.append(Booking(
+                        listing=listing, user=host, guests=1,
+                        start_date=start, end_date=start + timedelta(days=rng.randint(1, min(5, slot - 1))),
+                    ))
+            Booking.objects.bulk_create(taken, batch_size=5000)
+            Review.objects.bulk_create([
+                Review(
+                    listing=listing, user=guest, rating=rng.randint(1, 5),
+                    comment=' '.join(rng.choices(WORDS, k=20)),
+                )
+                for listing in listings
+            ], batch_size=5000)
+
+            # Bookings for the payment routes: two unpaid pools for the sync
+            # and async initiate views, then payments to verify and to read
+            def guest_bookings(count, offset):
+                return Booking.objects.bulk_create([
+                    Booking(
+                        listing=listings[0], user=guest, guests=1,
+                        start_date=date(2050, 1, 1) + timedelta(days=offset + i),
+                        end_date=date(2050, 1, 1) + timedelta(days=offset + i + 1),
+                    )
+                    for i in range(count)
+                ], batch_size=5000)
+
+            unpaid = [
+                [booking.pk for booking in guest_bookings(requests, 0)],
+                [booking.pk for booking in guest_bookings(requests, requests)],
+            ]
+            paid = Payment.objects.bulk_create([
+                Payment(booking=booking, amount='100.00', chapa_transaction_id=f'bench-{booking.pk}')
+                for booking in guest_bookings(3 * requests, 2 * requests)
+            ], batch_size=5000)
+            references = [str(payment.payment_reference) for payment in paid]
+
+        # bulk_create skips the signals that keep these up to date
+        rebuild_occupancy([listing.pk for listing in listings])
+        recompute_ratings([listing.pk for listing in listings])
+        listing_cache.invalidate(LISTING_LIST_GROUP)
+        with transaction.atomic():
+            get_search_backend().rebuild()
+        log.write(
+            f'Seeded {len(listings)} listings, {len(taken)} bookings and {len(paid)} payments '
+            f'in {time.perf_counter() - started:.2f}s'
+        )
+        data = {
+            'listings': [listing.pk for listing in listings],
+            'unpaid': unpaid,
+            'pending': [references[:requests], references[requests:2 * requests]],
+            'references': references[2 * requests:],
+        }
+        return data
+
+    def sessions(self, users):
+        # One session per user shared by every simulated client, so logins
+        # don't compete with the measured requests for the database
+        cookies = {None: None}
+        for role in ('guest', 'admin'):
+            client = Client()
+            client.force_login(users[role])
+            cookies[role] = client.cookies
+        return cookies
+
+    def run_route(self, name, data, cookies, options):
+        role, method, expected, make_request = ROUTES[name]
+        work = iter(range(options['requests']))
+        lock = threading.Lock()
+        samples, errors = [], {}
+
+        def client_loop(index):
+            client = Client()
+            if cookies[role] is not None:
+                client.cookies = cookies[role].copy()
+            while True:
+                with lock:
+                    i = next(work, None)
+                if i is None:
+                    return
+                path, body, headers = make_request(data, i)
+                started = time.perf_counter()
+                if method == 'get':
+                    response = client.get(path, **headers)
+                elif isinstance(body, str):
+                    response = client.post(path, body, content_type='application/json', **headers)
+                else:
+                    response = client.post(path, json.dumps(body), content_type='application/json', **headers)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                with lock:
+                    samples.append(elapsed_ms)
+                    if response.status_code != expected:
+                        errors[response.status_code] = errors.get(response.status_code, 0) + 1
+
+        REGISTRY.reset()
+        elapsed = run_concurrently(options['concurrency'], client_loop)
+        row = REGISTRY.totals().rows.get((name, method.upper()))
+        stats = summarize(samples)
+        result = {
+            'requests': len(samples),
+            'errors': sum(errors.values()),
+            'error_statuses': {str(code): count for code, count in sorted(errors.items())},
+            'throughput': round(len(samples) / elapsed, 1),
+            'mean_ms': stats['mean_ms'],
+            'p50_ms': stats['p50_ms'],
+            'p95_ms': stats['p95_ms'],
+            'p99_ms': stats['p99_ms'],
+            'max_ms': stats['max_ms'],
+        }
+        if row and row[COUNT]:
+            result.update({
+                'queries_per_request': round(row[QUERIES] / row[COUNT], 2),
+                'db_ms_per_request': round(row[DB_SECONDS] * 1000 / row[COUNT], 3),
+                'serializer_ms_per_request': round(row[SERIALIZER_SECONDS] * 1000 / row[COUNT], 3),
+                'chapa_ms_per_request': round(row[CHAPA_SECONDS] * 1000 / row[COUNT], 3),
+            })
+        return result
+
+    def format_row(self, name, result):
+        line = (
+            f"{name:>24}: {result['throughput']:7.1f} req/s  p50 {result['p50_ms']:7.2f}ms  "
+            f"p95 {result['p95_ms']:7.2f}ms  p99 {result['p99_ms']:7.2f}ms  "
+            f"{result.get('queries_per_request', 0):5.1f} queries/req"
+        )
+        if result['errors']:
+            line += self.style.ERROR(f"  {result['errors']} unexpected statuses {result['error_statuses']}")
+        return line
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'options': {
+                key: options[key] for key in (
+                    'listings', 'bookings_per_listing', 'requests', 'concurrency', 'latency', 'seed'
+                )
+            },
+        }
+
+    def compare(self, report, path, tolerance, log):
+        """
+        Print per-route changes against an earlier report; fails on
+        regressions so the command can gate a deploy
+        """
+        with open(path) as f:
+            baseline = json.load(f)
+        regressions = []
+        log.write(f"Compared with {baseline['meta'].get('commit') or path}:")
+        for name, result in report['routes'].items():
+            before = baseline['routes'].get(name)
+            if before is None:
+                continue
+            p95_change = result['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+            queries_before = before.get('queries_per_request', 0)
+            queries_now = result.get('queries_per_request', 0)
+            log.write(
+                f"{name:>24}: p95 {before['p95_ms']:.2f} -> {result['p95_ms']:.2f}ms ({p95_change:+.0%})  "
+                f"queries/req {queries_before} -> {queries_now}"
+            )
+            if p95_change > tolerance:
+                regressions.append(f'{name} p95 {p95_change:+.0%}')
+            if queries_now > queries_before:
+                regressions.append(f'{name} queries/req {queries_before} -> {queries_now}')
+            if result['errors'] > before['errors']:
+                regressions.append(f"{name} errors {before['errors']} -> {result['errors']}")
+        if regressions:
+            raise CommandError('Regressions: ' + '; '.join(regressions))
+        log.write(self.style.SUCCESS('No regressions'))
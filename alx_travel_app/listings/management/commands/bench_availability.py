@@ -0,0 +1,114 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from listings.availability import available_listings, naive_available_listings, rebuild_occupancy
+from listings.benchmarks import scratch_database, summarize, time_calls
+from listings.models import Booking, Listing
+
+User = get_user_model()
+
+EPOCH = date(2025, 1, 1)
+
+
+class Command(BaseCommand):
+    help = 'Compare the occupancy index with the naive ORM overlap query'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=10000)
+        parser.add_argument('--bookings', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--skip-seed', action='store_true',
+            help='Benchmark against the bookings already in the database',
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        if options['skip_seed']:
+            self.benchmark(rng, options['queries'])
+            return
+        # Seeded data goes to a scratch database, never the configured one
+        with scratch_database():
+            self.seed(rng, options['listings'], options['bookings'])
+            self.benchmark(rng, options['queries'])
+
+    def benchmark(self, rng, query_count):
+        started = time.perf_counter()
+        built = rebuild_occupancy()
+        self.stdout.write(f'Index built for {built} listings in {time.perf_counter() - started:.2f}s')
+
+        span = max((Booking.objects.order_by('-end_date').values_list('end_date', flat=True).first()
+                    or EPOCH) - EPOCH, timedelta(days=30)).days
+        queries = []
+        for _ in range(query_count):
+            start = EPOCH + timedelta(days=rng.randrange(span))
+            queries.append((start, start + timedelta(days=rng.randint(1, 14)), rng.randint(1, 6)))
+
+        listings = Listing.objects.all()
+
+        def indexed(start, end, guests):
+            return set(available_listings(listings, start, end, guests))
+
+        def naive(start, end, guests):
+            return set(naive_available_listings(listings, start, end, guests))
+
+        for query in queries[:5]:
+            if indexed(*query) != naive(*query):
+                self.stderr.write(self.style.ERROR(f'Result mismatch for {query}'))
+
+        for name, func in (('naive_orm', naive), ('occupancy_index', indexed)):
+            stats = summarize(time_calls(func, queries))
+            self.stdout.write(
+                f"{name:>16}: mean {stats['mean_ms']}ms  p50 {stats['p50_ms']}ms  "
+                f"p95 {stats['p95_ms']}ms  p99 {stats['p99_ms']}ms"
+            )
+
+    def seed(self, rng, listing_count, booking_count):
+        started = time.perf_counter()
+        owner, _ = User.objects.get_or_create(username='bench-owner')
+        with transaction.atomic():
+            created = Listing.objects.bulk_create(
+                [
+                    Listing(
+                        title=f'Bench listing {i}',
+                        description='Benchmark listing',
+                        location='Bench City',
+                        price_per_night='100.00',
+                        max_guests=rng.choice([None, 2, 4, 6, 8]),
+                        owner=owner,
+                    )
+                    for i in range(listing_count)
+                ],
+                batch_size=1000,
+            )
+        listing_ids = [listing.pk for listing in created]
+
+        per_listing, remainder = divmod(booking_count, len(listing_ids))
+        batch = []
+        for index, listing_id in enumerate(listing_ids):
+            day = EPOCH + timedelta(days=rng.randrange(14))
+            for _ in range(per_listing + (1 if index < remainder else 0)):
+                start = day + timedelta(days=rng.randrange(5))
+                day = start + timedelta(days=rng.randint(1, 7))
+                batch.append(Booking(
+                    listing_id=listing_id, user=owner, start_date=start, end_date=day, guests=1
+                ))
+            if len(batch) >= 50000:
+                self.flush(batch)
+                batch = []
+        if batch:
+            self.flush(batch)
+        self.stdout.write(
+            f'Seeded {listing_count} listings and {booking_count} bookings '
+            f'in {time.perf_counter() - started:.2f}s'
+        )
+
+    def flush(self, batch):
+        with transaction.atomic():
+            Booking.objects.bulk_create(batch, batch_size=5000)
@@ -0,0 +1,45 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from listings.benchmarks import booking_stress
+from listings.models import Booking, Listing
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Stress overlap-safe booking creation with concurrent writers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, nargs='+', default=[1, 8, 32])
+        parser.add_argument('--attempts', type=int, default=50, help='Booking attempts per writer')
+        parser.add_argument('--listings', type=int, default=4)
+
+    def handle(self, *args, **options):
+        owner, _ = User.objects.get_or_create(username='bench-owner')
+        users = [
+            User.objects.get_or_create(username=f'bench-writer-{i}')[0]
+            for i in range(max(options['writers']))
+        ]
+        listings = Listing.objects.bulk_create([
+            Listing(
+                title=f'Contended listing {i}',
+                description='Benchmark listing',
+                location='Bench City',
+                price_per_night='100.00',
+                owner=owner,
+            )
+            for i in range(options['listings'])
+        ])
+
+        for writers in options['writers']:
+            Booking.objects.filter(listing__in=listings).delete()
+            result = booking_stress(listings, users, writers, options['attempts'])
+            style = self.style.SUCCESS if result['overlaps'] == 0 else self.style.ERROR
+            self.stdout.write(style(
+                f"{writers:>3} writers: {result['attempts_per_sec']:>8} attempts/s, "
+                f"{result['created']} created, {result['conflicts']} conflicts, "
+                f"{result['overlaps']} double bookings"
+            ))
+
+        Listing.objects.filter(pk__in=[listing.pk for listing in listings]).delete()
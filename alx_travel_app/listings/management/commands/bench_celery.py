@@ -0,0 +1,118 @@
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.benchmarks import summarize, use_memory_broker
+
+# name, payment and email tasks on separate queues, prefetch multiplier,
+# acks_late, ignore_result
+CONFIGURATIONS = (
+    ('one queue, defaults', False, 4, False, False),
+    ('one queue, ignore_result', False, 4, False, True),
+    ('split queues', True, 4, False, True),
+    ('split queues, acks_late, prefetch 1', True, 1, True, True),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Push a mix of short payment tasks and slow email tasks through an in-memory broker '
+        'and report throughput and queue latency for several Celery configurations'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=2000)
+        parser.add_argument('--email-share', type=float, default=0.5, help='Share of tasks that are emails')
+        parser.add_argument('--payment-ms', type=float, default=1.0, help='Time a payment task takes')
+        parser.add_argument('--email-ms', type=float, default=20.0, help='Time an email task takes')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--timeout', type=float, default=300.0)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        app = use_memory_broker()
+        # Bench tasks must not inherit the real routes and rate limits
+        app.conf.task_routes = {}
+        app.conf.task_annotations = {}
+        # The in-memory transport polls once a second by default, which would
+        # dwarf every latency measured here
+        app.conf.broker_transport_options = {'polling_interval': 0.001}
+        rng = random.Random(options['seed'])
+        kinds = ['email' if rng.random() < options['email_share'] else 'payment' for _ in range(options['tasks'])]
+
+        lock = threading.Lock()
+        waits = {'payment': [], 'email': []}
+        finished = []
+
+        def record(kind, sent_at, work_ms):
+            with lock:
+                waits[kind].append((time.time() - sent_at) * 1000)
+            time.sleep(work_ms / 1000)
+            with lock:
+                finished.append(time.time())
+            return kind
+
+        @app.task(name='bench.payment', shared=False)
+        def payment(sent_at):
+            return record('payment', sent_at, options['payment_ms'])
+
+        @app.task(name='bench.email', shared=False)
+        def email(sent_at):
+            return record('email', sent_at, options['email_ms'])
+
+        tasks = {'payment': payment, 'email': email}
+
+        for name, split, prefetch, acks_late, ignore_result in CONFIGURATIONS:
+            for task in tasks.values():
+                task.acks_late = acks_late
+                task.ignore_result = ignore_result
+            app.conf.worker_prefetch_multiplier = prefetch
+            for kind_waits in waits.values():
+                kind_waits.clear()
+            finished.clear()
+
+            queues = {kind: (kind if split else 'celery') for kind in tasks}
+            seconds = self.run(app, tasks, kinds, queues, split, options, finished)
+            payment_wait = summarize(waits['payment'])
+            email_wait = summarize(waits['email'])
+            self.stdout.write(
+                f"{name:>36}: {len(kinds) / seconds:6.0f} tasks/s  "
+                f"payment wait p50 {payment_wait['p50_ms']:.1f}ms p99 {payment_wait['p99_ms']:.1f}ms  "
+                f"email wait p50 {email_wait['p50_ms']:.1f}ms p99 {email_wait['p99_ms']:.1f}ms"
+            )
+
+    def run(self, app, tasks, kinds, queues, split, options, finished):
+        """
+        Start the workers, publish every task and wait for them; returns seconds
+        """
+        from celery.contrib.testing.worker import start_worker
+
+        # Workers are single-threaded, like a prefork child: the in-memory
+        # transport loses acks made from a thread pool
+        workers = options['workers']
+        if split:
+            payment_workers = max(1, workers // 2)
+            queue_lists = [[queues['payment']]] * payment_workers
+            queue_lists += [[queues['email']]] * max(1, workers - payment_workers)
+        else:
+            queue_lists = [[queues['payment']]] * workers
+
+        with ExitStack() as stack:
+            for worker_queues in queue_lists:
+                stack.enter_context(start_worker(
+                    app, pool='solo', queues=worker_queues,
+                    perform_ping_check=False, shutdown_timeout=options['timeout'],
+                ))
+            started = time.time()
+            with app.producer_or_acquire() as producer:
+                for kind in kinds:
+                    tasks[kind].apply_async(args=[time.time()], queue=queues[kind], producer=producer)
+            deadline = started + options['timeout']
+            while len(finished) < len(kinds):
+                if time.time() > deadline:
+                    raise CommandError(f'Only {len(finished)} of {len(kinds)} tasks ran within {options["timeout"]}s')
+                time.sleep(0.01)
+            return max(finished) - started
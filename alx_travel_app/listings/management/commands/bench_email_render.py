@@ -0,0 +1,72 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.template import engines
+
+from listings.benchmarks import summarize, time_calls
+from listings.models import Booking, Listing, Payment
+from listings.notifications import TEMPLATES, compiled, render_message
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Measure the CPU cost of rendering payment emails, with and without compiled templates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=10000)
+        parser.add_argument('--uncached', type=int, default=500, help='Messages rendered with a cold template cache')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        payments = self.payments(random.Random(options['seed']), options['messages'])
+        calls = [(kind, payment) for payment in payments for kind in TEMPLATES][:options['messages']]
+
+        def cold(kind, payment):
+            compiled.cache_clear()
+            for loader in engines['django'].engine.template_loaders:
+                if hasattr(loader, 'reset'):
+                    loader.reset()
+            render_message(kind, payment)
+
+        def serialized(kind, payment):
+            render_message(kind, payment).message().as_bytes()
+
+        cold_stats = summarize(time_calls(cold, calls[:options['uncached']]))
+        render_message(*calls[0])
+        runs = (
+            ('compiled each time', cold_stats),
+            ('compiled once', summarize(time_calls(render_message, calls))),
+            ('+ MIME encoding', summarize(time_calls(serialized, calls))),
+        )
+        for name, stats in runs:
+            per_hour = 3600 * 1000 / stats['mean_ms'] if stats['mean_ms'] else 0
+            self.stdout.write(
+                f"{name:>18}: mean {stats['mean_ms'] * 1000:.0f}us  p50 {stats['p50_ms'] * 1000:.0f}us  "
+                f"p99 {stats['p99_ms'] * 1000:.0f}us  ({per_hour:,.0f} messages/hour per core)"
+            )
+
+    def payments(self, rng, count):
+        # Unsaved objects: this measures rendering only, not the query
+        # that loads a batch
+        payments = []
+        for i in range(count):
+            user = User(username=f'guest{i}', email=f'guest{i}@example.com')
+            listing = Listing(
+                title=f'Listing {rng.randint(1, 10 ** 6)} & <Garden> view', location='Addis Ababa',
+                price_per_night=Decimal('100.00'),
+            )
+            start = date(2030, 1, 1) + timedelta(days=rng.randint(0, 365))
+            booking = Booking(
+                listing=listing, user=user, guests=rng.randint(1, 6),
+                start_date=start, end_date=start + timedelta(days=rng.randint(1, 14)),
+            )
+            payments.append(Payment(
+                booking=booking, amount=Decimal(rng.randint(50, 5000)), payment_reference=f'ALX-{i:08d}',
+                chapa_transaction_id=f'TX{i}', failure_reason='Card declined' if i % 2 else '',
+            ))
+        return payments
@@ -0,0 +1,59 @@
+import io
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from listings.benchmarks import scratch_database, summarize
+from listings.cache import LISTING_LIST_GROUP, listing_cache
+
+# name, ?fields= value (None for the full listing)
+FIELD_SETS = (
+    ('all fields', None),
+    ('card fields', 'id,title,location,price_per_night'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare response size and latency of listing pages and streams with and '
+        'without ?fields=, on a seeded scratch database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--listings', type=int, default=20000)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with scratch_database(), override_settings(ALLOWED_HOSTS=['testserver']):
+            self.stdout.write('Seeding...')
+            call_command(
+                'seed', users=options['users'], listings=options['listings'], seed=options['seed'],
+                stdout=io.StringIO(),
+            )
+            client = Client()
+            for name, fields in FIELD_SETS:
+                query = f'&fields={fields}' if fields else ''
+                page = self.measure(client, f"/listings/?page_size={options['page_size']}{query}", options['repeat'])
+                stream = self.measure(client, f'/listings/?stream=1{query}', max(1, options['repeat'] // 10))
+                self.stdout.write(
+                    f"{name:>12}: page {page['bytes'] / 1024:7.1f}KB p50 {page['p50_ms']:.2f}ms "
+                    f"p95 {page['p95_ms']:.2f}ms  stream {stream['bytes'] / 1024:8.1f}KB "
+                    f"p50 {stream['p50_ms']:.0f}ms"
+                )
+
+    def measure(self, client, path, repeat):
+        samples = []
+        for _ in range(repeat):
+            # Every request misses the cache, so the database and serializer run
+            listing_cache.invalidate(LISTING_LIST_GROUP)
+            listing_cache.local.clear()
+            started = time.perf_counter()
+            response = client.get(path)
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            samples.append((time.perf_counter() - started) * 1000)
+        return dict(summarize(samples), bytes=len(body))
@@ -0,0 +1,144 @@
+import asyncio
+import itertools
+import threading
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+
+from listings.benchmarks import run_concurrently, summarize
+from listings.chapa import reset_client
+from listings.chapa_stub import ChapaStubServer
+from listings.models import Booking, Listing
+
+User = get_user_model()
+
+
+def initiation_body(booking_id):
+    return {
+        'booking_id': booking_id, 'amount': '100.00', 'currency': 'ETB',
+        'email': 'bench@example.com', 'first_name': 'Bench', 'last_name': 'User',
+        'phone_number': '0911000000',
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test payment initiation against a local fake Chapa: sync view on a '
+        'bounded WSGI thread pool vs async view on one ASGI event loop'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400, help='Requests per run')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[16, 64, 256])
+        parser.add_argument('--wsgi-threads', type=int, default=16, help='Worker threads of the WSGI process')
+        parser.add_argument('--latency', type=float, default=0.1, help='Fake Chapa latency in seconds')
+        parser.add_argument('--p99-target', type=float, default=500, help='Latency budget in ms')
+
+    def handle(self, *args, **options):
+        runs = len(options['concurrency']) * 2
+        self.user, bookings = self.setup_data(options['requests'] * runs)
+        booking_ids = iter(bookings)
+        # One session shared by every simulated client, so logins don't
+        # compete with the measured requests for the database
+        login = Client()
+        login.force_login(self.user)
+        self.cookies = login.cookies
+        best = {}
+        try:
+            with ChapaStubServer(latency=options['latency']) as stub, \
+                    override_settings(CHAPA_BASE_URL=stub.base_url, ALLOWED_HOSTS=['testserver']):
+                reset_client()
+                for mode in ('wsgi', 'asgi'):
+                    for concurrency in options['concurrency']:
+                        ids = list(itertools.islice(booking_ids, options['requests']))
+                        if mode == 'wsgi':
+                            result = self.run_wsgi(ids, concurrency, options['wsgi_threads'])
+                        else:
+                            result = asyncio.run(self.run_asgi(ids, concurrency))
+                        self.report(mode, concurrency, result)
+                        if result['p99_ms'] <= options['p99_target'] and result['errors'] == 0:
+                            best[mode] = max(best.get(mode, 0), result['throughput'])
+                reset_client()
+        finally:
+            self.user.delete()
+
+        for mode in ('wsgi', 'asgi'):
+            self.stdout.write(self.style.SUCCESS(
+                f"{mode}: best throughput with p99 <= {options['p99_target']}ms: "
+                f"{best.get(mode, 0):.1f} req/s"
+            ))
+
+    def setup_data(self, count):
+        user, _ = User.objects.get_or_create(username='bench-payer')
+        listing = Listing.objects.create(
+            title='Bench listing', description='Benchmark listing', location='Bench City',
+            price_per_night='100.00', owner=user,
+        )
+        start = date(2040, 1, 1)
+        bookings = Booking.objects.bulk_create([
+            Booking(
+                listing=listing, user=user, guests=1,
+                start_date=start + timedelta(days=i), end_date=start + timedelta(days=i + 1),
+            )
+            for i in range(count)
+        ], batch_size=1000)
+        return user, [booking.pk for booking in bookings]
+
+    def run_wsgi(self, booking_ids, concurrency, threads):
+        # Clients beyond the worker thread count queue for a slot, as they
+        # would in front of a WSGI server
+        slots = threading.BoundedSemaphore(threads)
+        work = iter(booking_ids)
+        lock = threading.Lock()
+        samples, errors = [], []
+
+        def client_loop(index):
+            client = Client()
+            client.cookies = self.cookies.copy()
+            while True:
+                with lock:
+                    booking_id = next(work, None)
+                if booking_id is None:
+                    return
+                started = time.perf_counter()
+                with slots:
+                    response = client.post(
+                        '/payments/initiate/', initiation_body(booking_id), content_type='application/json'
+                    )
+                with lock:
+                    samples.append((time.perf_counter() - started) * 1000)
+                    if response.status_code != 201:
+                        errors.append(response.status_code)
+
+        elapsed = run_concurrently(concurrency, client_loop)
+        return dict(summarize(samples), errors=len(errors), throughput=len(samples) / elapsed)
+
+    async def run_asgi(self, booking_ids, concurrency):
+        work = iter(booking_ids)
+        samples, errors = [], []
+
+        async def client_loop():
+            client = AsyncClient()
+            client.cookies = self.cookies.copy()
+            for booking_id in work:
+                started = time.perf_counter()
+                response = await client.post(
+                    '/payments/async/initiate/', initiation_body(booking_id), content_type='application/json'
+                )
+                samples.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 201:
+                    errors.append(response.status_code)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        return dict(summarize(samples), errors=len(errors), throughput=len(samples) / elapsed)
+
+    def report(self, mode, concurrency, result):
+        self.stdout.write(
+            f"{mode} c={concurrency:<4} {result['throughput']:>8.1f} req/s  "
+            f"p50 {result['p50_ms']}ms  p99 {result['p99_ms']}ms  errors {result['errors']}"
+        )
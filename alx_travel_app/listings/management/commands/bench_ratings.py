@@ -0,0 +1,65 @@
+import io
+import random
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count
+
+from listings.benchmarks import scratch_database, summarize, time_calls
+from listings.models import Listing
+from listings.ratings import adjust_rating
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare listing pages that aggregate reviews on the fly with pages that read '
+        'the denormalized rating_avg/rating_count, on a seeded scratch database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20000)
+        parser.add_argument('--listings', type=int, default=20000)
+        parser.add_argument('--reviews', type=int, default=150000)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            self.stdout.write('Seeding...')
+            call_command(
+                'seed', users=options['users'], listings=options['listings'],
+                bookings=options['reviews'], reviews=options['reviews'], seed=options['seed'],
+                stdout=io.StringIO(),
+            )
+            self.measure(options)
+
+    def measure(self, options):
+        size = options['page_size']
+        aggregated = Listing.objects.annotate(avg=Avg('reviews__rating'), count=Count('reviews'))
+        pages = (
+            ('newest page',
+             lambda: list(aggregated.order_by('-created_at', '-id')[:size]),
+             lambda: list(Listing.objects.order_by('-created_at', '-id')[:size])),
+            ('best rated page',
+             lambda: list(aggregated.order_by('-avg', '-id')[:size]),
+             lambda: list(Listing.objects.order_by('-rating_avg', '-id')[:size])),
+        )
+        for name, on_the_fly, denormalized in pages:
+            slow = summarize(time_calls(on_the_fly, [()] * options['repeat']))
+            fast = summarize(time_calls(denormalized, [()] * options['repeat']))
+            self.stdout.write(
+                f"{name:>16}: aggregate p50 {slow['p50_ms']:.2f}ms p95 {slow['p95_ms']:.2f}ms  "
+                f"denormalized p50 {fast['p50_ms']:.2f}ms p95 {fast['p95_ms']:.2f}ms  "
+                f"({slow['p50_ms'] / max(fast['p50_ms'], 0.001):.0f}x)"
+            )
+
+        # What each review write pays for it
+        rng = random.Random(options['seed'])
+        listing_ids = list(Listing.objects.values_list('pk', flat=True))
+        update = summarize(time_calls(
+            adjust_rating, [(rng.choice(listing_ids), 0, 0) for _ in range(options['repeat'] * 10)]
+        ))
+        self.stdout.write(
+            f"{'rating update':>16}: p50 {update['p50_ms']:.2f}ms p95 {update['p95_ms']:.2f}ms per review write"
+        )
@@ -0,0 +1,91 @@
+import resource
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from django.utils import timezone
+
+from listings.benchmarks import use_memory_broker
+from listings.chapa import reset_client
+from listings.chapa_stub import ChapaStubServer
+from listings.models import Booking, Listing, Payment
+from listings.tasks import reconcile_pending_payments
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Run pending-payment reconciliation over many rows against a local fake Chapa'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=100000)
+        parser.add_argument('--abandoned', type=float, default=0.1, help='Share past the expiry cutoff')
+        parser.add_argument('--latency', type=float, default=0.005, help='Fake Chapa latency in seconds')
+        parser.add_argument('--concurrency', type=int, default=settings.PAYMENT_VERIFY_CONCURRENCY)
+        parser.add_argument('--chunk-size', type=int, default=settings.PAYMENT_RECONCILE_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        use_memory_broker()
+        owner = self.seed(options['payments'], options['abandoned'])
+        try:
+            with ChapaStubServer(latency=options['latency']) as stub, override_settings(
+                CHAPA_BASE_URL=stub.base_url,
+                CHAPA_POOL_SIZE=max(settings.CHAPA_POOL_SIZE, options['concurrency']),
+                PAYMENT_VERIFY_CONCURRENCY=options['concurrency'],
+            ):
+                reset_client()
+                rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                report = reconcile_pending_payments(chunk_size=options['chunk_size'])
+                rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+                reset_client()
+                self.stdout.write(
+                    f"{report['checked']} verified ({report['updated']} updated, "
+                    f"{report['unreachable']} unreachable), {report['expired']} expired in "
+                    f"{report['seconds']}s: {report['per_second']} payments/s, "
+                    f"{stub.connections} connections to Chapa, peak RSS growth {rss_growth / 1024:.1f} MiB"
+                )
+            left = Payment.objects.filter(booking__user=owner, status='pending').count()
+            style = self.style.SUCCESS if left == 0 else self.style.ERROR
+            self.stdout.write(style(f'{left} payments still pending'))
+        finally:
+            owner.delete()
+
+    def seed(self, count, abandoned):
+        started = time.perf_counter()
+        owner, _ = User.objects.get_or_create(username='bench-payer')
+        listing = Listing.objects.create(
+            title='Bench listing', description='Benchmark listing', location='Bench City',
+            price_per_night='100.00', owner=owner,
+        )
+        first_day = date(2040, 1, 1)
+        for offset in range(0, count, 20000):
+            with transaction.atomic():
+                bookings = Booking.objects.bulk_create([
+                    Booking(
+                        listing=listing, user=owner, guests=1,
+                        start_date=first_day + timedelta(days=i),
+                        end_date=first_day + timedelta(days=i + 1),
+                    )
+                    for i in range(offset, min(count, offset + 20000))
+                ], batch_size=5000)
+                Payment.objects.bulk_create(
+                    [Payment(booking=booking, amount='100.00') for booking in bookings],
+                    batch_size=5000,
+                )
+
+        # created_at is auto_now_add, so age the rows afterwards
+        now = timezone.now()
+        payments = Payment.objects.filter(booking__user=owner)
+        expired_below = payments.order_by('id').values_list('id', flat=True)[int(count * abandoned)]
+        payments.filter(id__lt=expired_below).update(
+            created_at=now - timedelta(minutes=settings.PAYMENT_EXPIRE_AFTER_MINUTES + 60)
+        )
+        payments.filter(id__gte=expired_below).update(
+            created_at=now - timedelta(minutes=settings.PAYMENT_RECONCILE_AFTER_MINUTES + 5)
+        )
+        self.stdout.write(f'Seeded {count} pending payments in {time.perf_counter() - started:.2f}s')
+        return owner
@@ -0,0 +1,99 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from listings.benchmarks import scratch_database, summarize, time_calls
+from listings.models import Listing
+from listings.search import IcontainsBackend, get_backend
+
+User = get_user_model()
+
+WORDS = (
+    'cozy bright spacious quiet modern rustic charming luxury budget family romantic historic '
+    'apartment villa cottage cabin loft studio suite bungalow farmhouse chalet penthouse guesthouse '
+    'beach ocean lake river mountain forest garden terrace balcony rooftop courtyard pool sauna '
+    'fireplace kitchen workspace wifi parking breakfast coffee market museum cathedral harbour '
+    'sunset sunrise view walk hike bike trail centre downtown old town station airport stadium '
+    'vineyard desert savannah safari coast island canyon valley waterfall park plaza bazaar'
+).split()
+SYLLABLES = 'ba ka la ma na ra sa ta wa zo mi ne ro tu gi de fo hu ji ke'.split()
+LOCATIONS = (
+    'Addis Ababa', 'Bahir Dar', 'Gondar', 'Lalibela', 'Hawassa', 'Nairobi', 'Mombasa',
+    'Zanzibar', 'Kigali', 'Kampala', 'Accra', 'Lagos', 'Dakar', 'Marrakech', 'Cape Town',
+)
+
+
+class Command(BaseCommand):
+    help = 'Compare full-text index search latency with icontains scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=100)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--skip-seed', action='store_true',
+            help='Benchmark against the listings already in the database',
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Zipf-distributed vocabulary so term frequencies look like real text
+        vocabulary = WORDS + sorted({
+            ''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(5000)
+        } - set(WORDS))
+        weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+        if options['skip_seed']:
+            self.benchmark(rng, vocabulary, options['queries'], options['limit'])
+            return
+        # Seeded data goes to a scratch database, never the configured one
+        with scratch_database():
+            self.seed(rng, options['listings'], vocabulary, weights)
+            self.benchmark(rng, vocabulary, options['queries'], options['limit'])
+
+    def benchmark(self, rng, vocabulary, query_count, limit):
+        backend = get_backend()
+        started = time.perf_counter()
+        with transaction.atomic():
+            backend.rebuild()
+        self.stdout.write(f'{backend.name} index rebuilt in {time.perf_counter() - started:.2f}s')
+
+        queries = []
+        for _ in range(query_count):
+            # Mid- and low-frequency terms, the ones a scan cannot stop early on
+            terms = rng.sample(vocabulary[50:2000], rng.randint(1, 2))
+            # Half the queries are typed prefixes, as from a search box
+            if rng.random() < 0.5:
+                terms[-1] = terms[-1][:max(3, len(terms[-1]) // 2)]
+            queries.append((' '.join(terms), limit))
+
+        for name, search in (('icontains', IcontainsBackend().search), (backend.name, backend.search)):
+            stats = summarize(time_calls(search, queries))
+            self.stdout.write(
+                f"{name:>18}: mean {stats['mean_ms']}ms  p50 {stats['p50_ms']}ms  "
+                f"p95 {stats['p95_ms']}ms  p99 {stats['p99_ms']}ms"
+            )
+
+    def seed(self, rng, count, vocabulary, weights):
+        started = time.perf_counter()
+        owner, _ = User.objects.get_or_create(username='bench-owner')
+        batch = []
+        for i in range(count):
+            batch.append(Listing(
+                title=' '.join(rng.choices(vocabulary, weights, k=3)).title(),
+                description=' '.join(rng.choices(vocabulary, weights, k=rng.randint(40, 80))),
+                location=rng.choice(LOCATIONS),
+                price_per_night='100.00',
+                owner=owner,
+            ))
+            if len(batch) >= 10000:
+                with transaction.atomic():
+                    Listing.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            with transaction.atomic():
+                Listing.objects.bulk_create(batch)
+        self.stdout.write(f'Seeded {count} listings in {time.perf_counter() - started:.2f}s')
@@ -0,0 +1,62 @@
+import io
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from listings.benchmarks import scratch_database, summarize, time_calls
+from listings.fastpath import compile_serializer
+from listings.models import Listing, Payment
+from listings.serializers import ListingSerializer, PaymentSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare rows/sec of ModelSerializer output with the compiled fast path, '
+        'for listings and payments on a seeded scratch database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--listings', type=int, default=10000)
+        parser.add_argument('--bookings', type=int, default=20000)
+        parser.add_argument('--rows', type=int, default=500, help='Rows per call, as on one large page')
+        parser.add_argument('--repeat', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            self.stdout.write('Seeding...')
+            call_command(
+                'seed', users=options['users'], listings=options['listings'],
+                bookings=options['bookings'], payments=options['bookings'], seed=options['seed'],
+                stdout=io.StringIO(),
+            )
+            rows = options['rows']
+            for name, serializer_class, queryset in (
+                ('listings', ListingSerializer, Listing.objects.order_by('-created_at', '-id')[:rows]),
+                # By id: the benchmark is about rendering, not an unindexed sort
+                ('payments', PaymentSerializer, Payment.objects.order_by('-id')[:rows]),
+            ):
+                self.measure(name, serializer_class, queryset, options['repeat'])
+
+    def measure(self, name, serializer_class, queryset, repeat):
+        compiled = compile_serializer(serializer_class)
+        instances = list(queryset)
+        tuples = list(queryset.values_list(*compiled.columns))
+        if compiled.render(tuples) != serializer_class(instances, many=True).data:
+            self.stderr.write(self.style.ERROR(f'{name}: compiled output differs from {serializer_class.__name__}'))
+
+        paths = (
+            # Serialization alone, then with the query that feeds it
+            ('serializer', lambda: serializer_class(instances, many=True).data),
+            ('compiled', lambda: compiled.render(tuples)),
+            # all() so every call queries again instead of reusing the result cache
+            ('query + serializer', lambda: serializer_class(list(queryset.all()), many=True).data),
+            ('query + compiled', lambda: compiled.render(list(queryset.values_list(*compiled.columns)))),
+        )
+        for label, func in paths:
+            stats = summarize(time_calls(func, [()] * repeat))
+            self.stdout.write(
+                f"{name:>9} {label:>18}: {len(instances) / stats['p50_ms'] * 1000:10.0f} rows/s  "
+                f"p50 {stats['p50_ms']:.2f}ms p95 {stats['p95_ms']:.2f}ms"
+            )
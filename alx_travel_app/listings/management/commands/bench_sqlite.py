@@ -0,0 +1,166 @@
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connections
+from django.test import override_settings
+
+from listings.benchmarks import summarize
+from listings.bookings import BookingConflict, save_booking
+from listings.models import Booking, Listing
+from listings.serializers import BookingSerializer
+
+User = get_user_model()
+
+# name, SQLITE_PROFILE, CONN_MAX_AGE
+CONFIGURATIONS = (
+    ('before: rollback journal, reconnect per request', 'default', 0),
+    ('production profile, reconnect per request', 'production', 0),
+    ('production profile, persistent connections', 'production', 600),
+)
+
+
+def request(func):
+    """
+    Run func the way a request would: connections are checked (and, with
+    CONN_MAX_AGE=0, closed) on request_started and request_finished
+    """
+    close_old_connections()
+    try:
+        return func()
+    finally:
+        close_old_connections()
+
+
+def worker(index, options, listing_ids, user_ids, results):
+    rng = random.Random(options['seed'] * 1000 + index)
+    first_day = date(2030, 1, 1)
+    samples = []
+    for _ in range(options['requests']):
+        listing_id = rng.choice(listing_ids)
+        if rng.random() < options['write_share']:
+            kind = 'write'
+            start = first_day + timedelta(days=rng.randrange(3650))
+            serializer = BookingSerializer(data={
+                'listing': listing_id, 'start_date': start,
+                'end_date': start + timedelta(days=rng.randint(1, 5)), 'guests': 1,
+            })
+
+            def run():
+                if serializer.is_valid():
+                    try:
+                        save_booking(serializer, User(pk=rng.choice(user_ids)))
+                    except BookingConflict:
+                        pass
+        else:
+            kind = 'read'
+
+            def run():
+                Listing.objects.filter(pk=listing_id).first()
+                list(Booking.objects.filter(listing_id=listing_id, end_date__gt=first_day)[:20])
+
+        started = time.perf_counter()
+        try:
+            request(run)
+            error = False
+        except OperationalError:
+            error = True
+        samples.append((kind, (time.perf_counter() - started) * 1000, error))
+    results.put(samples)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run concurrent reads and booking writes from several processes against a scratch '
+        'SQLite file, under the old settings and each SQLite profile'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=500, help='Requests per process')
+        parser.add_argument('--write-share', type=float, default=0.2)
+        parser.add_argument('--listings', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        connection = connections['default']
+        if connection.vendor != 'sqlite':
+            raise CommandError('bench_sqlite needs an SQLite default database')
+        original = {key: connection.settings_dict[key] for key in ('NAME', 'CONN_MAX_AGE')}
+        directory = tempfile.mkdtemp()
+        try:
+            template = os.path.join(directory, 'template.sqlite3')
+            listing_ids, user_ids = self.build_template(connection, template, options)
+            results = []
+            for name, profile, max_age in CONFIGURATIONS:
+                path = os.path.join(directory, f'{profile}-{max_age}.sqlite3')
+                shutil.copy(template, path)
+                connection.settings_dict.update(NAME=path, CONN_MAX_AGE=max_age)
+                with override_settings(SQLITE_PROFILE=profile):
+                    results.append((name, self.run(options, listing_ids, user_ids)))
+        finally:
+            connections.close_all()
+            connection.settings_dict.update(original)
+            shutil.rmtree(directory)
+
+        baseline = results[0][1]['requests_per_sec']
+        for name, result in results:
+            self.stdout.write(
+                f"{name:>48}: {result['requests_per_sec']:7.0f} requests/s ({result['requests_per_sec'] / baseline:.1f}x)  "
+                f"read p50 {result['read']['p50_ms']:.1f}ms p99 {result['read']['p99_ms']:.1f}ms  "
+                f"write p50 {result['write']['p50_ms']:.1f}ms p99 {result['write']['p99_ms']:.1f}ms  "
+                f"{result['errors']} 'database is locked'"
+            )
+
+    def build_template(self, connection, path, options):
+        """
+        Migrate and fill a scratch database every configuration starts from
+        """
+        connections.close_all()
+        connection.settings_dict.update(NAME=path, CONN_MAX_AGE=0)
+        with override_settings(SQLITE_PROFILE='default'):
+            call_command('migrate', verbosity=0)
+            owner = User.objects.create_user(username='bench-sqlite-owner')
+            users = User.objects.bulk_create(
+                [User(username=f'bench-sqlite-{i}') for i in range(options['processes'])]
+            )
+            listings = Listing.objects.bulk_create([
+                Listing(
+                    title=f'Listing {i}', description='Benchmark listing', location='Bench City',
+                    price_per_night='100.00', owner=owner,
+                )
+                for i in range(options['listings'])
+            ])
+            connections.close_all()
+        return [listing.pk for listing in listings], [user.pk for user in users]
+
+    def run(self, options, listing_ids, user_ids):
+        # Children must open their own connections, never share the parent's
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [
+            context.Process(target=worker, args=(index, options, listing_ids, user_ids, results))
+            for index in range(options['processes'])
+        ]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        samples = [sample for _ in processes for sample in results.get()]
+        elapsed = time.perf_counter() - started
+        for process in processes:
+            process.join()
+        return {
+            'requests_per_sec': len(samples) / elapsed,
+            'read': summarize([ms for kind, ms, _ in samples if kind == 'read']),
+            'write': summarize([ms for kind, ms, _ in samples if kind == 'write']),
+            'errors': sum(error for _, _, error in samples),
+        }
@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from listings.outbox import prune, relay, stats
+
+
+class Command(BaseCommand):
+    help = 'Publish queued outbox messages to Celery until interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=settings.OUTBOX_POLL_INTERVAL,
+                            help='Seconds to sleep when there is nothing to publish')
+        parser.add_argument('--once', action='store_true', help='Drain the backlog once and exit')
+        parser.add_argument('--stats', action='store_true', help='Print backlog and latency figures and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for key, value in stats().items():
+                self.stdout.write(f'{key}: {value}')
+            return
+
+        batch_size = options['batch_size']
+        last_prune = 0.0
+        try:
+            while True:
+                close_old_connections()
+                published = relay(batch_size)
+                if published and options['verbosity'] > 1:
+                    self.stdout.write(f'Published {published} messages')
+                if time.monotonic() - last_prune > 3600:
+                    prune()
+                    last_prune = time.monotonic()
+                if published < batch_size:
+                    if options['once']:
+                        return
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from listings.availability import rebuild_occupancy
+
+
+class Command(BaseCommand):
+    help = 'Rebuild listing occupancy bitmaps from existing bookings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--listing', type=int, action='append', dest='listings',
+            help='Only rebuild this listing id (repeatable)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        built = rebuild_occupancy(options['listings'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt occupancy for {built} listings in {elapsed:.2f}s.'
+        ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from listings.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text listing search index'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        started = time.perf_counter()
+        with transaction.atomic():
+            indexed = backend.rebuild()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {backend.name} index for {indexed} listings in {elapsed:.2f}s.'
+        ))
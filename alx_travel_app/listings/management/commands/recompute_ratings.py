@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from listings.ratings import recompute_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute listing rating averages and counts from existing reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--listing', type=int, action='append', dest='listings',
+            help='Only recompute this listing id (repeatable)',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        fixed = recompute_ratings(options['listings'], options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Corrected ratings of {fixed} listings in {elapsed:.2f}s.'
+        ))
@@ -1,41 +1,348 @@
-from django.core.management.base import BaseCommand
-from django.contrib.auth import get_user_model
-from listings.models import Listing
 import random
+import time
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from listings.availability import rebuild_occupancy
+from listings.cache import LISTING_LIST_GROUP, listing_cache
+from listings.models import RATING_FIELDS, Booking, Listing, Payment, Review
+from listings.ratings import recompute_ratings
+from listings.search import get_backend as get_search_backend
 
 User = get_user_model()
 
+ADJECTIVES = (
+    'Cozy Bright Spacious Quiet Modern Rustic Charming Luxury Budget Family Romantic Historic '
+    'Sunny Secluded Elegant Airy Tranquil Stylish Classic Hidden'
+).split()
+KINDS = (
+    'Apartment Villa Cottage Cabin Loft Studio Suite Bungalow Farmhouse Chalet Penthouse '
+    'Guesthouse Townhouse Retreat Lodge'
+).split()
+FEATURES = (
+    'beach ocean lake river mountain forest garden terrace balcony rooftop courtyard pool sauna '
+    'fireplace kitchen workspace wifi parking breakfast coffee market museum cathedral harbour '
+    'sunset view walk hike bike trail centre downtown station airport vineyard safari island'
+).split()
+LOCATIONS = (
+    'Addis Ababa', 'Bahir Dar', 'Gondar', 'Lalibela', 'Hawassa', 'Nairobi', 'Mombasa',
+    'Zanzibar', 'Kigali', 'Kampala', 'Accra', 'Lagos', 'Dakar', 'Marrakech', 'Cape Town',
+)
+COMMENTS = (
+    'Great stay, would come back.', 'Exactly as described.', 'Lovely host and a quiet spot.',
+    'A bit noisy at night.', 'Spotless and well located.', 'Good value for money.',
+    'The photos do not do it justice.', 'Check-in was slow.', '',
+)
+# Most stays are short; weights for 1..14 nights
+NIGHT_WEIGHTS = (14, 22, 18, 12, 8, 5, 7, 2, 1, 1, 1, 1, 1, 3)
+# Weighted draws are made by indexing these uniformly
+RATINGS = (1,) * 2 + (2,) * 3 + (3,) * 10 + (4,) * 35 + (5,) * 50
+PAST_STATUSES = ('completed',) * 18 + ('failed', 'cancelled')
+UPCOMING_STATUSES = ('completed',) * 7 + ('pending',) * 3
+PAYMENT_COLUMNS = (
+    'id', 'payment_reference', 'booking', 'amount', 'currency', 'status', 'chapa_transaction_id',
+    'created_at', 'updated_at', 'completed_at', 'payment_method', 'failure_reason',
+)
+SQLITE_CACHE_KB = 256 * 1024
+# Bookings fall between a year ago and six months ahead
+HISTORY_DAYS = 365
+HORIZON_DAYS = 180
+
+SAMPLE_LISTINGS = [
+    {
+        'title': 'Cozy Cottage',
+        'description': 'A cozy cottage in the countryside.',
+        'location': 'Countryside',
+        'price_per_night': 120.00,
+    },
+    {
+        'title': 'Beach House',
+        'description': 'Enjoy the sea breeze in this beach house.',
+        'location': 'Beachside',
+        'price_per_night': 200.00,
+    },
+    {
+        'title': 'City Apartment',
+        'description': 'Modern apartment in the city center.',
+        'location': 'City Center',
+        'price_per_night': 150.00,
+    },
+]
+
+
 class Command(BaseCommand):
-    help = 'Seed the database with sample listings'
+    help = (
+        'Seed the database with sample listings, or with generated users, listings, '
+        'bookings, reviews and payments when counts are given'
+    )
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=0)
+        parser.add_argument('--listings', type=int, default=0)
+        parser.add_argument('--bookings', type=int, default=0)
+        parser.add_argument('--reviews', type=int, default=0, help='At most one per guest and listing booked')
+        parser.add_argument('--payments', type=int, default=0, help='At most one per booking')
+        parser.add_argument('--seed', type=int, default=42, help='Same seed and --today, same data')
+        parser.add_argument('--today', type=date.fromisoformat, default=None,
+                            help='Date bookings are spread around (YYYY-MM-DD); defaults to today')
+        parser.add_argument('--prefix', default='seed', help='Username prefix of generated users')
+        parser.add_argument('--chunk-size', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        counts = [options[name] for name in ('users', 'listings', 'bookings', 'reviews', 'payments')]
+        if not any(counts):
+            return self.seed_samples()
+        self.generate(**options)
+
+    def seed_samples(self):
         if not User.objects.exists():
             user = User.objects.create_user(username='owner', password='password')
         else:
             user = User.objects.first()
 
-        sample_listings = [
-            {
-                'title': 'Cozy Cottage',
-                'description': 'A cozy cottage in the countryside.',
-                'location': 'Countryside',
-                'price_per_night': 120.00,
-            },
-            {
-                'title': 'Beach House',
-                'description': 'Enjoy the sea breeze in this beach house.',
-                'location': 'Beachside',
-                'price_per_night': 200.00,
-            },
-            {
-                'title': 'City Apartment',
-                'description': 'Modern apartment in the city center.',
-                'location': 'City Center',
-                'price_per_night': 150.00,
-            },
-        ]
-
-        for data in sample_listings:
+        for data in SAMPLE_LISTINGS:
             Listing.objects.get_or_create(owner=user, **data)
 
         self.stdout.write(self.style.SUCCESS('Sample listings seeded successfully.'))
+
+    def generate(self, users, listings, bookings, reviews, payments, seed, today, prefix, chunk_size, **options):
+        if bookings and not (users and listings):
+            raise CommandError('--bookings needs --users and --listings')
+        if listings and not users:
+            raise CommandError('--listings needs --users to own them')
+        if reviews > bookings or payments > bookings:
+            raise CommandError('--reviews and --payments cannot exceed --bookings')
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f'Users named {prefix}-* exist already; pick another --prefix')
+
+        self.rng = random.Random(seed)
+        # Payment references are unique across the table, so a second run
+        # under another prefix must not repeat them
+        self.references = random.Random(f'{seed}:{prefix}')
+        self.today = today or date.today()
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.now = connection.ops.adapt_datetimefield_value(timezone.now())
+        self.native_uuid = connection.features.has_native_uuid_field
+        if connection.vendor == 'sqlite':
+            # Random keys (users, payment references) land all over the
+            # indexes; with the default 2MB page cache each chunk rereads them
+            with connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA cache_size = -{SQLITE_CACHE_KB}')
+        started = time.perf_counter()
+
+        user_ids = self.create_users(users, prefix)
+        listing_info = self.create_listings(listings, user_ids)
+        if bookings:
+            self.create_bookings(bookings, reviews, payments, user_ids, listing_info)
+        # Ids were assigned here, so move sequences past them (no-op on SQLite)
+        with connection.cursor() as cursor:
+            for statement in connection.ops.sequence_reset_sql(no_style(), [User, Listing, Booking, Review, Payment]):
+                cursor.execute(statement)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Inserted {self.rows} rows in {elapsed:.1f}s ({self.rows / elapsed:,.0f} rows/s)'
+        ))
+
+        # Raw inserts skip the signals that keep these up to date
+        if listings:
+            index_started = time.perf_counter()
+            with transaction.atomic():
+                get_search_backend().rebuild()
+            built = rebuild_occupancy(listing_info[0]) if bookings else 0
+            rated = recompute_ratings(listing_info[0]) if reviews else 0
+            listing_cache.invalidate(LISTING_LIST_GROUP)
+            self.stdout.write(
+                f'Rebuilt search index, {built} occupancy bitmaps and {rated} ratings '
+                f'in {time.perf_counter() - index_started:.1f}s'
+            )
+
+    def progress(self, label, done, total, started):
+        self.stdout.write(
+            f'{label}: {done}/{total} ({done / (time.perf_counter() - started):,.0f}/s)',
+            ending='\n' if done >= total else '\r',
+        )
+
+    def first_id(self, model):
+        return (model.objects.aggregate(Max('pk'))['pk__max'] or 0) + 1
+
+    def insert(self, model, columns, rows):
+        """
+        Write one chunk of value tuples with executemany() in a transaction
+
+        bulk_create() spends most of its time preparing every value of every
+        object and, on SQLite, splits the chunk into statements of at most
+        999 parameters; here values are passed as the driver takes them.
+        """
+        if not rows:
+            return
+        quote = connection.ops.quote_name
+        names = ', '.join(quote(model._meta.get_field(column).column) for column in columns)
+        placeholders = ', '.join(['%s'] * len(columns))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {quote(model._meta.db_table)} ({names}) VALUES ({placeholders})', rows
+            )
+        self.rows += len(rows)
+
+    def create_users(self, count, prefix):
+        # One hash for everyone: hashing per user would take longer than the
+        # whole insert
+        password = make_password('password')
+        started = time.perf_counter()
+        first = self.first_id(User)
+        columns = ('id', 'password', 'is_superuser', 'username', 'first_name', 'last_name', 'email',
+                   'is_staff', 'is_active', 'date_joined')
+        for offset in range(0, count, self.chunk_size):
+            end = min(count, offset + self.chunk_size)
+            self.insert(User, columns, [
+                (first + n, password, False, f'{prefix}-{n}', '', '', f'{prefix}-{n}@example.com',
+                 False, True, self.now)
+                for n in range(offset, end)
+            ])
+            self.progress('users', end, count, started)
+        return range(first, first + count)
+
+    def create_listings(self, count, user_ids):
+        """
+        Returns (ids, prices, max guests, popularity weights) per listing
+        """
+        rng = self.rng
+        started = time.perf_counter()
+        first = self.first_id(Listing)
+        prices, capacities = [], []
+        columns = ('id', 'title', 'description', 'location', 'price_per_night', 'owner',
+                   'max_guests', 'created_at', 'version', *RATING_FIELDS)
+        for offset in range(0, count, self.chunk_size):
+            end = min(count, offset + self.chunk_size)
+            rows = []
+            for n in range(offset, end):
+                location = rng.choice(LOCATIONS)
+                price = Decimal(rng.randint(15, 400) * 5)
+                max_guests = rng.choice((None, 1, 2, 2, 4, 4, 6, 8))
+                rows.append((
+                    first + n,
+                    f'{rng.choice(ADJECTIVES)} {rng.choice(KINDS)} near the {rng.choice(FEATURES)}',
+                    f'{location}: ' + ', '.join(rng.choices(FEATURES, k=rng.randint(20, 60))),
+                    location, price, user_ids[rng.randrange(len(user_ids))], max_guests, self.now, 1,
+                    # Filled in from the reviews once they exist
+                    0, 0, 0,
+                ))
+                prices.append(price)
+                capacities.append(max_guests or 10)
+            self.insert(Listing, columns, rows)
+            self.progress('listings', end, count, started)
+        # A few listings take most of the bookings
+        weights = [rng.paretovariate(1.5) for _ in range(count)]
+        return range(first, first + count), prices, capacities, weights
+
+    def booking_quotas(self, total, weights):
+        scale = total / sum(weights)
+        quotas = [int(weight * scale) for weight in weights]
+        for index in self.rng.choices(range(len(weights)), weights, k=total - sum(quotas)):
+            quotas[index] += 1
+        return quotas
+
+    def create_bookings(self, total, reviews, payments, user_ids, listing_info):
+        """
+        Non-overlapping stays per listing, with payments and reviews drawn
+        from them so every review and payment belongs to a real booking
+        """
+        rng = self.rng
+        # Bound methods and plain arithmetic in the loop: it runs once per
+        # booking and dominates the run time
+        random, expovariate = rng.random, rng.expovariate
+        listing_ids, prices, capacities, weights = listing_info
+        quotas = self.booking_quotas(total, weights)
+        first_day = (self.today - timedelta(days=HISTORY_DAYS)).toordinal()
+        window = HISTORY_DAYS + HORIZON_DAYS
+        nights_choices = range(1, len(NIGHT_WEIGHTS) + 1)
+        mean_nights = sum(n * w for n, w in zip(nights_choices, NIGHT_WEIGHTS)) / sum(NIGHT_WEIGHTS)
+        first_user, user_count = user_ids[0], len(user_ids)
+        now = self.now
+
+        started = time.perf_counter()
+        booking_id = self.first_id(Booking)
+        review_id = self.first_id(Review)
+        payment_id = self.first_id(Payment)
+        seen = 0
+        # Selection sampling: each booking is picked with probability
+        # still-needed / still-unseen, which yields exactly the counts asked
+        # for in one pass (short only if duplicate reviewers run it dry)
+        reviews_left, payments_left = reviews, payments
+        new_bookings, new_reviews, new_payments = [], [], []
+        for listing_id, price, capacity, quota in zip(listing_ids, prices, capacities, quotas):
+            if not quota:
+                continue
+            # Spread the quota over the window, with random gaps between stays
+            mean_gap = max(0.0, (window - quota * mean_nights) / quota)
+            rate = 1 / mean_gap if mean_gap else None
+            day = first_day + (int(expovariate(rate)) if rate else 0)
+            reviewers = set()
+            for nights in rng.choices(nights_choices, NIGHT_WEIGHTS, k=quota):
+                user_id = first_user + int(random() * user_count)
+                start, end = date.fromordinal(day), date.fromordinal(day + nights)
+                new_bookings.append((booking_id, listing_id, user_id, start, end, 1 + int(random() * capacity), now))
+
+                unseen = total - seen
+                if random() * unseen < reviews_left and user_id not in reviewers:
+                    reviewers.add(user_id)
+                    reviews_left -= 1
+                    new_reviews.append((
+                        review_id, listing_id, user_id,
+                        RATINGS[int(random() * len(RATINGS))], COMMENTS[int(random() * len(COMMENTS))], now,
+                    ))
+                    review_id += 1
+                if random() * unseen < payments_left:
+                    payments_left -= 1
+                    new_payments.append(self.payment_row(payment_id, booking_id, start, end, price * nights))
+                    payment_id += 1
+                booking_id += 1
+                seen += 1
+                day += nights + (int(expovariate(rate)) if rate else 0)
+
+                if len(new_bookings) >= self.chunk_size:
+                    self.flush(new_bookings, new_reviews, new_payments)
+                    new_bookings, new_reviews, new_payments = [], [], []
+                    self.progress('bookings', seen, total, started)
+        if new_bookings:
+            self.flush(new_bookings, new_reviews, new_payments)
+            self.progress('bookings', seen, total, started)
+        if reviews_left or payments_left:
+            self.stdout.write(self.style.WARNING(
+                f'{reviews - reviews_left} reviews and {payments - payments_left} payments created'
+            ))
+
+    def flush(self, bookings, reviews, payments):
+        with transaction.atomic():
+            self.insert(Booking, ('id', 'listing', 'user', 'start_date', 'end_date', 'guests', 'created_at'), bookings)
+            self.insert(Review, ('id', 'listing', 'user', 'rating', 'comment', 'created_at'), reviews)
+            self.insert(Payment, PAYMENT_COLUMNS, payments)
+
+    def payment_row(self, payment_id, booking_id, start, end, amount):
+        random = self.rng.random
+        if end <= self.today:
+            status = PAST_STATUSES[int(random() * len(PAST_STATUSES))]
+        elif start <= self.today:
+            status = 'completed'
+        else:
+            status = UPCOMING_STATUSES[int(random() * len(UPCOMING_STATUSES))]
+        reference = uuid.UUID(int=self.references.getrandbits(128), version=4)
+        now = self.now
+        return (
+            payment_id, reference if self.native_uuid else reference.hex,
+            booking_id, amount, 'ETB', status, f'seed-{reference.hex[:16]}' if status != 'pending' else None,
+            now, now, now if status == 'completed' else None,
+            'telebirr' if status == 'completed' else None,
+            'Insufficient funds' if status == 'failed' else None,
+        )
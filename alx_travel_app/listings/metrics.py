@@ -0,0 +1,337 @@
+"""
+Per-view request metrics in Prometheus text format
+
+MetricsMiddleware times every request and attributes it to the URL name
+(listing-list, initiate-payment, ...). While a request runs, a context
+variable collects what it spent on database queries (a wrapper installed
+on every connection), on Chapa calls (reported by listings.chapa) and on
+serializer output (TimedSerializerMixin and CompiledSerializer.render).
+Streaming responses are recorded once their content has been generated,
+which is where their queries and serialization happen.
+
+Each thread writes into its own shard, so recording takes no lock; a
+scrape sums the shards. A scrape can catch a shard halfway through one
+update, which skews that scrape by a single request at most. Shards of
+threads that have exited are folded into a retired total on the next
+scrape.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework import serializers
+
+# Histogram upper bounds in seconds; the last bucket is +Inf
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Offsets into a per-view row
+COUNT, SECONDS, QUERIES, DB_SECONDS, CHAPA_SECONDS, SERIALIZER_SECONDS, FIRST_BUCKET = range(7)
+ROW_SIZE = FIRST_BUCKET + len(BUCKETS) + 1
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class RequestSample:
+    __slots__ = ('queries', 'db', 'chapa', 'serializer')
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.chapa = 0.0
+        self.serializer = 0.0
+
+
+_current = ContextVar('listings_request_metrics', default=None)
+
+
+class Shard:
+    """
+    One thread's counters: (view, method) -> row, (view, method, status) -> count
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.statuses = {}
+
+    def observe(self, view, method, status, seconds, sample):
+        row = self.rows.get((view, method))
+        if row is None:
+            row = self.rows[(view, method)] = [0] * ROW_SIZE
+        row[COUNT] += 1
+        row[SECONDS] += seconds
+        row[QUERIES] += sample.queries
+        row[DB_SECONDS] += sample.db
+        row[CHAPA_SECONDS] += sample.chapa
+        row[SERIALIZER_SECONDS] += sample.serializer
+        row[FIRST_BUCKET + bisect_left(BUCKETS, seconds)] += 1
+        key = (view, method, status)
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    def merge(self, other):
+        for key, row in list(other.rows.items()):
+            mine = self.rows.get(key)
+            if mine is None:
+                mine = self.rows[key] = [0] * ROW_SIZE
+            for i, value in enumerate(list(row)):
+                mine[i] += value
+        for key, count in list(other.statuses.items()):
+            self.statuses[key] = self.statuses.get(key, 0) + count
+
+
+class Registry:
+    def __init__(self):
+        self._local = threading.local()
+        # Taken when a thread registers its shard and on scrape, never
+        # while recording a request
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = Shard()
+
+    def shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = Shard()
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def observe(self, view, method, status, seconds, sample):
+        self.shard().observe(view, method, status, seconds, sample)
+
+    def totals(self):
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    self._retired.merge(shard)
+            self._shards = live
+            totals = Shard()
+            totals.merge(self._retired)
+            for _, shard in live:
+                totals.merge(shard)
+        return totals
+
+    def reset(self):
+        with self._lock:
+            for _, shard in self._shards:
+                shard.rows.clear()
+                shard.statuses.clear()
+            self._retired = Shard()
+
+
+REGISTRY = Registry()
+
+
+@contextmanager
+def timed(field):
+    """
+    Add the time spent in the block to the current request's `field`
+    """
+    sample = _current.get()
+    if sample is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(sample, field, getattr(sample, field) + time.perf_counter() - started)
+
+
+def record_chapa(elapsed_ms):
+    """
+    Called by the Chapa clients after every call, retries included
+    """
+    sample = _current.get()
+    if sample is not None:
+        sample.chapa += elapsed_ms / 1000
+
+
+def record_query(execute, sql, params, many, context):
+    sample = _current.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.queries += 1
+        sample.db += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def install_query_wrapper(sender, connection, **kwargs):
+    # connection_created fires again on every reconnect of the same wrapper.
+    # Insert first: connection.execute_wrapper() pops the last wrapper on exit
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class MeasuredStream:
+    """
+    Streaming content generated with its request's sample current; the
+    request is recorded once, when the content is exhausted or closed
+    """
+
+    def __init__(self, content, sample, observe):
+        self.content = content
+        self.sample = sample
+        self.observe = observe
+        self.closed = False
+
+    def __iter__(self):
+        iterator = iter(self.content)
+        try:
+            while True:
+                token = _current.set(self.sample)
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    _current.reset(token)
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        # Called by the exhausted iterator and again by response.close()
+        if not self.closed:
+            self.closed = True
+            self.observe()
+
+
+class AsyncMeasuredStream(MeasuredStream):
+    async def __aiter__(self):
+        iterator = aiter(self.content)
+        try:
+            while True:
+                token = _current.set(self.sample)
+                try:
+                    chunk = await anext(iterator)
+                except StopAsyncIteration:
+                    return
+                finally:
+                    _current.reset(token)
+                yield chunk
+        finally:
+            self.close()
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match and match.view_name else 'unmatched'
+
+
+class MetricsMiddleware:
+    """
+    Record latency, queries, Chapa and serializer time per view; put it
+    first in MIDDLEWARE so the rest of the stack is counted too
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        sample = RequestSample()
+        token = _current.set(sample)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, started, sample)
+
+    async def __acall__(self, request):
+        sample = RequestSample()
+        token = _current.set(sample)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, started, sample)
+
+    def finish(self, request, response, started, sample):
+        def observe():
+            REGISTRY.observe(view_name(request), request.method, response.status_code,
+                             time.perf_counter() - started, sample)
+
+        if response.streaming:
+            # The body is generated after the view returns; count it too
+            stream_class = AsyncMeasuredStream if response.is_async else MeasuredStream
+            response.streaming_content = stream_class(response.streaming_content, sample, observe)
+        else:
+            observe()
+        return response
+
+
+class TimedSerializerMixin:
+    """
+    Count time spent building serializer.data towards the current request
+    """
+
+    @property
+    def data(self):
+        with timed('serializer'):
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def exposition(registry=None):
+    """
+    The registry's totals in Prometheus text format
+    """
+    totals = (registry or REGISTRY).totals()
+    rows = sorted(totals.rows.items())
+    lines = [
+        '# HELP http_request_duration_seconds Request latency by view',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for (view, method), row in rows:
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), row[FIRST_BUCKET:]):
+            cumulative += count
+            lines.append(
+                f'http_request_duration_seconds_bucket{_labels(view=view, method=method, le=bound)} {cumulative}'
+            )
+        lines.append(f'http_request_duration_seconds_sum{_labels(view=view, method=method)} {row[SECONDS]:.6f}')
+        lines.append(f'http_request_duration_seconds_count{_labels(view=view, method=method)} {row[COUNT]}')
+
+    lines += ['# HELP http_requests_total Responses by view and status', '# TYPE http_requests_total counter']
+    for (view, method, status), count in sorted(totals.statuses.items()):
+        lines.append(f'http_requests_total{_labels(view=view, method=method, status=status)} {count}')
+
+    for name, index, help_text in (
+        ('http_db_queries_total', QUERIES, 'Database queries run by view'),
+        ('http_db_query_seconds_total', DB_SECONDS, 'Time in database queries by view'),
+        ('http_chapa_seconds_total', CHAPA_SECONDS, 'Time in Chapa API calls by view'),
+        ('http_serializer_seconds_total', SERIALIZER_SECONDS, 'Time building serializer output by view'),
+    ):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for (view, method), row in rows:
+            value = row[index] if index == QUERIES else f'{row[index]:.6f}'
+            lines.append(f'{name}{_labels(view=view, method=method)} {value}')
+    return '\n'.join(lines) + '\n'
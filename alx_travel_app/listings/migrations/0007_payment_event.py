@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0006_listing_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tx_ref', models.CharField(db_index=True, max_length=255)),
+                ('event', models.CharField(blank=True, max_length=50)),
+                ('payload', models.TextField()),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='payment_event_unprocessed_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:07
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+
+
+def backfill_ratings(apps, schema_editor):
+    Listing = apps.get_model('listings', 'Listing')
+    Review = apps.get_model('listings', 'Review')
+    reviews = Review.objects.filter(listing=OuterRef('pk')).order_by().values('listing')
+    Listing.objects.filter(pk__in=Review.objects.values('listing')).update(
+        rating_count=Coalesce(Subquery(reviews.annotate(n=Count('*')).values('n')), 0),
+        rating_total=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+    )
+    # Rounded as numeric: PostgreSQL has no ROUND(double precision, int)
+    mean = Cast(
+        Cast(F('rating_total'), FloatField()) / NullIf(F('rating_count'), 0),
+        models.DecimalField(max_digits=12, decimal_places=6),
+    )
+    Listing.objects.filter(rating_count__gt=0).update(
+        rating_avg=Coalesce(Round(mean, 2), Value(Decimal('0')))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0009_outbox_message'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['-rating_avg', '-id'], name='listing_rating_id_idx'),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
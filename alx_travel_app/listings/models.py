@@ -4,17 +4,53 @@ import uuid
 
 User = get_user_model()
 
+# Maintained by listings/ratings.py with UPDATEs of their own, never
+# written back from a Listing instance
+RATING_FIELDS = ('rating_total', 'rating_count', 'rating_avg')
+
 class Listing(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
     location = models.CharField(max_length=255)
     price_per_night = models.DecimalField(max_digits=8, decimal_places=2)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='listings')
+    # Leave empty for listings without a guest limit
+    max_guests = models.PositiveIntegerField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped on every update; with created_at it forms the listing's ETag
+    version = models.PositiveIntegerField(default=1, editable=False)
+    # Sum and number of review ratings, and their mean (0 without reviews)
+    rating_total = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Backs keyset pagination on (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='listing_created_id_idx'),
+            # And on (rating_avg, id) for ?sort=rating
+            models.Index(fields=['-rating_avg', '-id'], name='listing_rating_id_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.version = models.F('version') + 1
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in RATING_FIELDS
+                ]
+            elif update_fields and 'version' not in update_fields:
+                # A partial save still changes the listing, and so its ETag
+                kwargs['update_fields'] = [*update_fields, 'version']
+        super().save(*args, **kwargs)
+        if not isinstance(self.version, int):
+            self.refresh_from_db(fields=['version'])
+
 class Booking(models.Model):
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='bookings')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bookings')
@@ -25,10 +61,41 @@ class Booking(models.Model):
 
     class Meta:
         unique_together = ('listing', 'user', 'start_date', 'end_date')
+        indexes = [
+            # Backs the overlap check in bookings.save_booking
+            models.Index(fields=['listing', 'start_date', 'end_date'], name='booking_listing_dates_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user} booking {self.listing}"
 
+class ListingOccupancy(models.Model):
+    """
+    Per-listing day bitmap of booked nights
+
+    Bit i is set when the night of origin + i days is taken by a booking
+    (start_date inclusive, end_date exclusive). Maintained from Booking
+    signals and rebuildable with the rebuild_occupancy command.
+    """
+    listing = models.OneToOneField(
+        Listing, on_delete=models.CASCADE, primary_key=True, related_name='occupancy'
+    )
+    origin = models.DateField()
+    bitmap = models.BinaryField(default=b'')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Occupancy for {self.listing_id} from {self.origin}"
+
+    @property
+    def mask(self):
+        return int.from_bytes(self.bitmap, 'little')
+
+    @mask.setter
+    def mask(self, value):
+        self.bitmap = value.to_bytes((value.bit_length() + 7) // 8, 'little')
+
+
 class Review(models.Model):
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
@@ -38,6 +105,10 @@ class Review(models.Model):
 
     class Meta:
         unique_together = ('listing', 'user')
+        indexes = [
+            # Keyset pages of a listing's review feed, newest first
+            models.Index(fields=['listing', '-created_at', '-id'], name='review_listing_created_idx'),
+        ]
 
     def __str__(self):
         return f"Review by {self.user} for {self.listing}"
@@ -82,6 +153,10 @@ class Payment(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Payment'
         verbose_name_plural = 'Payments'
+        indexes = [
+            # Reconciliation scans pending payments by age
+            models.Index(fields=['status', 'created_at'], name='payment_status_created_idx'),
+        ]
     
     def __str__(self):
         return f"Payment {self.payment_reference} - {self.status} - {self.amount} {self.currency}"
@@ -97,3 +172,53 @@ class Payment(models.Model):
     @property
     def is_failed(self):
         return self.status == 'failed'
+
+
+class PaymentEvent(models.Model):
+    """
+    Chapa webhook or callback exactly as received, verified later in batches
+    """
+    tx_ref = models.CharField(max_length=255, db_index=True)
+    event = models.CharField(max_length=50, blank=True)
+    payload = models.TextField()
+    # sha256 of the raw request, so Chapa's redeliveries are stored once
+    digest = models.CharField(max_length=64, unique=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['id'], condition=models.Q(processed_at__isnull=True),
+                name='payment_event_unprocessed_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Chapa {self.event or 'callback'} for {self.tx_ref}"
+
+
+class OutboxMessage(models.Model):
+    """
+    Celery task to publish, written in the same transaction as the change
+    it announces and relayed to the broker afterwards
+    """
+    task = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(blank=True, null=True)
+    # Set by the worker when the task starts, for end-to-end latency
+    delivered_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['id'], condition=models.Q(published_at__isnull=True),
+                name='outbox_unpublished_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.task}{tuple(self.args)}"
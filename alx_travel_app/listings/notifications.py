@@ -0,0 +1,162 @@
+"""
+Payment notification emails
+
+Builders render a Payment (with booking, user and listing already loaded)
+into a multipart text/HTML message from the templates under
+listings/emails/; deliver() sends a batch over one SMTP connection and
+reports which messages failed, so only those are retried.
+"""
+import logging
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+
+from .models import Payment
+
+logger = logging.getLogger(__name__)
+
+
+# Notification kind -> template name prefix under listings/emails/
+TEMPLATES = {
+    'confirmation': 'payment_confirmation',
+    'failure': 'payment_failure',
+}
+
+
+@lru_cache(maxsize=None)
+def compiled(kind):
+    """
+    (subject, text, html) templates for a kind, compiled once per process
+
+    Workers render the same few templates tens of thousands of times, so
+    they skip even the cached loader's lookup; restart them to pick up
+    template changes.
+    """
+    prefix = f'listings/emails/{TEMPLATES[kind]}'
+    return (
+        get_template(f'{prefix}_subject.txt'),
+        get_template(f'{prefix}.txt'),
+        get_template(f'{prefix}.html'),
+    )
+
+
+def render_message(kind, payment):
+    """
+    Multipart text/HTML EmailMessage for a payment
+    """
+    subject, text, html = compiled(kind)
+    booking = payment.booking
+    context = {
+        'payment': payment,
+        'booking': booking,
+        'user': booking.user,
+        'listing': booking.listing,
+    }
+    message = EmailMultiAlternatives(
+        # Header values must be a single line
+        ' '.join(subject.render(context).split()),
+        text.render(context),
+        settings.DEFAULT_FROM_EMAIL,
+        [booking.user.email],
+    )
+    message.attach_alternative(html.render(context), 'text/html')
+    return message
+
+
+def confirmation_message(payment):
+    return render_message('confirmation', payment)
+
+
+def failure_message(payment):
+    return render_message('failure', payment)
+
+
+# Notification kind -> message builder
+BUILDERS = {
+    'confirmation': confirmation_message,
+    'failure': failure_message,
+}
+
+
+def load_payments(payment_ids):
+    """
+    Payments by id with everything the builders read, in one query
+    """
+    return Payment.objects.select_related('booking__user', 'booking__listing').in_bulk(payment_ids)
+
+
+class BatchStats:
+    """
+    Per-process counters for email batches
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.messages = 0
+        self.failures = 0
+        self.total_ms = 0.0
+        self.largest_batch = 0
+
+    def record(self, size, failures, elapsed_ms):
+        with self._lock:
+            self.batches += 1
+            self.messages += size
+            self.failures += failures
+            self.total_ms += elapsed_ms
+            self.largest_batch = max(self.largest_batch, size)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'messages': self.messages,
+                'failures': self.failures,
+                'largest_batch': self.largest_batch,
+                'mean_batch_ms': round(self.total_ms / self.batches, 3) if self.batches else 0.0,
+            }
+
+
+EMAIL_STATS = BatchStats()
+
+
+def deliver(messages, connection=None):
+    """
+    Send (key, EmailMessage) pairs over one connection; returns failed keys
+
+    Each message is handed to send_messages() on its own so one bad
+    recipient doesn't abort the batch; the connection is reopened after an
+    error in case the server dropped it.
+    """
+    started = time.perf_counter()
+    connection = connection or get_connection()
+    failed = []
+    attempted = 0
+    try:
+        connection.open()
+        for key, message in messages:
+            attempted += 1
+            try:
+                connection.send_messages([message])
+            except Exception:
+                logger.exception('Sending %s to %s failed', key, message.to)
+                failed.append(key)
+                connection.close()
+                connection.open()
+    except Exception:
+        # Could not (re)connect: everything not yet attempted failed too
+        logger.exception('Mail server unavailable')
+        failed.extend(key for key, _ in messages[attempted:])
+    finally:
+        connection.close()
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    EMAIL_STATS.record(len(messages), len(failed), elapsed_ms)
+    logger.info(
+        'Sent %d of %d payment emails in %.1fms', len(messages) - len(failed), len(messages), elapsed_ms
+    )
+    return failed
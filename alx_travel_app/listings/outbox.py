@@ -0,0 +1,150 @@
+"""
+Transactional outbox for Celery tasks
+
+enqueue() writes an OutboxMessage inside the caller's transaction, so a
+notification exists exactly when the change it announces was committed,
+and a web request never waits on the broker. relay() publishes pending
+messages in id order over one producer connection per batch; run it with
+`python manage.py outbox_relay`.
+
+Delivery is at least once: a relay that dies between publishing and
+marking a batch publishes it again, so tasks must tolerate duplicates.
+Workers stamp delivered_at when a relayed task starts, which is where the
+end-to-end latency in stats() comes from.
+"""
+import logging
+from datetime import timedelta
+
+from celery import current_app
+from celery.signals import task_prerun
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .benchmarks import summarize
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'outbox_id'
+
+
+def enqueue(task, *args):
+    """
+    Queue task(*args) for publishing once the current transaction commits
+    """
+    return OutboxMessage.objects.create(task=task.name, args=list(args))
+
+
+def enqueue_many(calls):
+    """
+    enqueue() for a list of (task, args) pairs in one INSERT
+    """
+    return OutboxMessage.objects.bulk_create(
+        [OutboxMessage(task=task.name, args=list(args)) for task, args in calls]
+    )
+
+
+def relay(batch_size=None):
+    """
+    Publish up to batch_size pending messages; returns how many were sent
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    if connection.features.has_select_for_update_skip_locked:
+        # Concurrent relays skip each other's rows instead of double-sending
+        with transaction.atomic():
+            return _relay(OutboxMessage.objects.select_for_update(skip_locked=True), batch_size)
+    # No SKIP LOCKED (SQLite): run a single relay, and keep no transaction
+    # open while publishing, which would stall every writer
+    return _relay(OutboxMessage.objects.all(), batch_size)
+
+
+def _relay(queryset, batch_size):
+    messages = list(queryset.filter(published_at__isnull=True).order_by('id')[:batch_size])
+    if not messages:
+        return 0
+
+    published = []
+    pending = []
+    try:
+        with current_app.producer_or_acquire() as producer:
+            for task, args, members in publications(messages):
+                pending = [message.id for message in members]
+                current_app.send_task(task, args=args, headers={HEADER: pending}, producer=producer)
+                published.extend(pending)
+                pending = []
+    except Exception:
+        # Stop at the first failure; the rest goes out on the next pass
+        logger.exception('Outbox relay could not publish messages %s', pending)
+        OutboxMessage.objects.filter(id__in=pending).update(attempts=F('attempts') + 1)
+
+    OutboxMessage.objects.filter(id__in=published).update(published_at=timezone.now())
+    return len(published)
+
+
+def publications(messages):
+    """
+    Group messages into (task, args, messages) to publish, in id order
+
+    Messages for a task listed in OUTBOX_BATCHED_TASKS are folded, up to
+    OUTBOX_COALESCE_LIMIT at a time, into one call of the batch task with
+    args [[[task, args], ...]], so a burst of emails becomes a few batches.
+    """
+    result = []
+    open_batches = {}
+    for message in messages:
+        batch_task = settings.OUTBOX_BATCHED_TASKS.get(message.task)
+        if batch_task is None:
+            result.append((message.task, message.args, [message]))
+            continue
+        batch = open_batches.get(batch_task)
+        if batch is None or len(batch[2]) >= settings.OUTBOX_COALESCE_LIMIT:
+            batch = open_batches[batch_task] = (batch_task, [[]], [])
+            result.append(batch)
+        batch[1][0].append([message.task, message.args])
+        batch[2].append(message)
+    return result
+
+
+def prune(days=None):
+    """
+    Delete delivered messages older than OUTBOX_RETENTION_DAYS
+    """
+    days = settings.OUTBOX_RETENTION_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = OutboxMessage.objects.filter(
+        published_at__isnull=False, created_at__lt=cutoff
+    ).delete()
+    return deleted
+
+
+def stats(window=1000):
+    """
+    Backlog plus publish lag and end-to-end delivery latency, in ms, over
+    the last `window` delivered messages
+    """
+    pending = OutboxMessage.objects.filter(published_at__isnull=True)
+    oldest = pending.order_by('id').values_list('created_at', flat=True).first()
+    recent = list(
+        OutboxMessage.objects.filter(delivered_at__isnull=False)
+        .order_by('-id').values_list('created_at', 'published_at', 'delivered_at')[:window]
+    )
+    return {
+        'pending': pending.count(),
+        'oldest_pending_seconds': round((timezone.now() - oldest).total_seconds(), 3) if oldest else 0.0,
+        'publish_lag': summarize([(published - created).total_seconds() * 1000 for created, published, _ in recent]),
+        'delivery_latency': summarize([(delivered - created).total_seconds() * 1000 for created, _, delivered in recent]),
+    }
+
+
+@task_prerun.connect
+def mark_delivered(task=None, **kwargs):
+    outbox_ids = task.request.get(HEADER) or (task.request.headers or {}).get(HEADER)
+    if outbox_ids:
+        if not isinstance(outbox_ids, list):
+            # Tasks queued before batching carry a single id
+            outbox_ids = [outbox_ids]
+        OutboxMessage.objects.filter(pk__in=outbox_ids, delivered_at__isnull=True).update(
+            delivered_at=timezone.now()
+        )
@@ -0,0 +1,152 @@
+"""
+Keyset (cursor) pagination helpers
+"""
+import base64
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a client sends a cursor we did not issue
+    """
+
+
+def parse_rating(value):
+    rating = Decimal(value)
+    return rating if rating.is_finite() else None
+
+
+# Parsers for the sort value a cursor carries, by the field pages are ordered on
+CURSOR_VALUES = {
+    'created_at': parse_datetime,
+    'rating_avg': parse_rating,
+}
+
+
+def encode_cursor(value, pk):
+    """
+    Encode a (sort value, id) position as an opaque, URL-safe token
+    """
+    value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+    raw = json.dumps([value, pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, field='created_at'):
+    """
+    Decode a token produced by encode_cursor back into (sort value, id)
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = CURSOR_VALUES[field](value)
+        pk = int(pk)
+    except (ValueError, TypeError, ArithmeticError):
+        raise InvalidCursor('Invalid cursor')
+    if value is None:
+        raise InvalidCursor('Invalid cursor')
+    return value, pk
+
+
+def get_page_size(request, default=None, maximum=None):
+    """
+    Read ?page_size= from the request, clamped to the configured maximum
+    """
+    default = default or settings.LISTINGS_PAGE_SIZE
+    maximum = maximum or settings.LISTINGS_MAX_PAGE_SIZE
+    try:
+        page_size = int(request.query_params.get('page_size', default))
+    except (TypeError, ValueError):
+        page_size = default
+    return max(1, min(page_size, maximum))
+
+
+def keyset_filter(queryset, cursor, field='created_at'):
+    """
+    Restrict a queryset ordered by (-field, -id) to rows after cursor
+    """
+    queryset = queryset.order_by(f'-{field}', '-id')
+    if not cursor:
+        return queryset
+    value, pk = decode_cursor(cursor, field)
+    return queryset.filter(
+        Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk})
+    )
+
+
+def paginate_keyset(queryset, cursor, page_size, field='created_at'):
+    """
+    Return (rows, next_cursor) for one page of a (field, id) keyset
+    """
+    rows = list(keyset_filter(queryset, cursor, field)[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return rows, next_cursor
+
+
+def paginate_keyset_rows(queryset, cursor, page_size, columns, field='created_at'):
+    """
+    paginate_keyset over values_list(*columns) tuples instead of model instances
+
+    Each row ends with the (field, id) it is ordered on, after columns.
+    """
+    rows = list(keyset_filter(queryset, cursor, field).values_list(*columns, field, 'id')[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(*rows[-1][-2:])
+    return rows, next_cursor
+
+
+def paginated_response_data(request, results, next_cursor):
+    """
+    Build the {next, results} envelope returned by paginated endpoints
+    """
+    next_url = None
+    if next_cursor:
+        next_url = replace_query_param(request.build_absolute_uri(), 'cursor', next_cursor)
+    return {'next': next_url, 'results': results}
+
+
+def stream_json_array(queryset, render, chunk_size=None):
+    """
+    Stream a queryset as a JSON array, one serialized chunk at a time
+
+    render turns a list of rows into a list of JSON-ready objects. Rows come
+    off QuerySet.iterator() so only chunk_size of them are alive at any
+    moment, regardless of how large the table is.
+    """
+    chunk_size = chunk_size or settings.LISTINGS_STREAM_CHUNK_SIZE
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    def generate():
+        yield '['
+        first = True
+        chunk = []
+        for row in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield _encode_chunk(encoder, render, chunk, first)
+                first = False
+                chunk = []
+        if chunk:
+            yield _encode_chunk(encoder, render, chunk, first)
+        yield ']'
+
+    return StreamingHttpResponse(generate(), content_type='application/json')
+
+
+def _encode_chunk(encoder, render, rows, first):
+    body = ','.join(encoder.encode(item) for item in render(rows))
+    return body if first else ',' + body
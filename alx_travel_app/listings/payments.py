@@ -0,0 +1,181 @@
+"""
+Chapa payment state transitions shared by the sync and async views
+
+These helpers only build requests and mutate Payment instances in memory;
+callers do the I/O (HTTP call, save, task dispatch) in whichever style
+their view runs in.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_UNAVAILABLE = {'error': 'Payment provider unavailable, please try again'}
+
+# Fields touched by apply_verify_response, written back in batches
+VERIFY_FIELDS = ['status', 'completed_at', 'payment_method', 'failure_reason', 'updated_at']
+
+
+def initialize_payload(payment, booking, data, base_url):
+    """
+    Body for Chapa's /transaction/initialize from validated initiation data
+    """
+    return {
+        "amount": str(data['amount']),
+        "currency": data['currency'],
+        "email": data['email'],
+        "first_name": data['first_name'],
+        "last_name": data['last_name'],
+        "phone_number": data['phone_number'],
+        "tx_ref": str(payment.payment_reference),
+        "callback_url": f"{base_url}payments/webhook/",
+        "return_url": f"{base_url}api/payments/success/",
+        "customization": {
+            "title": f"Payment for {booking.listing.title}",
+            "description": f"Booking payment for {booking.listing.location}"
+        }
+    }
+
+
+def mark_unreachable(payment, error):
+    payment.status = 'failed'
+    payment.failure_reason = f'Chapa unreachable: {error}'
+    return PROVIDER_UNAVAILABLE, status.HTTP_502_BAD_GATEWAY
+
+
+def apply_initialize_response(payment, status_code, body, text):
+    """
+    Update payment from Chapa's initialize answer; returns (payload, http status)
+    """
+    if status_code == 200:
+        payment.chapa_transaction_id = body.get('data', {}).get('reference')
+        payment.chapa_checkout_url = body.get('data', {}).get('checkout_url')
+        return {
+            'payment_reference': payment.payment_reference,
+            'checkout_url': payment.chapa_checkout_url,
+            'status': payment.status,
+            'message': 'Payment initiated successfully'
+        }, status.HTTP_201_CREATED
+
+    payment.status = 'failed'
+    payment.failure_reason = text
+    return {
+        'error': 'Failed to initiate payment',
+        'details': text
+    }, status.HTTP_400_BAD_REQUEST
+
+
+def apply_verify_response(payment, status_code, body, text):
+    """
+    Update payment from Chapa's verify answer
+
+    Returns (payload, http status, changed) where changed tells the
+    caller to save the payment and send the matching notification.
+    """
+    if status_code != 200:
+        return {
+            'error': 'Failed to verify payment',
+            'details': text
+        }, status.HTTP_400_BAD_REQUEST, False
+
+    if body.get('data', {}).get('status') == 'success':
+        payment.status = 'completed'
+        payment.completed_at = timezone.now()
+        payment.payment_method = body.get('data', {}).get('payment_method', 'Unknown')
+        return {
+            'payment_reference': payment.payment_reference,
+            'status': payment.status,
+            'message': 'Payment verified and completed successfully'
+        }, status.HTTP_200_OK, True
+
+    payment.status = 'failed'
+    payment.failure_reason = body.get('message', 'Payment failed')
+    return {
+        'payment_reference': payment.payment_reference,
+        'status': payment.status,
+        'message': 'Payment verification failed'
+    }, status.HTTP_400_BAD_REQUEST, True
+
+
+def notification_task(payment):
+    """
+    Celery task announcing the payment's current status, if any
+    """
+    from .tasks import send_payment_confirmation_email, send_payment_failure_email
+
+    if payment.status == 'completed':
+        return send_payment_confirmation_email
+    if payment.status == 'failed':
+        return send_payment_failure_email
+    return None
+
+
+def notification_calls(payments):
+    """
+    (task, args) outbox entries announcing each payment's current status
+    """
+    calls = []
+    for payment in payments:
+        task = notification_task(payment)
+        if task is not None:
+            calls.append((task, (payment.id,)))
+    return calls
+
+
+def save_with_notification(payment):
+    """
+    Save a verified payment and queue its email in the same transaction
+    """
+    from .outbox import enqueue_many
+
+    with transaction.atomic():
+        payment.save()
+        enqueue_many(notification_calls([payment]))
+
+
+def verify_many(client, payments, workers):
+    """
+    Verify payments against Chapa with at most `workers` calls in flight
+
+    Returns (payment, response) pairs in input order; response is None when
+    Chapa could not be reached. Worker threads only do HTTP, never the ORM.
+    """
+    def verify(payment):
+        try:
+            return payment, client.verify(payment.chapa_transaction_id or payment.payment_reference)
+        except requests.RequestException as e:
+            logger.warning('Verifying payment %s failed: %s', payment.payment_reference, e)
+            return payment, None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return list(pool.map(verify, payments))
+
+
+def apply_verifications(results):
+    """
+    Apply verify answers from verify_many; returns the payments that changed
+
+    Unlike the interactive verify view, a transaction Chapa still reports as
+    pending is left alone rather than failed: the customer may yet pay.
+    """
+    changed = []
+    now = timezone.now()
+    for payment, response in results:
+        if response is None or response.status_code != 200:
+            continue
+        body = response.json()
+        if body.get('data', {}).get('status') == 'pending':
+            continue
+        _, _, did_change = apply_verify_response(payment, response.status_code, body, response.text)
+        if did_change:
+            # One timestamp per batch lets equal outcomes share an UPDATE
+            payment.updated_at = now
+            if payment.completed_at:
+                payment.completed_at = now
+            changed.append(payment)
+    return changed
@@ -0,0 +1,83 @@
+"""
+Listing rating aggregates
+
+Listing.rating_total, rating_count and rating_avg follow Review rows from
+signals. Each change is one UPDATE whose new values the database computes
+from the stored ones, so concurrent reviews of a listing never overwrite
+each other's increments, and nothing ever aggregates the review table on
+a read.
+
+recompute_ratings() rebuilds them from the reviews, for rows written
+without signals (bulk_create, raw SQL, fixtures) or any other drift.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, FloatField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+
+from .cache import LISTING_LIST_GROUP, invalidate_listing, listing_cache, listing_detail_group
+from .models import Listing, Review
+
+
+# The unrounded mean, as numeric: PostgreSQL has no ROUND(double precision, int)
+MEAN_FIELD = DecimalField(max_digits=12, decimal_places=6)
+
+
+def average(total, count):
+    # NULL rather than a division error without reviews, then 0. Rounded as
+    # stored, so pagination cursors compare equal to the row they came from.
+    # Divided as floats first, since SQLite casts integers to integers
+    mean = Cast(Cast(total, FloatField()) / NullIf(count, 0), MEAN_FIELD)
+    return Coalesce(Round(mean, 2), Value(Decimal('0')))
+
+
+def adjust_rating(listing_id, total_delta, count_delta):
+    """
+    Add total_delta to a listing's rating total and count_delta to its count
+    """
+    total = F('rating_total') + total_delta
+    count = F('rating_count') + count_delta
+    # Every right-hand side reads the row as it was before this UPDATE
+    Listing.objects.filter(pk=listing_id).update(
+        rating_total=total,
+        rating_count=count,
+        rating_avg=average(total, count),
+        version=F('version') + 1,
+    )
+    invalidate_listing(listing_id)
+    transaction.on_commit(lambda: invalidate_listing(listing_id))
+
+
+def recompute_ratings(listing_ids=None, batch_size=1000):
+    """
+    Reset aggregates that disagree with the Review table
+
+    Returns the number of listings that were corrected.
+    """
+    reviews = Review.objects.filter(listing=OuterRef('pk')).order_by().values('listing')
+    actual_count = Coalesce(Subquery(reviews.annotate(n=Count('*')).values('n')), 0)
+    actual_total = Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0)
+
+    listings = Listing.objects.all()
+    if listing_ids is not None:
+        listings = listings.filter(pk__in=listing_ids)
+    drifted = list(
+        listings.annotate(actual_count=actual_count, actual_total=actual_total)
+        .filter(~Q(rating_count=F('actual_count')) | ~Q(rating_total=F('actual_total')))
+        .values_list('pk', flat=True)
+    )
+    for start in range(0, len(drifted), batch_size):
+        batch = drifted[start:start + batch_size]
+        with transaction.atomic():
+            Listing.objects.filter(pk__in=batch).update(
+                rating_total=actual_total,
+                rating_count=actual_count,
+                rating_avg=average(actual_total, actual_count),
+                version=F('version') + 1,
+            )
+    for pk in drifted:
+        listing_cache.invalidate(listing_detail_group(pk))
+    if drifted:
+        listing_cache.invalidate(LISTING_LIST_GROUP)
+    return len(drifted)
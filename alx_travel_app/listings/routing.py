@@ -0,0 +1,148 @@
+"""
+Read-replica routing
+
+Writes and reads go to the `default` database. Reads of listings models
+made inside a view marked @replica_reads go to one of the aliases in
+DATABASE_REPLICAS instead, picked once per request so the view sees a
+single replica.
+
+Replicas lag the primary, so a client that has just written must not be
+sent to one: any write to listings models pins the rest of that request
+to the primary, and ReplicaPinningMiddleware sets a cookie that keeps the
+client on the primary for PRIMARY_STICKY_SECONDS. That covers flows like
+initiating a payment and then listing or verifying it.
+
+Authentication and sessions always read the primary; they are loaded
+before the view body runs and belong to other apps anyway.
+
+Streamed responses are produced after the view returns, so their querysets
+must be bound to the replica with .using() while the view runs. Replica
+views read the cache through cached_read(): pinned requests skip it, and
+a miss computed on a replica only fills the short-lived in-process tier,
+never the shared one, whose entries would outlive the replica's lag.
+"""
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+PRIMARY = 'default'
+PIN_COOKIE = 'db_primary_until'
+REPLICA_APPS = {'listings'}
+
+
+class RequestState:
+    __slots__ = ('pinned', 'wrote')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = ContextVar('listings_routing_state', default=None)
+_replica = ContextVar('listings_replica', default=None)
+
+
+def replica_reads(view):
+    """
+    Let a read-only view read listings models from a replica
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        replicas = settings.DATABASE_REPLICAS
+        token = _replica.set(random.choice(replicas) if replicas else None)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _replica.reset(token)
+    return wrapped
+
+
+def reads_pinned():
+    """
+    Whether this request must read the primary: it wrote, or its client did recently
+    """
+    state = _state.get()
+    return state is not None and (state.pinned or state.wrote)
+
+
+def cached_read(cache, key, compute, group=None):
+    """
+    cache.get_or_set() for replica views, keeping replica results out of the shared tier
+    """
+    if reads_pinned():
+        return compute()
+    return cache.get_or_set(key, compute, group=group, share=_replica.get() is None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = _replica.get()
+        if replica is None or model._meta.app_label not in REPLICA_APPS:
+            return PRIMARY
+        return PRIMARY if reads_pinned() else replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label in REPLICA_APPS:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        return db not in settings.DATABASE_REPLICAS
+
+
+def pinned_until(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0))
+    except ValueError:
+        return 0
+
+
+class ReplicaPinningMiddleware:
+    """
+    Keep clients that wrote recently on the primary database
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RequestState(pinned=pinned_until(request) > time.time())
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.pin(state, response)
+
+    async def __acall__(self, request):
+        state = RequestState(pinned=pinned_until(request) > time.time())
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.pin(state, response)
+
+    def pin(self, state, response):
+        if state.wrote and settings.PRIMARY_STICKY_SECONDS > 0:
+            seconds = settings.PRIMARY_STICKY_SECONDS
+            response.set_cookie(
+                PIN_COOKIE, f'{time.time() + seconds:.3f}', max_age=seconds, httponly=True, samesite='Lax'
+            )
+        return response
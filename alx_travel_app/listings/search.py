@@ -0,0 +1,230 @@
+"""
+Full-text listing search
+
+Listings are searched through an inverted index instead of icontains
+scans. The backend is picked from the database vendor:
+
+- SQLite: an FTS5 table (listings_listing_fts) kept in sync from Listing
+  signals, ranked with bm25() and highlighted with snippet()
+- PostgreSQL: a GIN index over a weighted tsvector expression, ranked
+  with ts_rank and highlighted with ts_headline
+- anything else: the old icontains filter, so search keeps working
+"""
+import re
+from dataclasses import dataclass
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+from .models import Listing
+
+FTS_TABLE = 'listings_listing_fts'
+# The database wraps matches in private-use characters; highlight() swaps
+# them for <mark> tags only after the listing text around them is escaped
+HIGHLIGHT_START = '\ue000'
+HIGHLIGHT_END = '\ue001'
+
+_TERM = re.compile(r'\w+', re.UNICODE)
+
+
+@dataclass
+class SearchHit:
+    listing_id: int
+    rank: float
+    title: str = None
+    snippet: str = None
+
+
+def highlight(text):
+    """
+    HTML-escape database-highlighted text, marking its matches with <mark>
+    """
+    if text is None:
+        return None
+    return escape(text).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+
+
+def search_terms(query):
+    """
+    Split free text into index terms, dropping FTS query syntax
+    """
+    return _TERM.findall(query.lower())
+
+
+class IcontainsBackend:
+    """
+    Unindexed fallback: substring match on title, description and location
+    """
+    name = 'icontains'
+
+    def filter_queryset(self, queryset, query):
+        for term in search_terms(query):
+            queryset = queryset.filter(
+                Q(title__icontains=term) | Q(description__icontains=term) | Q(location__icontains=term)
+            )
+        return queryset
+
+    def search(self, query, limit, offset=0):
+        if not search_terms(query):
+            return []
+        ids = self.filter_queryset(Listing.objects.order_by('-created_at', '-id'), query)
+        ids = ids.values_list('id', flat=True)[offset:offset + limit]
+        return [SearchHit(listing_id=pk, rank=0.0) for pk in ids]
+
+    def index_listing(self, listing):
+        pass
+
+    def remove_listing(self, listing_id):
+        pass
+
+    def rebuild(self):
+        return Listing.objects.count()
+
+
+class SQLiteFTSBackend(IcontainsBackend):
+    """
+    SQLite FTS5 index with prefix matching on every term
+    """
+    name = 'sqlite-fts5'
+
+    # bm25 column weights for title, description, location
+    weights = (10.0, 1.0, 4.0)
+
+    def match_expression(self, query):
+        return ' '.join(f'"{term}"*' for term in search_terms(query))
+
+    def filter_queryset(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]
+        ))
+
+    def search(self, query, limit, offset=0):
+        match = self.match_expression(query)
+        if not match:
+            return []
+        weights = ', '.join(str(weight) for weight in self.weights)
+        sql = (
+            f'SELECT rowid, bm25({FTS_TABLE}, {weights}) AS score, '
+            f'highlight({FTS_TABLE}, 0, %s, %s), '
+            f"snippet({FTS_TABLE}, 1, %s, %s, '…', 16) "
+            f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY score LIMIT %s OFFSET %s'
+        )
+        params = [HIGHLIGHT_START, HIGHLIGHT_END, HIGHLIGHT_START, HIGHLIGHT_END, match, limit, offset]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            # bm25 scores are negative, lower is better; flip for clients
+            return [
+                SearchHit(listing_id=pk, rank=-score, title=highlight(title), snippet=highlight(snippet))
+                for pk, score, title, snippet in cursor.fetchall()
+            ]
+
+    def index_listing(self, listing):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [listing.pk])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description, location) VALUES (%s, %s, %s, %s)',
+                [listing.pk, listing.title, listing.description, listing.location],
+            )
+
+    def remove_listing(self, listing_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [listing_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description, location) '
+                f'SELECT id, title, description, location FROM {Listing._meta.db_table}'
+            )
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+            cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+            return cursor.fetchone()[0]
+
+
+class PostgresSearchBackend(IcontainsBackend):
+    """
+    PostgreSQL tsvector search over the expression indexed by migration 0005
+
+    The index tracks the listing columns itself, so no signal upkeep is
+    needed and rebuild only refreshes planner statistics.
+    """
+    name = 'postgres-tsvector'
+    config = 'english'
+
+    def vector(self):
+        from django.contrib.postgres.search import SearchVector
+
+        return (
+            SearchVector('title', weight='A', config=self.config)
+            + SearchVector('location', weight='B', config=self.config)
+            + SearchVector('description', weight='C', config=self.config)
+        )
+
+    def search_query(self, query):
+        from django.contrib.postgres.search import SearchQuery
+
+        terms = search_terms(query)
+        if not terms:
+            return None
+        return SearchQuery(' & '.join(f'{term}:*' for term in terms), config=self.config, search_type='raw')
+
+    def filter_queryset(self, queryset, query):
+        search_query = self.search_query(query)
+        if search_query is None:
+            return queryset
+        return queryset.annotate(search=self.vector()).filter(search=search_query)
+
+    def search(self, query, limit, offset=0):
+        from django.contrib.postgres.search import SearchHeadline, SearchRank
+
+        search_query = self.search_query(query)
+        if search_query is None:
+            return []
+        options = {'start_sel': HIGHLIGHT_START, 'stop_sel': HIGHLIGHT_END, 'config': self.config}
+        rows = (
+            Listing.objects.annotate(search=self.vector())
+            .filter(search=search_query)
+            .annotate(
+                rank=SearchRank(self.vector(), search_query),
+                title_highlight=SearchHeadline('title', search_query, highlight_all=True, **options),
+                snippet=SearchHeadline('description', search_query, max_words=16, min_words=8, **options),
+            )
+            .order_by('-rank', '-id')
+            .values_list('id', 'rank', 'title_highlight', 'snippet')[offset:offset + limit]
+        )
+        return [SearchHit(pk, rank, highlight(title), highlight(snippet)) for pk, rank, title, snippet in rows]
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Listing._meta.db_table}')
+        return Listing.objects.count()
+
+
+_fts5_support = {}
+
+
+def sqlite_has_fts5(conn):
+    if conn.alias not in _fts5_support:
+        with conn.cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            _fts5_support[conn.alias] = any(option == 'ENABLE_FTS5' for (option,) in cursor.fetchall())
+    return _fts5_support[conn.alias]
+
+
+def get_backend(conn=None):
+    """
+    Search backend for the given (default: current) database connection
+    """
+    conn = conn or connection
+    if conn.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    if conn.vendor == 'sqlite' and sqlite_has_fts5(conn):
+        return SQLiteFTSBackend()
+    return IcontainsBackend()
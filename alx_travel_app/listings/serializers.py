@@ -1,21 +1,117 @@
+from functools import lru_cache
+
 from rest_framework import serializers
-from .models import Listing, Booking, Payment
+from .metrics import TimedListSerializer, TimedSerializerMixin
+from .models import Listing, Booking, Payment, Review
+
+class InvalidFields(ValueError):
+    """
+    Raised when ?fields= names a field the serializer does not have
+    """
+
+class SparseFieldsMixin:
+    """
+    Render only the fields named by a fields=(...) keyword argument
+    """
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+@lru_cache(maxsize=None)
+def field_names(serializer_class):
+    return tuple(serializer_class().fields)
+
+def parse_fields(value, serializer_class):
+    """
+    The field names of a ?fields= value, in serializer order, or None for all
+    """
+    requested = {name.strip() for name in (value or '').split(',')} - {''}
+    if not requested:
+        return None
+    available = field_names(serializer_class)
+    unknown = requested.difference(available)
+    if unknown:
+        raise InvalidFields(f'Unknown fields: {", ".join(sorted(unknown))}')
+    return tuple(name for name in available if name in requested)
 
-class ListingSerializer(serializers.ModelSerializer):
+class ListingSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Listing
-        fields = '__all__'
+        # rating_avg and rating_count say all there is to say about it
+        exclude = ('rating_total',)
+        list_serializer_class = TimedListSerializer
+
+class ReviewSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Review as shown in a listing's feed; needs user to be select_related
+    """
+    user = serializers.CharField(source='user.username', read_only=True)
 
-class BookingSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Review
+        fields = ('id', 'user', 'rating', 'comment', 'created_at')
+        list_serializer_class = TimedListSerializer
+
+class AvailabilitySearchSerializer(serializers.Serializer):
+    """
+    Query parameters for the availability search
+    """
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    guests = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, data):
+        if data['end_date'] <= data['start_date']:
+            raise serializers.ValidationError('end_date must be after start_date')
+        return data
+
+class ListingSearchSerializer(serializers.Serializer):
+    """
+    Query parameters for full-text listing search
+    """
+    q = serializers.CharField(max_length=200)
+    offset = serializers.IntegerField(min_value=0, default=0)
+
+class BookingSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Booking
         fields = '__all__'
+        read_only_fields = ('user',)
+        list_serializer_class = TimedListSerializer
+
+    def validate(self, data):
+        if data['end_date'] <= data['start_date']:
+            raise serializers.ValidationError('end_date must be after start_date')
+        return data
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = '__all__'
         read_only_fields = ('payment_reference', 'created_at', 'updated_at', 'completed_at')
+        list_serializer_class = TimedListSerializer
+
+class ListingSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Listing
+        fields = ('id', 'title', 'location')
+
+class BookingSummarySerializer(serializers.ModelSerializer):
+    """
+    Booking as embedded in payment responses; needs booking__listing and
+    booking__user to be select_related
+    """
+    user = serializers.StringRelatedField()
+    listing = ListingSummarySerializer()
+
+    class Meta:
+        model = Booking
+        fields = ('id', 'user', 'listing', 'start_date', 'end_date', 'guests')
+
+class PaymentWithBookingSerializer(PaymentSerializer):
+    booking = BookingSummarySerializer(read_only=True)
 
 class PaymentInitiationSerializer(serializers.Serializer):
     """
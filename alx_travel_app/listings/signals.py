@@ -0,0 +1,115 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .availability import refresh_occupancy
+from .cache import invalidate_listing, invalidate_reviews
+from .models import Booking, Listing, Review
+from .ratings import adjust_rating
+from .search import get_backend as get_search_backend
+
+
+@receiver(pre_save, sender=Booking)
+def remember_booking_dates(sender, instance, **kwargs):
+    """
+    Keep the stored dates of an edited booking so its old nights get freed
+    """
+    instance._previous_dates = None
+    if instance.pk:
+        instance._previous_dates = (
+            Booking.objects.filter(pk=instance.pk)
+            .values_list('listing_id', 'start_date', 'end_date')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Booking)
+def update_occupancy_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_dates', None)
+    if previous and previous != (instance.listing_id, instance.start_date, instance.end_date):
+        refresh_occupancy(*previous)
+    refresh_occupancy(instance.listing_id, instance.start_date, instance.end_date)
+
+
+@receiver(post_delete, sender=Booking)
+def update_occupancy_on_delete(sender, instance, **kwargs):
+    refresh_occupancy(instance.listing_id, instance.start_date, instance.end_date)
+
+
+@receiver(post_save, sender=Listing)
+def index_listing_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    get_search_backend().index_listing(instance)
+
+
+@receiver(post_delete, sender=Listing)
+def remove_listing_from_index(sender, instance, **kwargs):
+    get_search_backend().remove_listing(instance.pk)
+
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def invalidate_listing_cache(sender, instance, **kwargs):
+    # Again after commit, in case a reader cached the old row in between
+    invalidate_listing(instance.pk)
+    transaction.on_commit(lambda: invalidate_listing(instance.pk))
+
+
+@receiver(post_delete, sender=Listing)
+def invalidate_review_feed_of_deleted_listing(sender, instance, **kwargs):
+    # Its reviews' own signals cover any it had; this covers an empty feed
+    invalidate_reviews(instance.pk)
+    transaction.on_commit(lambda: invalidate_reviews(instance.pk))
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    """
+    Keep the stored listing and rating of an edited review to take them back out
+    """
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = (
+            Review.objects.filter(pk=instance.pk).values_list('listing_id', 'rating').first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    if previous is None:
+        adjust_rating(instance.listing_id, instance.rating, 1)
+    elif previous[0] != instance.listing_id:
+        adjust_rating(previous[0], -previous[1], -1)
+        adjust_rating(instance.listing_id, instance.rating, 1)
+    elif previous[1] != instance.rating:
+        adjust_rating(instance.listing_id, instance.rating - previous[1], 0)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    adjust_rating(instance.listing_id, -instance.rating, -1)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review_cache(sender, instance, **kwargs):
+    """
+    Drop the cached feed of the review's listing, and of the one it moved from
+    """
+    listing_ids = {instance.listing_id}
+    previous = getattr(instance, '_previous_rating', None)
+    if previous:
+        listing_ids.add(previous[0])
+
+    def invalidate():
+        for listing_id in listing_ids:
+            invalidate_reviews(listing_id)
+
+    invalidate()
+    transaction.on_commit(invalidate)
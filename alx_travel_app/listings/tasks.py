@@ -1,8 +1,35 @@
+import logging
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
 from celery import shared_task
-from django.core.mail import send_mail
+from django.core.cache import cache
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
 from django.utils import timezone
-from .models import Payment, Booking
+from .models import Payment, PaymentEvent, Booking
+from .chapa import get_client as get_chapa_client
+from .notifications import BUILDERS, deliver, load_payments
+from .outbox import enqueue_many
+from .payments import VERIFY_FIELDS, apply_verifications, notification_calls, verify_many
+from .webhooks import KICK_KEY
+
+logger = logging.getLogger(__name__)
+
+UPDATE_CHUNK_SIZE = 500
+
+
+def send_notification(kind, payment_id):
+    payment = load_payments([payment_id]).get(payment_id)
+    if payment is None:
+        return f"Payment with ID {payment_id} not found"
+    email = payment.booking.user.email
+    if deliver([(payment_id, BUILDERS[kind](payment))]):
+        return f"Error sending email to {email}"
+    return f"Payment {kind} email sent to {email}"
 
 
 @shared_task
@@ -10,48 +37,7 @@ def send_payment_confirmation_email(payment_id):
     """
     Send payment confirmation email to user
     """
-    try:
-        payment = Payment.objects.get(id=payment_id)
-        booking = payment.booking
-        user = booking.user
-        listing = booking.listing
-        
-        subject = f'Payment Confirmation - Booking for {listing.title}'
-        message = f"""
-        Dear {user.username},
-        
-        Your payment has been successfully processed!
-        
-        Booking Details:
-        - Property: {listing.title}
-        - Location: {listing.location}
-        - Check-in: {booking.start_date}
-        - Check-out: {booking.end_date}
-        - Guests: {booking.guests}
-        - Amount Paid: {payment.amount} {payment.currency}
-        - Payment Reference: {payment.payment_reference}
-        - Transaction ID: {payment.chapa_transaction_id}
-        
-        Thank you for choosing ALX Travel!
-        
-        Best regards,
-        ALX Travel Team
-        """
-        
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            fail_silently=False,
-        )
-        
-        return f"Payment confirmation email sent to {user.email}"
-        
-    except Payment.DoesNotExist:
-        return f"Payment with ID {payment_id} not found"
-    except Exception as e:
-        return f"Error sending email: {str(e)}"
+    return send_notification('confirmation', payment_id)
 
 
 @shared_task
@@ -59,45 +45,197 @@ def send_payment_failure_email(payment_id):
     """
     Send payment failure notification email to user
     """
-    try:
-        payment = Payment.objects.get(id=payment_id)
-        booking = payment.booking
-        user = booking.user
-        listing = booking.listing
-        
-        subject = f'Payment Failed - Booking for {listing.title}'
-        message = f"""
-        Dear {user.username},
-        
-        Unfortunately, your payment could not be processed.
-        
-        Booking Details:
-        - Property: {listing.title}
-        - Location: {listing.location}
-        - Check-in: {booking.start_date}
-        - Check-out: {booking.end_date}
-        - Guests: {booking.guests}
-        - Amount: {payment.amount} {payment.currency}
-        - Payment Reference: {payment.payment_reference}
-        - Failure Reason: {payment.failure_reason or 'Unknown'}
-        
-        Please try again or contact our support team for assistance.
-        
-        Best regards,
-        ALX Travel Team
-        """
-        
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            fail_silently=False,
+    return send_notification('failure', payment_id)
+
+
+# Single-email tasks the outbox relay folds into send_payment_emails
+EMAIL_TASK_KINDS = {
+    send_payment_confirmation_email.name: 'confirmation',
+    send_payment_failure_email.name: 'failure',
+}
+
+
+@shared_task(bind=True, max_retries=settings.EMAIL_MAX_RETRIES)
+def send_payment_emails(self, calls):
+    """
+    Send a batch of payment emails over one SMTP connection
+
+    calls are [task name, [payment_id]] pairs collected by the outbox relay
+    (see OUTBOX_BATCHED_TASKS). Payments are loaded in one query, and only
+    the messages that failed are retried.
+    """
+    payments = load_payments({args[0] for _, args in calls})
+    messages = []
+    for index, (name, args) in enumerate(calls):
+        payment = payments.get(args[0])
+        if payment is None:
+            logger.warning('Payment %s not found, dropping %s', args[0], name)
+            continue
+        messages.append((index, BUILDERS[EMAIL_TASK_KINDS[name]](payment)))
+
+    failed = deliver(messages)
+    if failed:
+        raise self.retry(
+            args=[[calls[index] for index in failed]],
+            countdown=settings.EMAIL_RETRY_BACKOFF * 2 ** self.request.retries
         )
-        
-        return f"Payment failure email sent to {user.email}"
-        
-    except Payment.DoesNotExist:
-        return f"Payment with ID {payment_id} not found"
-    except Exception as e:
-        return f"Error sending email: {str(e)}"
+    return len(messages)
+
+
+def payment_references(tx_refs):
+    refs = set()
+    for tx_ref in tx_refs:
+        try:
+            refs.add(uuid.UUID(tx_ref))
+        except ValueError:
+            pass
+    return refs
+
+
+def save_verified(changed):
+    """
+    Write verified payments that are still pending and queue their emails
+    in the outbox; returns the payments saved
+
+    Payments with the same outcome share one UPDATE per chunk, which is far
+    cheaper than bulk_update's per-row CASE expressions. The row locks make a
+    concurrent verify_payment for the same payment win or lose cleanly
+    instead of having its result overwritten.
+    """
+    with transaction.atomic():
+        still_pending = set(
+            Payment.objects.select_for_update()
+            .filter(pk__in=[payment.pk for payment in changed], status='pending')
+            .values_list('pk', flat=True)
+        )
+        changed = [payment for payment in changed if payment.pk in still_pending]
+        outcomes = defaultdict(list)
+        for payment in changed:
+            outcomes[tuple(getattr(payment, field) for field in VERIFY_FIELDS)].append(payment.pk)
+        for values, ids in outcomes.items():
+            for start in range(0, len(ids), UPDATE_CHUNK_SIZE):
+                Payment.objects.filter(pk__in=ids[start:start + UPDATE_CHUNK_SIZE]).update(
+                    **dict(zip(VERIFY_FIELDS, values))
+                )
+        enqueue_many(notification_calls(changed))
+    return changed
+
+
+@shared_task
+def process_payment_events(batch_size=None):
+    """
+    Verify the payments named by stored Chapa events and apply the results in batches
+    """
+    lock_key = 'payment-events:lock'
+    if not cache.add(lock_key, 1, settings.PAYMENT_EVENT_LOCK_TIMEOUT):
+        return "Payment events are already being processed"
+    # Events stored from now on must queue another run
+    cache.delete(KICK_KEY)
+
+    batch_size = batch_size or settings.PAYMENT_EVENT_BATCH_SIZE
+    last_id = 0
+    processed = updated = 0
+    try:
+        while True:
+            events = list(
+                PaymentEvent.objects.filter(
+                    id__gt=last_id,
+                    processed_at__isnull=True,
+                    attempts__lt=settings.PAYMENT_EVENT_MAX_ATTEMPTS
+                ).order_by('id').values_list('id', 'tx_ref')[:batch_size]
+            )
+            if not events:
+                break
+            last_id = events[-1][0]
+
+            # Repeated callbacks for one payment cost a single verify call
+            payments = list(Payment.objects.filter(
+                payment_reference__in=payment_references(tx_ref for _, tx_ref in events),
+                status='pending'
+            ))
+            results = verify_many(get_chapa_client(), payments, settings.PAYMENT_VERIFY_CONCURRENCY)
+            unreachable = {str(payment.payment_reference) for payment, response in results if response is None}
+            changed = save_verified(apply_verifications(results))
+
+            retry = [event_id for event_id, tx_ref in events if tx_ref in unreachable]
+            PaymentEvent.objects.filter(id__in=[event_id for event_id, _ in events]).exclude(
+                id__in=retry
+            ).update(processed_at=timezone.now())
+            PaymentEvent.objects.filter(id__in=retry).update(attempts=F('attempts') + 1)
+            processed += len(events)
+            updated += len(changed)
+    finally:
+        cache.delete(lock_key)
+    return f"Processed {processed} payment events, updated {updated} payments"
+
+
+def expire_abandoned_payments(cutoff):
+    """
+    Cancel every payment still pending since before cutoff in one UPDATE
+    """
+    return Payment.objects.filter(status='pending', created_at__lt=cutoff).update(
+        status='cancelled',
+        failure_reason='Expired: no payment received',
+        updated_at=timezone.now()
+    )
+
+
+def stale_pending_payments(since, until, chunk_size):
+    """
+    Yield lists of pending payments created in [since, until), oldest first
+
+    Walks payment_status_created_idx with a keyset on (created_at, id), so
+    only one chunk is in memory however many payments are pending.
+    """
+    queryset = Payment.objects.filter(
+        status='pending', created_at__gte=since, created_at__lt=until
+    ).only(
+        'id', 'payment_reference', 'chapa_transaction_id', 'created_at', *VERIFY_FIELDS
+    ).order_by('created_at', 'id')
+    last = None
+    while True:
+        page = queryset
+        if last is not None:
+            page = page.filter(
+                Q(created_at__gt=last.created_at) | Q(created_at=last.created_at, id__gt=last.id)
+            )
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]
+
+
+@shared_task
+def reconcile_pending_payments(chunk_size=None):
+    """
+    Verify payments left pending with Chapa and expire abandoned ones
+    """
+    lock_key = 'payment-reconciliation:lock'
+    if not cache.add(lock_key, 1, settings.PAYMENT_RECONCILE_LOCK_TIMEOUT):
+        return {'skipped': 'already running'}
+
+    started = time.perf_counter()
+    now = timezone.now()
+    cutoff = now - timedelta(minutes=settings.PAYMENT_EXPIRE_AFTER_MINUTES)
+    report = {'checked': 0, 'updated': 0, 'unreachable': 0}
+    try:
+        report['expired'] = expire_abandoned_payments(cutoff)
+        client = get_chapa_client()
+        for chunk in stale_pending_payments(
+            cutoff,
+            now - timedelta(minutes=settings.PAYMENT_RECONCILE_AFTER_MINUTES),
+            chunk_size or settings.PAYMENT_RECONCILE_CHUNK_SIZE
+        ):
+            results = verify_many(client, chunk, settings.PAYMENT_VERIFY_CONCURRENCY)
+            changed = save_verified(apply_verifications(results))
+            report['checked'] += len(chunk)
+            report['updated'] += len(changed)
+            report['unreachable'] += sum(response is None for _, response in results)
+    finally:
+        cache.delete(lock_key)
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    report['per_second'] = round(report['checked'] / report['seconds'], 1) if report['seconds'] else 0.0
+    logger.info('Payment reconciliation: %s', report)
+    return report
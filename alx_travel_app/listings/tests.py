@@ -1,3 +1,1317 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+import smtplib
+import threading
+import time
+from unittest import mock
+
+from celery import current_app
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.mail.backends import locmem
+import requests
+from django.db import connection, connections, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .availability import naive_available_listings
+from .benchmarks import booking_stress
+from .cache import TwoTierCache, listing_cache
+from .chapa import ChapaClient, reset_client
+from .chapa_stub import ChapaStubServer
+from .fastpath import compile_serializer
+from .metrics import (
+    CHAPA_SECONDS,
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    COUNT,
+    DB_SECONDS,
+    QUERIES,
+    REGISTRY,
+    SECONDS,
+    SERIALIZER_SECONDS,
+    RequestSample
+)
+from .management.commands.bench_api import listing_route_names
+from .models import Booking, Listing, ListingOccupancy, OutboxMessage, Payment, PaymentEvent, Review
+from .notifications import compiled, load_payments, render_message
+from .outbox import relay, stats as outbox_stats
+from .payments import initialize_payload, save_with_notification
+from .ratings import recompute_ratings
+from .routing import PIN_COOKIE
+from .serializers import ListingSerializer, PaymentSerializer, PaymentWithBookingSerializer
+from .sqlite import apply_profile
+from .tasks import (
+    process_payment_events,
+    reconcile_pending_payments,
+    send_payment_confirmation_email,
+    send_payment_emails
+)
+from .webhooks import sign
+
+User = get_user_model()
+
+
+def clear_caches():
+    cache.clear()
+    listing_cache.local.clear()
+
+
+def make_listings(owner, count, **overrides):
+    listings = [
+        Listing(
+            title=f'Listing {i}',
+            description='A place to stay.',
+            location='Addis Ababa',
+            price_per_night='100.00',
+            owner=owner,
+            **overrides
+        )
+        for i in range(count)
+    ]
+    return Listing.objects.bulk_create(listings)
+
+
+class ListingPaginationTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.owner = User.objects.create_user(username='owner', password='password')
+        make_listings(self.owner, 25)
+        # Force ties on created_at so ordering has to fall back to id
+        Listing.objects.filter(id__lte=10).update(created_at=timezone.now())
+
+    def test_pages_cover_every_listing_once(self):
+        seen = []
+        url = '/listings/?page_size=7'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(set(seen), set(Listing.objects.values_list('id', flat=True)))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/listings/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+
+    def test_stream_returns_all_rows_as_json_array(self):
+        response = self.client.get('/listings/?stream=1')
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(body), 25)
+
+    def test_sparse_fieldsets(self):
+        seen = []
+        url = '/listings/?page_size=10&fields=title,location'
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                page = self.client.get(url).json()
+                self.assertTrue(all(set(item) == {'title', 'location'} for item in page['results']))
+                seen += page['results']
+                url = page['next']
+        self.assertEqual(len(seen), 25)
+        # Neither the description nor a deferred field loaded row by row
+        self.assertEqual(len(queries), 3)
+        self.assertNotIn('description', queries[0]['sql'])
+
+        body = json.loads(b''.join(self.client.get('/listings/?stream=1&fields=id').streaming_content))
+        self.assertEqual(body[0], {'id': body[0]['id']})
+        listing = self.client.get(f"/listings/{body[0]['id']}/?fields=price_per_night,id")
+        self.assertEqual(list(listing.json()), ['id', 'price_per_night'])
+        self.assertNotEqual(listing['ETag'], self.client.get(f"/listings/{body[0]['id']}/")['ETag'])
+        self.assertEqual(self.client.get('/listings/?fields=title,secret').status_code, 400)
+
+
+class AvailabilitySearchTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.owner = User.objects.create_user(username='owner', password='password')
+        self.guest = User.objects.create_user(username='guest', password='password')
+        self.free, self.busy, self.small = make_listings(self.owner, 3)
+        self.small.max_guests = 2
+        self.small.save()
+        self.booking = Booking.objects.create(
+            listing=self.busy, user=self.guest,
+            start_date=date(2025, 3, 10), end_date=date(2025, 3, 15), guests=2
+        )
+
+    def search(self, start, end, guests=None):
+        params = {'start_date': start, 'end_date': end}
+        if guests:
+            params['guests'] = guests
+        response = self.client.get('/listings/available/', params)
+        self.assertEqual(response.status_code, 200)
+        return {item['id'] for item in response.data['results']}
+
+    def test_booked_nights_are_excluded(self):
+        self.assertEqual(self.search('2025-03-12', '2025-03-13'), {self.free.id, self.small.id})
+        # Check-out day is free for the next guest
+        self.assertIn(self.busy.id, self.search('2025-03-15', '2025-03-18'))
+        self.assertIn(self.busy.id, self.search('2025-03-01', '2025-03-10'))
+
+    def test_guest_count_respects_max_guests(self):
+        self.assertEqual(self.search('2025-04-01', '2025-04-03', guests=4), {self.free.id, self.busy.id})
+
+    def test_index_follows_booking_moves_and_deletes(self):
+        self.booking.start_date = date(2025, 6, 1)
+        self.booking.end_date = date(2025, 6, 3)
+        self.booking.save()
+        self.assertIn(self.busy.id, self.search('2025-03-12', '2025-03-13'))
+        self.assertNotIn(self.busy.id, self.search('2025-06-02', '2025-06-05'))
+
+        self.booking.delete()
+        self.assertIn(self.busy.id, self.search('2025-06-02', '2025-06-05'))
+
+    def test_matches_naive_overlap_query(self):
+        ranges = [('2025-03-09', '2025-03-11'), ('2025-03-14', '2025-03-20'), ('2025-02-01', '2025-02-02')]
+        for start, end in ranges:
+            naive = set(naive_available_listings(
+                Listing.objects.all(), date.fromisoformat(start), date.fromisoformat(end)
+            ))
+            self.assertEqual(self.search(start, end), naive)
+
+    def test_listing_delete_leaves_no_occupancy(self):
+        self.busy.delete()
+        self.assertFalse(ListingOccupancy.objects.filter(listing_id=self.booking.listing_id).exists())
+
+    def test_invalid_range_is_rejected(self):
+        response = self.client.get('/listings/available/', {'start_date': '2025-03-10', 'end_date': '2025-03-10'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BookingCreationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.owner = User.objects.create_user(username='owner', password='password')
+        self.guest = User.objects.create_user(username='guest', password='password')
+        self.listing = make_listings(self.owner, 1)[0]
+        self.client.force_authenticate(self.guest)
+
+    def book(self, start, end):
+        return self.client.post('/bookings/', {
+            'listing': self.listing.id, 'start_date': start, 'end_date': end, 'guests': 2
+        })
+
+    def test_overlapping_booking_is_rejected(self):
+        self.assertEqual(self.book('2025-05-01', '2025-05-05').status_code, 201)
+        self.assertEqual(self.book('2025-05-04', '2025-05-08').status_code, 409)
+        self.assertEqual(self.book('2025-05-05', '2025-05-08').status_code, 201)
+
+    def test_empty_range_is_rejected(self):
+        self.assertEqual(self.book('2025-05-01', '2025-05-01').status_code, 400)
+
+
+class BookingConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        owner = User.objects.create_user(username='owner')
+        self.users = [User.objects.create_user(username=f'writer-{i}') for i in range(32)]
+        self.listings = make_listings(owner, 2)
+
+    def test_concurrent_writers_never_double_book(self):
+        for writers in (8, 32):
+            Booking.objects.all().delete()
+            result = booking_stress(self.listings, self.users, writers, attempts=10, days=20)
+            self.assertEqual(result['overlaps'], 0, result)
+            self.assertGreater(result['created'], 0)
+            self.assertGreater(result['conflicts'], 0)
+
+
+class ListingSearchTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        owner = User.objects.create_user(username='owner', password='password')
+        self.lake = Listing.objects.create(
+            title='Lakeside cabin', description='Wooden cabin with a sauna.',
+            location='Bahir Dar', price_per_night='80.00', owner=owner,
+        )
+        self.city = Listing.objects.create(
+            title='City apartment', description='Walk to the lakeside promenade and markets.',
+            location='Hawassa', price_per_night='60.00', owner=owner,
+        )
+
+    def search(self, q):
+        response = self.client.get('/listings/search/', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_prefix_terms_match_and_title_hits_rank_first(self):
+        results = self.search('lakesi')
+        self.assertEqual([item['id'] for item in results], [self.lake.id, self.city.id])
+        self.assertIn('<mark>', results[0]['search']['title'])
+        self.assertIn('<mark>', results[1]['search']['snippet'])
+
+    def test_index_tracks_listing_changes(self):
+        self.lake.title = 'Mountain chalet'
+        self.lake.description = 'Fireplace and views.'
+        self.lake.save()
+        self.assertEqual([item['id'] for item in self.search('lakeside')], [self.city.id])
+        self.assertEqual([item['id'] for item in self.search('chalet')], [self.lake.id])
+
+        self.city.delete()
+        self.assertEqual(self.search('lakeside'), [])
+
+    def test_query_syntax_is_treated_as_text(self):
+        self.assertEqual(self.search('"cabin" OR NEAR('), [])
+        self.assertEqual(len(self.search('cabin sauna')), 1)
+
+    def test_highlights_escape_listing_markup(self):
+        self.lake.title = '<script>alert(1)</script> Lakeside cabin'
+        self.lake.description = 'Sauna <img src=x onerror=alert(1)> included.'
+        self.lake.save()
+        hit = self.search('script sauna')[0]['search']
+        self.assertEqual(
+            hit['title'], '&lt;<mark>script</mark>&gt;alert(1)&lt;/<mark>script</mark>&gt; Lakeside cabin'
+        )
+        self.assertNotIn('<img', hit['snippet'])
+        self.assertIn('<mark>Sauna</mark> &lt;img', hit['snippet'])
+
+
+class ListingCacheTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.owner = User.objects.create_user(username='owner', password='password')
+        self.listing = Listing.objects.create(
+            title='Garden villa', description='Quiet garden.', location='Gondar',
+            price_per_night='90.00', owner=self.owner,
+        )
+
+    def test_detail_is_served_from_cache_until_listing_changes(self):
+        self.assertEqual(self.client.get(f'/listings/{self.listing.id}/').data['title'], 'Garden villa')
+        with self.assertNumQueries(0):
+            self.client.get(f'/listings/{self.listing.id}/')
+
+        self.listing.title = 'Garden house'
+        self.listing.save()
+        self.assertEqual(self.client.get(f'/listings/{self.listing.id}/').data['title'], 'Garden house')
+
+    def test_list_pages_are_invalidated_by_listing_writes(self):
+        self.assertEqual(len(self.client.get('/listings/').data['results']), 1)
+        with self.assertNumQueries(0):
+            self.client.get('/listings/')
+
+        Listing.objects.create(
+            title='Hill cabin', description='Views.', location='Gondar',
+            price_per_night='50.00', owner=self.owner,
+        )
+        self.assertEqual(len(self.client.get('/listings/').data['results']), 2)
+        self.listing.delete()
+        self.assertEqual(len(self.client.get('/listings/').data['results']), 1)
+
+    def test_stats_require_admin(self):
+        self.assertIn(self.client.get('/listings/cache/stats/').status_code, (401, 403))
+        admin = User.objects.create_superuser(username='admin', password='password')
+        self.client.force_authenticate(admin)
+        response = self.client.get('/listings/cache/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('evictions', response.data['local'])
+
+
+class TwoTierCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cache = TwoTierCache('test', local_maxsize=2, local_ttl=60, ttl=60)
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'value'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.cache.get_or_set('hot', compute)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_lru_evicts_and_counts(self):
+        for key in ('a', 'b', 'c'):
+            self.cache.get_or_set(key, lambda: key)
+        stats = self.cache.stats()
+        self.assertEqual(stats['local']['size'], 2)
+        self.assertEqual(stats['local']['evictions'], 1)
+        # Evicted locally but still in the shared tier
+        self.assertEqual(self.cache.get_or_set('a', lambda: 'recomputed'), 'a')
+        self.assertEqual(self.cache.stats()['shared_hits'], 1)
+
+    def test_invalidate_bumps_version(self):
+        self.cache.get_or_set('k', lambda: 'old')
+        self.cache.invalidate('k')
+        self.assertEqual(self.cache.get_or_set('k', lambda: 'new'), 'new')
+
+    def test_waiter_that_gives_up_keeps_the_holders_lock(self):
+        self.cache.lock_timeout = 0.1
+        cache.set('test:k:0:k:lock', 'holder', 60)
+        self.assertEqual(self.cache.get_or_set('k', lambda: 'value'), 'value')
+        self.assertEqual(cache.get('test:k:0:k:lock'), 'holder')
+
+    def test_invalidate_during_compute_is_not_cached_locally(self):
+        def compute():
+            # A write lands while the old rows are being serialized
+            self.cache.invalidate('k')
+            return 'old'
+
+        self.assertEqual(self.cache.get_or_set('k', compute), 'old')
+        self.assertEqual(self.cache.get_or_set('k', lambda: 'new'), 'new')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='guest', password='password')
+        self.listing = make_listings(self.user, 1)[0]
+        booking = Booking.objects.create(
+            listing=self.listing, user=self.user,
+            start_date=date(2025, 1, 1), end_date=date(2025, 1, 3), guests=1,
+        )
+        self.payment = Payment.objects.create(booking=booking, amount='200.00')
+        self.client.force_authenticate(self.user)
+
+    def test_listing_etag_changes_with_version(self):
+        url = f'/listings/{self.listing.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.listing.price_per_night = '120.00'
+        self.listing.save()
+        self.assertEqual(self.listing.version, 2)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_listing_etag_changes_on_partial_save(self):
+        url = f'/listings/{self.listing.id}/'
+        etag = self.client.get(url)['ETag']
+
+        self.listing.title = 'Renamed'
+        self.listing.save(update_fields=['title'])
+        self.assertEqual(self.listing.version, 2)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_payment_status_answers_304_without_serializing(self):
+        url = f'/payments/{self.payment.payment_reference}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+        )
+
+    def test_user_payments_revalidates_after_change(self):
+        etag = self.client.get('/payments/user/')['ETag']
+        self.assertEqual(self.client.get('/payments/user/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Payment.objects.filter(pk=self.payment.pk).update(updated_at=timezone.now() + timedelta(seconds=5))
+        self.assertEqual(self.client.get('/payments/user/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class PaymentQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='guest', password='password')
+        self.listing = make_listings(self.user, 1)[0]
+        self.client.force_authenticate(self.user)
+        self.days = 0
+
+    def add_payments(self, count):
+        payments = []
+        for _ in range(count):
+            start = date(2025, 1, 1) + timedelta(days=self.days)
+            self.days += 2
+            booking = Booking.objects.create(
+                listing=self.listing, user=self.user, guests=1,
+                start_date=start, end_date=start + timedelta(days=1),
+            )
+            payments.append(Payment.objects.create(booking=booking, amount='100.00'))
+        return payments
+
+    def test_user_payments_query_count_is_constant(self):
+        self.add_payments(2)
+        # Summary for the ETag, then one page with bookings, listings and users joined
+        with self.assertNumQueries(2):
+            small = self.client.get('/payments/user/', {'include': 'booking'})
+        self.add_payments(30)
+        with self.assertNumQueries(2):
+            large = self.client.get('/payments/user/', {'include': 'booking', 'page_size': 50})
+        self.assertEqual(len(small.data['results']), 2)
+        self.assertEqual(len(large.data['results']), 32)
+        booking = large.data['results'][0]['booking']
+        self.assertEqual(booking['user'], 'guest')
+        self.assertEqual(booking['listing']['title'], self.listing.title)
+
+    def test_user_payments_keyset_pages(self):
+        payments = self.add_payments(5)
+        first = self.client.get('/payments/user/', {'page_size': 3})
+        second = self.client.get(first.data['next'])
+        references = [p['payment_reference'] for p in first.data['results'] + second.data['results']]
+        self.assertEqual(references, [str(p.payment_reference) for p in reversed(payments)])
+        self.assertIsNone(second.data['next'])
+
+    def test_payment_status_with_booking_summary_is_one_query(self):
+        payment = self.add_payments(1)[0]
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/payments/{payment.payment_reference}/', {'include': 'booking'})
+        self.assertEqual(response.data['booking']['id'], payment.booking_id)
+        self.assertEqual(response.data['booking']['listing']['location'], self.listing.location)
+
+
+class ChapaClientTests(TestCase):
+    def setUp(self):
+        self.stub = ChapaStubServer().start()
+        self.addCleanup(self.stub.stop)
+        self.client = ChapaClient(self.stub.base_url, 'secret', read_timeout=0.5, backoff=0.01)
+        self.addCleanup(self.client.close)
+
+    def test_calls_reuse_one_keep_alive_connection(self):
+        for i in range(5):
+            self.assertEqual(self.client.verify(f'ref-{i}').status_code, 200)
+        self.assertEqual(self.stub.connections, 1)
+        self.assertEqual(self.client.stats_snapshot()['verify']['calls'], 5)
+
+    def test_verify_is_retried_but_initialize_is_not(self):
+        self.stub.fail_next = 2
+        self.assertEqual(self.client.verify('ref').status_code, 200)
+        self.assertEqual(self.client.stats_snapshot()['verify']['retries'], 2)
+
+        self.stub.fail_next = 1
+        self.assertEqual(self.client.initialize({'tx_ref': 'abc'}).status_code, 503)
+        self.assertEqual(len([r for r in self.stub.requests if r[0] == 'POST']), 1)
+
+    def test_slow_responses_time_out(self):
+        self.stub.latency = 1
+        with self.assertRaises(requests.Timeout):
+            self.client.initialize({'tx_ref': 'abc'})
+        self.assertEqual(self.client.stats_snapshot()['initialize']['errors'], 1)
+
+
+class PaymentFlowTests(TestCase):
+    def setUp(self):
+        self.stub = ChapaStubServer().start()
+        self.addCleanup(self.stub.stop)
+        settings_override = override_settings(CHAPA_BASE_URL=self.stub.base_url, CHAPA_RETRY_BACKOFF=0.01)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        reset_client()
+        self.addCleanup(reset_client)
+        clear_caches()
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='guest', password='password', email='guest@example.com')
+        listing = make_listings(self.user, 1)[0]
+        self.booking = Booking.objects.create(
+            listing=listing, user=self.user,
+            start_date=date(2025, 1, 1), end_date=date(2025, 1, 3), guests=1,
+        )
+        self.client.force_authenticate(self.user)
+
+    def initiate(self, amount='200.00', **extra):
+        return self.client.post('/payments/initiate/', {
+            'booking_id': self.booking.id, 'amount': amount, 'currency': 'ETB',
+            'email': 'guest@example.com', 'first_name': 'Test', 'last_name': 'Guest',
+            'phone_number': '0911000000',
+        }, format='json', **extra)
+
+    def test_initiate_stores_chapa_checkout(self):
+        response = self.initiate()
+        self.assertEqual(response.status_code, 201)
+        payment = Payment.objects.get(booking=self.booking)
+        self.assertEqual(payment.chapa_checkout_url, f'https://checkout.chapa.test/{payment.payment_reference}')
+        self.assertEqual(payment.chapa_transaction_id, f'chapa-{payment.payment_reference}')
+
+    def test_chapa_time_is_attributed_to_view(self):
+        REGISTRY.reset()
+        self.addCleanup(REGISTRY.reset)
+        self.initiate()
+        row = REGISTRY.totals().rows[('initiate-payment', 'POST')]
+        self.assertGreater(row[CHAPA_SECONDS], 0)
+        self.assertLess(row[CHAPA_SECONDS], row[SECONDS])
+
+    def test_unreachable_chapa_returns_502(self):
+        self.stub.stop()
+        response = self.initiate()
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(Payment.objects.get(booking=self.booking).status, 'failed')
+
+    def test_idempotency_key_replays_first_response(self):
+        first = self.initiate(HTTP_IDEMPOTENCY_KEY='retry-1')
+        retry = self.initiate(HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Content-Type'], first['Content-Type'])
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(len(self.stub.requests), 1)
+
+    def test_idempotency_key_reused_for_other_body_is_rejected(self):
+        self.initiate(HTTP_IDEMPOTENCY_KEY='retry-1')
+        response = self.initiate(amount='300.00', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(len(self.stub.requests), 1)
+
+
+    @override_settings(IDEMPOTENCY_LOCK_TIMEOUT=1)
+    def test_expired_idempotency_lock_is_left_to_its_new_owner(self):
+        digest = hashlib.sha256(b'slow-1').hexdigest()
+        lock_key = f'idempotency:{self.user.pk}:/payments/initiate/:{digest}:lock'
+
+        def outlive_lock(*args, **kwargs):
+            # The lock expired mid-view and a duplicate took it
+            cache.set(lock_key, 'duplicate')
+            return initialize_payload(*args, **kwargs)
+
+        with mock.patch('listings.views.initialize_payload', side_effect=outlive_lock):
+            self.assertEqual(self.initiate(HTTP_IDEMPOTENCY_KEY='slow-1').status_code, 201)
+        self.assertEqual(cache.get(lock_key), 'duplicate')
+
+
+class IdempotentPaymentConcurrencyTests(TransactionTestCase):
+    def test_concurrent_duplicates_wait_for_first_request(self):
+        clear_caches()
+        user = User.objects.create_user(username='guest', password='password')
+        booking = Booking.objects.create(
+            listing=make_listings(user, 1)[0], user=user,
+            start_date=date(2025, 1, 1), end_date=date(2025, 1, 3), guests=1,
+        )
+        responses = []
+
+        def post():
+            client = APIClient()
+            client.force_authenticate(user)
+            responses.append(client.post('/payments/initiate/', {
+                'booking_id': booking.id, 'amount': '200.00', 'currency': 'ETB',
+                'email': 'guest@example.com', 'first_name': 'Test', 'last_name': 'Guest',
+                'phone_number': '0911000000',
+            }, format='json', HTTP_IDEMPOTENCY_KEY='double-click'))
+
+        with ChapaStubServer(latency=0.3) as stub, override_settings(CHAPA_BASE_URL=stub.base_url):
+            reset_client()
+            self.addCleanup(reset_client)
+            threads = [threading.Thread(target=post) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(stub.requests), 1)
+        self.assertEqual([r.status_code for r in responses], [201] * 4)
+        self.assertEqual(len({r.content for r in responses}), 1)
+        self.assertEqual(Payment.objects.count(), 1)
+
+
+@override_settings(CHAPA_WEBHOOK_SECRET='webhook-secret', CHAPA_RETRY_BACKOFF=0.01)
+class ChapaWebhookTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.stub = ChapaStubServer().start()
+        self.addCleanup(self.stub.stop)
+        settings_override = override_settings(CHAPA_BASE_URL=self.stub.base_url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        reset_client()
+        self.addCleanup(reset_client)
+
+        user = User.objects.create_user(username='guest', password='password')
+        listing = make_listings(user, 1)[0]
+        self.payments = [
+            Payment.objects.create(
+                booking=Booking.objects.create(
+                    listing=listing, user=user, guests=1,
+                    start_date=date(2025, 1, 1) + timedelta(days=i * 2),
+                    end_date=date(2025, 1, 2) + timedelta(days=i * 2),
+                ),
+                amount='100.00', chapa_transaction_id=f'chapa-{i}',
+            )
+            for i in range(2)
+        ]
+
+    def post_event(self, payment, event='charge.success', signature=None):
+        body = json.dumps({'event': event, 'tx_ref': str(payment.payment_reference), 'status': 'success'}).encode()
+        return self.client.post(
+            '/payments/webhook/', body, content_type='application/json',
+            HTTP_X_CHAPA_SIGNATURE=signature or sign(body),
+        )
+
+    def test_signed_event_is_stored_once_and_acknowledged(self):
+        self.assertEqual(self.post_event(self.payments[0]).status_code, 200)
+        self.assertEqual(self.post_event(self.payments[0]).status_code, 200)
+        self.assertEqual(self.post_event(self.payments[1]).status_code, 200)
+        self.assertEqual(PaymentEvent.objects.count(), 2)
+        # One consumer run queued for the burst
+        self.assertEqual(
+            list(OutboxMessage.objects.values_list('task', flat=True)),
+            ['listings.tasks.process_payment_events']
+        )
+        # Acknowledging never calls Chapa
+        self.assertEqual(self.stub.requests, [])
+
+    def test_bad_signature_is_rejected(self):
+        response = self.post_event(self.payments[0], signature='0' * 64)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+    def test_consumer_verifies_each_payment_once(self):
+        for event in ('charge.success', 'charge.updated'):
+            for payment in self.payments:
+                self.post_event(payment, event)
+        self.client.get('/payments/webhook/', {'trx_ref': str(self.payments[0].payment_reference)})
+
+        process_payment_events()
+        self.assertEqual(len(self.stub.requests), 2)
+        self.assertEqual(
+            OutboxMessage.objects.filter(task='listings.tasks.send_payment_confirmation_email').count(), 2
+        )
+        for payment in self.payments:
+            payment.refresh_from_db()
+            self.assertEqual(payment.status, 'completed')
+        self.assertFalse(PaymentEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_unreachable_chapa_keeps_events_for_retry(self):
+        self.post_event(self.payments[0])
+        self.stub.stop()
+        process_payment_events()
+        event = PaymentEvent.objects.get()
+        self.assertIsNone(event.processed_at)
+        self.assertEqual(event.attempts, 1)
+        self.payments[0].refresh_from_db()
+        self.assertEqual(self.payments[0].status, 'pending')
+
+
+
+@override_settings(PAYMENT_RECONCILE_AFTER_MINUTES=30, PAYMENT_EXPIRE_AFTER_MINUTES=1440, CHAPA_RETRY_BACKOFF=0.01)
+class PaymentReconciliationTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.stub = ChapaStubServer().start()
+        self.addCleanup(self.stub.stop)
+        settings_override = override_settings(CHAPA_BASE_URL=self.stub.base_url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        reset_client()
+        self.addCleanup(reset_client)
+
+        user = User.objects.create_user(username='guest', password='password')
+        self.listing = make_listings(user, 1)[0]
+        self.user = user
+
+    def make_payment(self, age, day):
+        payment = Payment.objects.create(
+            booking=Booking.objects.create(
+                listing=self.listing, user=self.user, guests=1,
+                start_date=date(2025, 1, day), end_date=date(2025, 1, day + 1),
+            ),
+            amount='100.00',
+        )
+        Payment.objects.filter(pk=payment.pk).update(created_at=timezone.now() - age)
+        return payment
+
+    def test_verifies_stale_and_expires_abandoned_payments(self):
+        recent = self.make_payment(timedelta(minutes=5), 1)
+        stale = [self.make_payment(timedelta(hours=2), day) for day in (3, 5, 7)]
+        abandoned = self.make_payment(timedelta(days=3), 9)
+
+        report = reconcile_pending_payments(chunk_size=2)
+
+        self.assertEqual((report['checked'], report['updated'], report['expired']), (3, 3, 1))
+        self.assertEqual(
+            sorted(OutboxMessage.objects.values_list('args', flat=True)),
+            sorted([payment.id] for payment in stale)
+        )
+        self.assertEqual(len(self.stub.requests), 3)
+        statuses = dict(Payment.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[recent.pk], 'pending')
+        self.assertEqual(statuses[abandoned.pk], 'cancelled')
+        self.assertEqual({statuses[payment.pk] for payment in stale}, {'completed'})
+
+    def test_payments_chapa_still_reports_pending_are_left_alone(self):
+        self.stub.verify_status = 'pending'
+        payment = self.make_payment(timedelta(hours=2), 1)
+        report = reconcile_pending_payments()
+        self.assertEqual((report['checked'], report['updated']), (1, 0))
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'pending')
+
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='guest', password='password')
+        self.payment = Payment.objects.create(
+            booking=Booking.objects.create(
+                listing=make_listings(user, 1)[0], user=user, guests=1,
+                start_date=date(2025, 1, 1), end_date=date(2025, 1, 2),
+            ),
+            amount='100.00', status='completed',
+        )
+
+    def test_message_only_exists_if_the_change_commits(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                save_with_notification(self.payment)
+                raise RuntimeError
+        self.assertFalse(OutboxMessage.objects.exists())
+
+        with mock.patch.object(current_app, 'send_task') as send_task:
+            save_with_notification(self.payment)
+        send_task.assert_not_called()
+        self.assertEqual(OutboxMessage.objects.get().args, [self.payment.id])
+
+    def test_relay_publishes_in_order_and_keeps_failures(self):
+        for _ in range(3):
+            save_with_notification(self.payment)
+        first, second, third = OutboxMessage.objects.order_by('id')
+
+        producer = mock.MagicMock()
+        with override_settings(OUTBOX_BATCHED_TASKS={}), \
+                mock.patch.object(current_app, 'producer_or_acquire', return_value=producer), \
+                mock.patch.object(current_app, 'send_task', side_effect=[None, ConnectionError, None]) as send_task:
+            self.assertEqual(relay(), 1)
+        self.assertEqual(send_task.call_args_list[0].kwargs['headers'], {'outbox_id': [first.id]})
+
+        states = OutboxMessage.objects.order_by('id').values_list('published_at', 'attempts')
+        (first_published, _), (second_published, second_attempts), (third_published, _) = states
+        self.assertIsNotNone(first_published)
+        self.assertEqual((second_published, second_attempts), (None, 1))
+        self.assertIsNone(third_published)
+
+    def test_worker_records_delivery(self):
+        save_with_notification(self.payment)
+        message = OutboxMessage.objects.get()
+        OutboxMessage.objects.update(published_at=timezone.now())
+        send_payment_confirmation_email.apply(args=message.args, headers={'outbox_id': [message.id]})
+        message.refresh_from_db()
+        self.assertIsNotNone(message.delivered_at)
+        self.assertEqual(outbox_stats()['delivery_latency']['count'], 1)
+
+    def test_worker_records_delivery_of_single_id_header(self):
+        save_with_notification(self.payment)
+        message = OutboxMessage.objects.get()
+        send_payment_confirmation_email.apply(args=message.args, headers={'outbox_id': message.id})
+        message.refresh_from_db()
+        self.assertIsNotNone(message.delivered_at)
+
+
+    def test_relay_folds_emails_into_batches(self):
+        for _ in range(3):
+            save_with_notification(self.payment)
+        ids = list(OutboxMessage.objects.order_by('id').values_list('id', flat=True))
+
+        with override_settings(OUTBOX_COALESCE_LIMIT=2), \
+                mock.patch.object(current_app, 'producer_or_acquire', return_value=mock.MagicMock()), \
+                mock.patch.object(current_app, 'send_task') as send_task:
+            self.assertEqual(relay(), 3)
+        call = ['listings.tasks.send_payment_confirmation_email', [self.payment.id]]
+        self.assertEqual(
+            [(c.args[0], c.kwargs['args'], c.kwargs['headers']) for c in send_task.call_args_list],
+            [
+                ('listings.tasks.send_payment_emails', [[call, call]], {'outbox_id': ids[:2]}),
+                ('listings.tasks.send_payment_emails', [[call]], {'outbox_id': ids[2:]}),
+            ]
+        )
+
+
+    def test_payment_and_email_tasks_use_separate_queues(self):
+        route = current_app.amqp.router.route
+        self.assertEqual(route({}, process_payment_events.name)['queue'].name, 'payments')
+        self.assertEqual(route({}, reconcile_pending_payments.name)['queue'].name, 'payments')
+        self.assertEqual(route({}, send_payment_emails.name)['queue'].name, 'notifications')
+        self.assertTrue(send_payment_emails.ignore_result)
+        self.assertTrue(send_payment_emails.acks_late)
+        self.assertEqual(send_payment_emails.rate_limit, settings.EMAIL_TASK_RATE_LIMIT)
+
+class BatchedEmailTests(TestCase):
+    def setUp(self):
+        listing = make_listings(User.objects.create_user(username='host'), 1)[0]
+        self.calls = []
+        for i, email in enumerate(['a@example.com', 'bad@example.com', 'c@example.com']):
+            user = User.objects.create_user(username=f'guest{i}', email=email)
+            payment = Payment.objects.create(
+                booking=Booking.objects.create(
+                    listing=listing, user=user, guests=1,
+                    start_date=date(2025, 1, 1), end_date=date(2025, 1, 2),
+                ),
+                amount='100.00', status='completed',
+            )
+            self.calls.append(['listings.tasks.send_payment_confirmation_email', [payment.id]])
+
+    def test_batch_loads_everything_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(send_payment_emails(self.calls), 3)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['a@example.com', 'bad@example.com', 'c@example.com'])
+
+    def test_only_failed_messages_are_retried(self):
+        send = locmem.EmailBackend.send_messages
+
+        def refuse_bad(backend, messages):
+            if messages[0].to == ['bad@example.com']:
+                raise smtplib.SMTPRecipientsRefused({'bad@example.com': (550, b'No such user')})
+            return send(backend, messages)
+
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', refuse_bad), \
+                mock.patch.object(send_payment_emails, 'retry', return_value=RuntimeError()) as retry:
+            with self.assertRaises(RuntimeError):
+                send_payment_emails(self.calls)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(retry.call_args.kwargs['args'], [[self.calls[1]]])
+
+
+    def test_emails_are_multipart_and_escaped(self):
+        Listing.objects.update(title='Sea <View> & Co')
+        payment = load_payments([self.calls[0][1][0]])[self.calls[0][1][0]]
+        compiled.cache_clear()
+
+        messages = [render_message(kind, payment) for kind in ('confirmation', 'failure', 'confirmation')]
+        self.assertEqual(compiled.cache_info().misses, 2)
+        confirmation = messages[0]
+        self.assertEqual(confirmation.subject, 'Payment Confirmation - Booking for Sea <View> & Co')
+        self.assertIn('- Property: Sea <View> & Co', confirmation.body)
+        self.assertIn('- Check-in: 2025-01-01', confirmation.body)
+        html, mimetype = confirmation.alternatives[0]
+        self.assertEqual(mimetype, 'text/html')
+        self.assertIn('Sea &lt;View&gt; &amp; Co', html)
+        self.assertIn('Failure Reason: Unknown', messages[1].body)
+
+class AsyncPaymentViewTests(TestCase):
+    def setUp(self):
+        self.stub = ChapaStubServer().start()
+        self.addCleanup(self.stub.stop)
+        settings_override = override_settings(CHAPA_BASE_URL=self.stub.base_url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        reset_client()
+        self.addCleanup(reset_client)
+
+        self.user = User.objects.create_user(username='guest', password='password')
+        listing = make_listings(self.user, 1)[0]
+        self.booking = Booking.objects.create(
+            listing=listing, user=self.user,
+            start_date=date(2025, 1, 1), end_date=date(2025, 1, 3), guests=1,
+        )
+
+    async def initiate(self):
+        return await self.async_client.post('/payments/async/initiate/', {
+            'booking_id': self.booking.id, 'amount': '200.00', 'currency': 'ETB',
+            'email': 'guest@example.com', 'first_name': 'Test', 'last_name': 'Guest',
+            'phone_number': '0911000000',
+        }, content_type='application/json')
+
+    async def test_requires_login(self):
+        self.assertEqual((await self.initiate()).status_code, 403)
+
+    async def test_initiate_and_verify(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.initiate()
+        self.assertEqual(response.status_code, 201)
+        reference = response.json()['payment_reference']
+        self.assertEqual((await self.initiate()).status_code, 400)
+
+        response = await self.async_client.post(
+            '/payments/async/verify/', {'payment_reference': reference}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        payment = await Payment.objects.aget(payment_reference=reference)
+        self.assertEqual(payment.status, 'completed')
+        message = await OutboxMessage.objects.aget()
+        self.assertEqual((message.task, message.args), ('listings.tasks.send_payment_confirmation_email', [payment.id]))
+
+    def test_authentication_matches_drf_views(self):
+        client = Client(enforce_csrf_checks=True)
+        body = json.dumps({
+            'booking_id': self.booking.id, 'amount': '200.00', 'currency': 'ETB',
+            'email': 'guest@example.com', 'first_name': 'Test', 'last_name': 'Guest',
+            'phone_number': '0911000000',
+        })
+
+        def post(path, password=None):
+            headers = {}
+            if password:
+                token = base64.b64encode(f'guest:{password}'.encode()).decode()
+                headers['HTTP_AUTHORIZATION'] = f'Basic {token}'
+            return client.post(path, body, content_type='application/json', **headers)
+
+        # Basic credentials work as on the DRF view; bad ones are refused alike
+        for path in ('/payments/initiate/', '/payments/async/initiate/'):
+            self.assertEqual(post(path, 'wrong').status_code, 403)
+        self.assertEqual(post('/payments/async/initiate/', 'password').status_code, 201)
+
+        # A session without a CSRF token is refused as JSON, as by DRF
+        client.force_login(self.user)
+        sync, async_ = post('/payments/initiate/'), post('/payments/async/initiate/')
+        self.assertEqual((sync.status_code, async_.status_code), (403, 403))
+        self.assertEqual(async_.json(), sync.json())
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        REGISTRY.reset()
+        self.addCleanup(REGISTRY.reset)
+        make_listings(User.objects.create_user(username='owner'), 3)
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.get('/listings/')
+        self.client.get('/listings/')
+        row = REGISTRY.totals().rows[('listing-list', 'GET')]
+        self.assertEqual(row[COUNT], 2)
+        self.assertGreater(row[QUERIES], 0)
+        self.assertGreater(row[DB_SECONDS], 0)
+        self.assertGreater(row[SERIALIZER_SECONDS], 0)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], METRICS_CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn('http_request_duration_seconds_bucket{view="listing-list",method="GET",le="+Inf"} 2', body)
+        self.assertIn('http_request_duration_seconds_count{view="listing-list",method="GET"} 2', body)
+        self.assertIn('http_requests_total{view="listing-list",method="GET",status="200"} 2', body)
+        self.assertIn(f'http_db_queries_total{{view="listing-list",method="GET"}} {row[QUERIES]}', body)
+
+    def test_streamed_responses_count_their_body(self):
+        response = self.client.get('/listings/?stream=1')
+        self.assertNotIn(('listing-list', 'GET'), REGISTRY.totals().rows)
+        self.assertEqual(len(json.loads(b''.join(response.streaming_content))), 3)
+        row = REGISTRY.totals().rows[('listing-list', 'GET')]
+        self.assertEqual(row[COUNT], 1)
+        self.assertGreater(row[QUERIES], 0)
+        self.assertGreater(row[SERIALIZER_SECONDS], 0)
+
+    def test_finished_threads_keep_their_counts(self):
+        thread = threading.Thread(
+            target=REGISTRY.observe, args=('listing-list', 'GET', 200, 0.02, RequestSample())
+        )
+        thread.start()
+        thread.join()
+        self.assertEqual(REGISTRY.totals().rows[('listing-list', 'GET')][COUNT], 1)
+        self.assertTrue(all(thread.is_alive() for thread, _ in REGISTRY._shards))
+
+    @override_settings(METRICS_TOKEN='scrape-me')
+    def test_token_is_required_when_configured(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+
+
+class ApiBenchmarkTests(TransactionTestCase):
+    def test_every_route_runs_cleanly(self):
+        output = os.path.join(tempfile.mkdtemp(), 'bench.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(output))
+        call_command(
+            'bench_api', listings=20, requests=3, concurrency=2, latency=0, output=output,
+            stdout=io.StringIO(),
+        )
+        with open(output) as f:
+            report = json.load(f)
+        self.assertEqual(set(report['routes']), set(listing_route_names()))
+        self.assertEqual({name: r['errors'] for name, r in report['routes'].items() if r['errors']}, {})
+        self.assertEqual(report['routes']['listing-detail']['requests'], 3)
+        self.assertFalse(User.objects.filter(username__startswith='bench-api').exists())
+
+
+class SeedCommandTests(TestCase):
+    def seed(self, prefix, **counts):
+        call_command('seed', prefix=prefix, seed=7, today=date(2025, 6, 1), chunk_size=50,
+                     stdout=io.StringIO(), **counts)
+        return Booking.objects.filter(user__username__startswith=f'{prefix}-').order_by('id')
+
+    def test_exact_counts_without_overlaps(self):
+        bookings = self.seed('a', users=30, listings=10, bookings=200, reviews=40, payments=120)
+        self.assertEqual(User.objects.filter(username__startswith='a-').count(), 30)
+        self.assertEqual(bookings.count(), 200)
+        self.assertEqual(Review.objects.filter(user__username__startswith='a-').count(), 40)
+        self.assertEqual(Payment.objects.filter(booking__in=bookings).count(), 120)
+        stays = {}
+        for booking in bookings:
+            stays.setdefault(booking.listing_id, []).append((booking.start_date, booking.end_date))
+        for listing_stays in stays.values():
+            listing_stays.sort()
+            for (_, end), (start, _) in zip(listing_stays, listing_stays[1:]):
+                self.assertLessEqual(end, start)
+
+    def test_same_seed_same_data(self):
+        def shape(bookings):
+            return [(b.start_date, b.end_date, b.guests, hasattr(b, 'payment')) for b in bookings]
+        first = shape(self.seed('a', users=5, listings=3, bookings=30, payments=10))
+        self.assertEqual(shape(self.seed('b', users=5, listings=3, bookings=30, payments=10)), first)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    The replica is a second SQLite file; sync() copies the primary over it
+    the way replication would, so anything written since is missing there
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # Added here rather than in settings so the test runner neither
+        # creates nor checks it
+        cls.directory = tempfile.mkdtemp()
+        connections.settings['replica'] = connections.configure_settings({
+            'default': connections.settings['default'],
+            'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(cls.directory, 'replica.sqlite3')},
+        })['replica']
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        replicas = override_settings(DATABASE_REPLICAS=['replica'])
+        replicas.enable()
+        self.addCleanup(replicas.disable)
+        clear_caches()
+
+        self.guest = User.objects.create_user(username='guest')
+        self.listing = make_listings(self.guest, 1)[0]
+        self.client = APIClient()
+        self.client.force_login(self.guest)
+        self.sync()
+
+    def sync(self):
+        primary, replica = connections['default'], connections['replica']
+        primary.ensure_connection()
+        replica.ensure_connection()
+        primary.connection.backup(replica.connection)
+
+    def add_payment(self, day):
+        booking = Booking.objects.create(
+            listing=self.listing, user=self.guest, guests=1,
+            start_date=date(2025, 1, day), end_date=date(2025, 1, day + 1),
+        )
+        return Payment.objects.create(booking=booking, amount='100.00')
+
+    def payment_count(self):
+        response = self.client.get('/payments/user/')
+        self.assertEqual(response.status_code, 200)
+        return len(response.data['results'])
+
+    def test_read_only_views_read_the_replica(self):
+        self.add_payment(1)
+        self.assertEqual(self.payment_count(), 0)
+        self.sync()
+        self.assertEqual(self.payment_count(), 1)
+        self.assertNotIn(PIN_COOKIE, self.client.cookies)
+
+    def test_listing_views_read_the_replica(self):
+        url = f'/listings/{self.listing.pk}/'
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.assertEqual(APIClient().get(url).status_code, 200)
+        self.assertTrue(any('listings_listing' in query['sql'] for query in replica))
+
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = APIClient().get('/listings/?stream=1')
+            self.assertEqual(len(json.loads(b''.join(response.streaming_content))), 1)
+        self.assertTrue(any('listings_listing' in query['sql'] for query in replica))
+
+    def test_replica_reads_stay_out_of_the_shared_cache(self):
+        # The replica still has the old title when the cache is refilled
+        self.listing.title = 'Renamed'
+        self.listing.save()
+        url = f'/listings/{self.listing.pk}/'
+        self.assertEqual(APIClient().get(url).data['title'], 'Listing 0')
+
+        # So another worker, with its own local tier, reads the replica again
+        listing_cache.local.clear()
+        self.sync()
+        self.assertEqual(APIClient().get(url).data['title'], 'Renamed')
+
+        # Pinned clients skip the cache altogether
+        Listing.objects.filter(pk=self.listing.pk).update(title='Updated in bulk')
+        self.assertEqual(APIClient().get(url).data['title'], 'Renamed')
+        self.client.cookies[PIN_COOKIE] = str(time.time() + 60)
+        self.assertEqual(self.client.get(url).data['title'], 'Updated in bulk')
+
+    def test_writer_reads_the_primary_until_the_pin_expires(self):
+        response = self.client.post('/bookings/', {
+            'listing': self.listing.id, 'start_date': '2025-02-01', 'end_date': '2025-02-03', 'guests': 1
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.add_payment(1)
+        self.assertEqual(self.payment_count(), 1)
+
+        self.client.cookies[PIN_COOKIE] = '0'
+        self.assertEqual(self.payment_count(), 0)
+
+
+class SQLiteProfileTests(TestCase):
+    def test_production_profile_is_applied_to_new_connections(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    @override_settings(SQLITE_PROFILE='fast')
+    def test_unknown_profile_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            apply_profile(sender=None, connection=connection)
+
+
+class ListingRatingTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.guests = [User.objects.create_user(username=f'guest-{i}') for i in range(3)]
+        self.listing, self.other = make_listings(self.guests[0], 2)
+
+    def ratings(self, listing):
+        listing.refresh_from_db()
+        return listing.rating_avg, listing.rating_count
+
+    def test_reviews_keep_aggregates_current(self):
+        first = Review.objects.create(listing=self.listing, user=self.guests[0], rating=5)
+        Review.objects.create(listing=self.listing, user=self.guests[1], rating=4)
+        second = Review.objects.create(listing=self.listing, user=self.guests[2], rating=4)
+        self.assertEqual(self.ratings(self.listing), (Decimal('4.33'), 3))
+
+        # A stale instance saved after the reviews must not undo them
+        stale = Listing.objects.get(pk=self.other.pk)
+        second.listing = self.other
+        second.rating = 2
+        second.save()
+        stale.title = 'Renamed'
+        stale.save()
+        self.assertEqual(self.ratings(self.listing), (Decimal('4.50'), 2))
+        self.assertEqual(self.ratings(self.other), (Decimal('2.00'), 1))
+
+        first.delete()
+        self.assertEqual(self.ratings(self.listing), (Decimal('4.00'), 1))
+        data = self.client.get(f'/listings/{self.listing.pk}/').json()
+        self.assertEqual((data['rating_avg'], data['rating_count']), ('4.00', 1))
+        self.assertNotIn('rating_total', data)
+
+    def test_recompute_fixes_rows_written_without_signals(self):
+        Review.objects.bulk_create([Review(listing=self.other, user=user, rating=3) for user in self.guests])
+        self.assertEqual(self.ratings(self.other), (Decimal('0.00'), 0))
+        self.assertEqual(recompute_ratings(), 1)
+        self.assertEqual(self.ratings(self.other), (Decimal('3.00'), 3))
+        self.assertEqual(recompute_ratings(), 0)
+
+    def test_listings_page_by_rating(self):
+        listings = make_listings(self.guests[0], 4)
+        for listing, ratings in zip(listings, ([5], [3, 4], [4, 3], [])):
+            for user, rating in zip(self.guests, ratings):
+                Review.objects.create(listing=listing, user=user, rating=rating)
+        seen = []
+        url = '/listings/?sort=rating&page_size=2'
+        while url:
+            page = self.client.get(url).json()
+            seen += [item['id'] for item in page['results']]
+            url = page['next']
+        tied = sorted((listings[1].pk, listings[2].pk), reverse=True)
+        self.assertEqual(seen[:3], [listings[0].pk, *tied])
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(self.client.get('/listings/?sort=price').status_code, 400)
+
+
+class ReviewFeedTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.guests = [User.objects.create_user(username=f'reviewer-{i}') for i in range(5)]
+        self.listing, self.other = make_listings(self.guests[0], 2)
+        self.reviews = [
+            Review.objects.create(listing=self.listing, user=user, rating=rating, comment=f'Stay {i}')
+            for i, (user, rating) in enumerate(zip(self.guests, (5, 4, 5, 2, 5)))
+        ]
+        self.url = f'/listings/{self.listing.pk}/reviews/'
+
+    def test_pages_newest_first_with_histogram(self):
+        seen = []
+        url = f'{self.url}?page_size=2'
+        while url:
+            page = self.client.get(url).json()
+            self.assertEqual(page['histogram'], {'1': 0, '2': 1, '3': 0, '4': 1, '5': 3})
+            seen += [item['id'] for item in page['results']]
+            url = page['next']
+        self.assertEqual(seen, [review.pk for review in reversed(self.reviews)])
+        self.assertEqual(
+            set(page['results'][0]), {'id', 'user', 'rating', 'comment', 'created_at'}
+        )
+        self.assertEqual(page['results'][0]['user'], 'reviewer-0')
+        self.assertEqual(self.client.get(f'{self.url}?cursor=nope').status_code, 400)
+        self.assertEqual(self.client.get('/listings/999999/reviews/').status_code, 404)
+
+    def test_first_page_is_cached_until_reviews_change(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.json()['results']), 5)
+
+        self.reviews[0].listing = self.other
+        self.reviews[0].save()
+        page = self.client.get(self.url).json()
+        self.assertEqual(len(page['results']), 4)
+        self.assertEqual(page['histogram']['5'], 2)
+        self.assertEqual(self.client.get(f'/listings/{self.other.pk}/reviews/').json()['histogram']['5'], 1)
+
+        self.reviews[1].delete()
+        self.assertEqual(len(self.client.get(self.url).json()['results']), 3)
+
+
+class FastPathSerializerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='guest')
+        self.listings = make_listings(self.user, 2)
+        Listing.objects.filter(pk=self.listings[0].pk).update(max_guests=4, price_per_night='1234.5')
+        Review.objects.create(listing=self.listings[0], user=self.user, rating=2)
+        for i, listing in enumerate(self.listings):
+            booking = Booking.objects.create(
+                listing=listing, user=self.user,
+                start_date=date(2025, 1, 1), end_date=date(2025, 1, 3), guests=1,
+            )
+            Payment.objects.create(booking=booking, amount='99.999' if i else '0.10')
+        Payment.objects.filter(booking__listing=self.listings[0]).update(
+            status='completed', completed_at=timezone.now(), chapa_transaction_id='tx-1',
+        )
+
+    def assertParity(self, serializer_class, queryset, **kwargs):
+        compiled = compile_serializer(serializer_class, kwargs.get('fields'))
+        expected = serializer_class(queryset, many=True, **kwargs).data
+        actual = compiled.render(queryset.values_list(*compiled.columns))
+        self.assertEqual(actual, expected)
+        self.assertEqual([list(item) for item in actual], [list(item) for item in expected])
+
+    def test_output_matches_model_serializers(self):
+        listings = Listing.objects.order_by('id')
+        payments = Payment.objects.order_by('id')
+        self.assertParity(ListingSerializer, listings)
+        self.assertParity(ListingSerializer, listings, fields=('id', 'price_per_night', 'owner'))
+        self.assertParity(PaymentSerializer, payments)
+        with timezone.override('Africa/Addis_Ababa'):
+            self.assertParity(PaymentSerializer, payments)
+        with self.assertRaises(TypeError):
+            compile_serializer(PaymentWithBookingSerializer)
@@ -1,10 +1,14 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     # Listings endpoints
     path('listings/', views.listing_list, name='listing-list'),
+    path('listings/search/', views.listing_search, name='listing-search'),
+    path('listings/available/', views.listing_availability, name='listing-availability'),
+    path('listings/cache/stats/', views.listing_cache_stats, name='listing-cache-stats'),
     path('listings/<int:pk>/', views.listing_detail, name='listing-detail'),
+    path('listings/<int:pk>/reviews/', views.listing_reviews, name='listing-reviews'),
     
     # Booking endpoints
     path('bookings/', views.create_booking, name='create-booking'),
@@ -12,7 +16,13 @@ urlpatterns = [
     # Payment endpoints
     path('payments/initiate/', views.initiate_payment, name='initiate-payment'),
     path('payments/verify/', views.verify_payment, name='verify-payment'),
+    path('payments/outbox/stats/', views.outbox_stats, name='outbox-stats'),
+    path('payments/webhook/', views.chapa_webhook, name='chapa-webhook'),
+    path('payments/async/initiate/', async_views.initiate_payment_async, name='initiate-payment-async'),
+    path('payments/async/verify/', async_views.verify_payment_async, name='verify-payment-async'),
     path('payments/<uuid:payment_reference>/', views.payment_status, name='payment-status'),
     path('payments/user/', views.user_payments, name='user-payments'),
+
+    path('metrics', views.metrics, name='metrics'),
 ]
 
@@ -1,45 +1,265 @@
+import hmac
+
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import render
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from django.conf import settings
-from django.utils import timezone
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, Max
 import requests
-import json
-from .models import Listing, Booking, Payment
+from .models import Listing, Booking, Payment, Review
 from .serializers import (
+    InvalidFields,
     ListingSerializer, 
+    ReviewSerializer,
+    AvailabilitySearchSerializer,
+    ListingSearchSerializer,
     BookingSerializer, 
     PaymentSerializer,
+    PaymentWithBookingSerializer,
     PaymentInitiationSerializer,
-    PaymentVerificationSerializer
+    PaymentVerificationSerializer,
+    parse_fields
+)
+from .payments import (
+    PROVIDER_UNAVAILABLE,
+    apply_initialize_response,
+    apply_verify_response,
+    initialize_payload,
+    mark_unreachable,
+    save_with_notification
+)
+from .chapa import get_client as get_chapa_client
+from .idempotency import idempotent
+from .routing import cached_read, replica_reads
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, exposition as metrics_exposition
+from .outbox import stats as get_outbox_stats
+from .webhooks import InvalidEvent, parse_event, record_event, valid_signature
+from .fastpath import compile_serializer
+from .conditional import make_etag, not_modified, set_validators
+from .cache import LISTING_LIST_GROUP, listing_cache, listing_detail_group, listing_reviews_group
+from .bookings import BookingConflict, save_booking
+from .availability import available_listings, listings_for_ids
+from .search import get_backend as get_search_backend
+from .pagination import (
+    InvalidCursor,
+    encode_cursor,
+    get_page_size,
+    keyset_filter,
+    paginate_keyset,
+    paginate_keyset_rows,
+    paginated_response_data,
+    stream_json_array
 )
-from .tasks import send_payment_confirmation_email, send_payment_failure_email
 
 # Create your views here.
 
+# ?sort= values of listing_list and the indexed field each pages on
+LISTING_SORT_FIELDS = {'newest': 'created_at', 'rating': 'rating_avg'}
+
 @api_view(['GET'])
+@replica_reads
 def listing_list(request):
     """
-    List all listings
+    List listings, newest first, one keyset page at a time
+
+    Pass ?sort=rating for the best rated first, ?cursor= from the previous
+    page's "next" link to continue, ?fields=title,location,... to receive
+    only those fields, and ?stream=1 to receive every remaining listing as
+    a streamed JSON array.
     """
-    listings = Listing.objects.all()
-    serializer = ListingSerializer(listings, many=True)
-    return Response(serializer.data)
+    sort = request.query_params.get('sort', 'newest')
+    if sort not in LISTING_SORT_FIELDS:
+        return Response(
+            {'error': f'sort must be one of {", ".join(LISTING_SORT_FIELDS)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        fields = parse_fields(request.query_params.get('fields'), ListingSerializer)
+    except InvalidFields as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    field = LISTING_SORT_FIELDS[sort]
+    cursor = request.query_params.get('cursor')
+    page_size = get_page_size(request)
+    # Selects only the rendered columns, plus the ones pages are sorted on
+    serializer = compile_serializer(ListingSerializer, fields)
+    try:
+        if request.query_params.get('stream') in ('1', 'true'):
+            # Bound now: the stream is read after @replica_reads has returned
+            rows = keyset_filter(
+                Listing.objects.using(router.db_for_read(Listing)), cursor, field
+            ).values_list(*serializer.columns)
+            return stream_json_array(rows, serializer.render)
+
+        def load_page():
+            rows, next_cursor = paginate_keyset_rows(
+                Listing.objects.all(), cursor, page_size, serializer.columns, field
+            )
+            return {
+                'results': serializer.render(rows),
+                'next_cursor': next_cursor,
+            }
+
+        page = cached_read(
+            listing_cache, f'page:{sort}:{",".join(fields or ())}:{cursor or ""}:{page_size}', load_page,
+            group=LISTING_LIST_GROUP,
+        )
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(paginated_response_data(request, page['results'], page['next_cursor']))
 
 @api_view(['GET'])
+@replica_reads
 def listing_detail(request, pk):
     """
-    Retrieve a specific listing
+    Retrieve a specific listing; ?fields= trims it as on listing_list
     """
     try:
-        listing = Listing.objects.get(pk=pk)
-        serializer = ListingSerializer(listing)
-        return Response(serializer.data)
-    except Listing.DoesNotExist:
+        fields = parse_fields(request.query_params.get('fields'), ListingSerializer)
+    except InvalidFields as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def load_listing():
+        listing = Listing.objects.filter(pk=pk).first()
+        return ListingSerializer(listing).data if listing else None
+
+    data = cached_read(listing_cache, 'detail', load_listing, group=listing_detail_group(pk))
+    if data is None:
         return Response({'error': 'Listing not found'}, status=status.HTTP_404_NOT_FOUND)
 
+    # Each field set is a different representation, so it gets its own ETag
+    etag = make_etag('listing', data['id'], data['created_at'], data['version'], *(fields or ()))
+    if fields:
+        # Trimmed from the cached full payload, one entry serves every ?fields=
+        data = {name: data[name] for name in fields}
+    return not_modified(request, etag=etag) or set_validators(Response(data), etag=etag)
+
+@api_view(['GET'])
+@replica_reads
+def listing_reviews(request, pk):
+    """
+    A listing's reviews, newest first, one keyset page at a time
+
+    Every page carries the listing's rating histogram. The histogram and
+    the first page are cached until the listing's reviews change.
+    """
+    def load_histogram():
+        if not Listing.objects.filter(pk=pk).exists():
+            return None
+        counts = Review.objects.filter(listing_id=pk).order_by().values('rating').annotate(count=Count('id'))
+        histogram = {str(rating): 0 for rating in range(1, 6)}
+        histogram.update({str(row['rating']): row['count'] for row in counts})
+        return histogram
+
+    group = listing_reviews_group(pk)
+    histogram = cached_read(listing_cache, 'histogram', load_histogram, group=group)
+    if histogram is None:
+        return Response({'error': 'Listing not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    cursor = request.query_params.get('cursor')
+    page_size = get_page_size(request)
+
+    def load_page():
+        # Only the columns ReviewSerializer renders
+        reviews = (
+            Review.objects.filter(listing_id=pk)
+            .select_related('user')
+            .only('rating', 'comment', 'created_at', 'user__username')
+        )
+        reviews, next_cursor = paginate_keyset(reviews, cursor, page_size)
+        return {
+            'results': ReviewSerializer(reviews, many=True).data,
+            'next_cursor': next_cursor,
+        }
+
+    try:
+        if cursor:
+            page = load_page()
+        else:
+            page = cached_read(listing_cache, f'first:{page_size}', load_page, group=group)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    data = paginated_response_data(request, page['results'], page['next_cursor'])
+    data['histogram'] = histogram
+    return Response(data)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def listing_cache_stats(request):
+    """
+    Hit/miss/eviction counters of this process's listing cache
+    """
+    return Response(listing_cache.stats())
+
+@api_view(['GET'])
+def listing_availability(request):
+    """
+    List listings free for every night from start_date to end_date
+
+    Supports ?guests= and the same ?cursor=/?page_size= keyset paging as
+    listing_list.
+    """
+    search = AvailabilitySearchSerializer(data=request.query_params)
+    if not search.is_valid():
+        return Response(search.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    page_size = get_page_size(request)
+    try:
+        candidates = keyset_filter(Listing.objects.all(), request.query_params.get('cursor'))
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    ids = []
+    for listing_id in available_listings(candidates, **search.validated_data):
+        ids.append(listing_id)
+        if len(ids) > page_size:
+            break
+
+    listings = listings_for_ids(ids)
+    next_cursor = None
+    if len(listings) > page_size:
+        listings = listings[:page_size]
+        next_cursor = encode_cursor(listings[-1].created_at, listings[-1].pk)
+
+    serializer = ListingSerializer(listings, many=True)
+    return Response(paginated_response_data(request, serializer.data, next_cursor))
+
+@api_view(['GET'])
+def listing_search(request):
+    """
+    Full-text search over listing title, description and location
+
+    Results are ranked by relevance; every term matches as a prefix. Each
+    result carries a "search" object with the rank and <mark>-highlighted
+    title and description snippet. Page with ?page_size= and ?offset=.
+    """
+    search = ListingSearchSerializer(data=request.query_params)
+    if not search.is_valid():
+        return Response(search.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    page_size = get_page_size(request)
+    offset = search.validated_data['offset']
+    hits = get_search_backend().search(search.validated_data['q'], page_size + 1, offset)
+
+    next_url = None
+    if len(hits) > page_size:
+        hits = hits[:page_size]
+        next_url = replace_query_param(request.build_absolute_uri(), 'offset', offset + page_size)
+
+    listings = listings_for_ids([hit.listing_id for hit in hits])
+    by_id = {item['id']: item for item in ListingSerializer(listings, many=True).data}
+    results = [
+        dict(by_id[hit.listing_id], search={'rank': hit.rank, 'title': hit.title, 'snippet': hit.snippet})
+        for hit in hits if hit.listing_id in by_id
+    ]
+    return Response({'next': next_url, 'results': results})
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_booking(request):
@@ -47,13 +267,18 @@ def create_booking(request):
     Create a new booking
     """
     serializer = BookingSerializer(data=request.data)
-    if serializer.is_valid():
-        booking = serializer.save(user=request.user)
-        return Response(BookingSerializer(booking).data, status=status.HTTP_201_CREATED)
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        booking = save_booking(serializer, request.user)
+    except BookingConflict as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+    return Response(BookingSerializer(booking).data, status=status.HTTP_201_CREATED)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def initiate_payment(request):
     """
     Initiate payment with Chapa API
@@ -76,66 +301,38 @@ def initiate_payment(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Create payment record
-        payment = Payment.objects.create(
-            booking=booking,
-            amount=serializer.validated_data['amount'],
-            currency=serializer.validated_data['currency']
-        )
+        # Create payment record; a concurrent request for the same booking
+        # loses on the one-to-one constraint instead of calling Chapa twice
+        try:
+            with transaction.atomic():
+                payment = Payment.objects.create(
+                    booking=booking,
+                    amount=serializer.validated_data['amount'],
+                    currency=serializer.validated_data['currency']
+                )
+        except IntegrityError:
+            return Response(
+                {'error': 'Payment already exists for this booking'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         # Prepare Chapa API request
-        chapa_data = {
-            "amount": str(serializer.validated_data['amount']),
-            "currency": serializer.validated_data['currency'],
-            "email": serializer.validated_data['email'],
-            "first_name": serializer.validated_data['first_name'],
-            "last_name": serializer.validated_data['last_name'],
-            "phone_number": serializer.validated_data['phone_number'],
-            "tx_ref": str(payment.payment_reference),
-            "callback_url": f"{request.build_absolute_uri('/')}api/payments/verify/",
-            "return_url": f"{request.build_absolute_uri('/')}api/payments/success/",
-            "customization": {
-                "title": f"Payment for {booking.listing.title}",
-                "description": f"Booking payment for {booking.listing.location}"
-            }
-        }
-        
-        # Make request to Chapa API
-        headers = {
-            'Authorization': f'Bearer {settings.CHAPA_SECRET_KEY}',
-            'Content-Type': 'application/json'
-        }
-        
-        response = requests.post(
-            f"{settings.CHAPA_BASE_URL}/transaction/initialize",
-            headers=headers,
-            data=json.dumps(chapa_data)
+        chapa_data = initialize_payload(
+            payment, booking, serializer.validated_data, request.build_absolute_uri('/')
         )
         
-        if response.status_code == 200:
-            response_data = response.json()
-            
-            # Update payment with Chapa response
-            payment.chapa_transaction_id = response_data.get('data', {}).get('reference')
-            payment.chapa_checkout_url = response_data.get('data', {}).get('checkout_url')
-            payment.save()
-            
-            return Response({
-                'payment_reference': payment.payment_reference,
-                'checkout_url': payment.chapa_checkout_url,
-                'status': payment.status,
-                'message': 'Payment initiated successfully'
-            }, status=status.HTTP_201_CREATED)
+        # Make request to Chapa API
+        try:
+            response = get_chapa_client().initialize(chapa_data)
+        except requests.RequestException as e:
+            payload, http_status = mark_unreachable(payment, e)
         else:
-            # Payment initiation failed
-            payment.status = 'failed'
-            payment.failure_reason = response.text
-            payment.save()
-            
-            return Response({
-                'error': 'Failed to initiate payment',
-                'details': response.text
-            }, status=status.HTTP_400_BAD_REQUEST)
+            body = response.json() if response.status_code == 200 else {}
+            payload, http_status = apply_initialize_response(
+                payment, response.status_code, body, response.text
+            )
+        payment.save()
+        return Response(payload, status=http_status)
             
     except Booking.DoesNotExist:
         return Response(
@@ -163,53 +360,19 @@ def verify_payment(request):
         )
         
         # Make request to Chapa API to verify payment
-        headers = {
-            'Authorization': f'Bearer {settings.CHAPA_SECRET_KEY}',
-            'Content-Type': 'application/json'
-        }
+        try:
+            response = get_chapa_client().verify(payment.chapa_transaction_id)
+        except requests.RequestException:
+            return Response(PROVIDER_UNAVAILABLE, status=status.HTTP_502_BAD_GATEWAY)
         
-        response = requests.get(
-            f"{settings.CHAPA_BASE_URL}/transaction/verify/{payment.chapa_transaction_id}",
-            headers=headers
+        body = response.json() if response.status_code == 200 else {}
+        payload, http_status, changed = apply_verify_response(
+            payment, response.status_code, body, response.text
         )
-        
-        if response.status_code == 200:
-            response_data = response.json()
-            chapa_status = response_data.get('data', {}).get('status')
-            
-            # Update payment status based on Chapa response
-            if chapa_status == 'success':
-                payment.status = 'completed'
-                payment.completed_at = timezone.now()
-                payment.payment_method = response_data.get('data', {}).get('payment_method', 'Unknown')
-                payment.save()
-                
-                # Send confirmation email
-                send_payment_confirmation_email.delay(payment.id)
-                
-                return Response({
-                    'payment_reference': payment.payment_reference,
-                    'status': payment.status,
-                    'message': 'Payment verified and completed successfully'
-                }, status=status.HTTP_200_OK)
-            else:
-                payment.status = 'failed'
-                payment.failure_reason = response_data.get('message', 'Payment failed')
-                payment.save()
-                
-                # Send failure email
-                send_payment_failure_email.delay(payment.id)
-                
-                return Response({
-                    'payment_reference': payment.payment_reference,
-                    'status': payment.status,
-                    'message': 'Payment verification failed'
-                }, status=status.HTTP_400_BAD_REQUEST)
-        else:
-            return Response({
-                'error': 'Failed to verify payment',
-                'details': response.text
-            }, status=status.HTTP_400_BAD_REQUEST)
+        if changed:
+            # The email goes out through the outbox once this commits
+            save_with_notification(payment)
+        return Response(payload, status=http_status)
             
     except Payment.DoesNotExist:
         return Response(
@@ -222,24 +385,73 @@ def verify_payment(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['GET', 'POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def chapa_webhook(request):
+    """
+    Store a Chapa webhook (POST) or callback (GET) and acknowledge it
+
+    Verification happens later in the process_payment_events task.
+    """
+    if request.method == 'POST' and not valid_signature(request):
+        return Response({'error': 'Invalid signature'}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        tx_ref, event, payload = parse_event(request)
+    except InvalidEvent as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    record_event(tx_ref, event, payload)
+    return Response({'status': 'received'})
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def outbox_stats(request):
+    """
+    Outbox backlog and notification publish/delivery latency
+    """
+    return Response(get_outbox_stats())
+
+def metrics(request):
+    """
+    Per-view request metrics for Prometheus
+
+    Requires `Authorization: Bearer <METRICS_TOKEN>` when METRICS_TOKEN is set.
+    """
+    if settings.METRICS_TOKEN and not hmac.compare_digest(
+        request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}'
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics_exposition(), content_type=METRICS_CONTENT_TYPE)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def payment_status(request, payment_reference):
     """
     Get payment status by reference
+
+    Pass ?include=booking to embed a booking and listing summary.
     """
     try:
-        payment = Payment.objects.get(payment_reference=payment_reference)
+        payment = payments_for_response().get(payment_reference=payment_reference)
         
         # Check if user has permission to view this payment
-        if payment.booking.user != request.user:
+        if payment.booking.user_id != request.user.id:
             return Response(
                 {'error': 'Permission denied'}, 
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        serializer = PaymentSerializer(payment)
-        return Response(serializer.data)
+        etag = make_etag(
+            'payment', payment.payment_reference, payment.updated_at.timestamp(), request.get_full_path()
+        )
+        cached = not_modified(request, etag=etag, last_modified=payment.updated_at)
+        if cached:
+            return cached
+
+        serializer = payment_serializer_class(request)(payment)
+        response = Response(serializer.data)
+        response['Cache-Control'] = 'private, no-cache'
+        return set_validators(response, etag=etag, last_modified=payment.updated_at)
         
     except Payment.DoesNotExist:
         return Response(
@@ -249,10 +461,54 @@ def payment_status(request, payment_reference):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def user_payments(request):
     """
-    Get all payments for the authenticated user
+    List the authenticated user's payments, newest first, one keyset page at a time
+
+    Pass ?cursor= from the previous page's "next" link to continue and
+    ?include=booking to embed booking and listing summaries.
     """
     payments = Payment.objects.filter(booking__user=request.user)
-    serializer = PaymentSerializer(payments, many=True)
-    return Response(serializer.data)
+
+    # The newest updated_at and the row count change whenever any payment does
+    summary = payments.order_by().aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    last_modified = summary['last_modified']
+    etag = make_etag(
+        'payments', request.user.id, summary['count'],
+        last_modified.timestamp() if last_modified else 0, request.get_full_path(),
+    )
+    cached = not_modified(request, etag=etag, last_modified=last_modified)
+    if cached:
+        return cached
+
+    serializer_class = payment_serializer_class(request)
+    cursor = request.query_params.get('cursor')
+    page_size = get_page_size(request)
+    try:
+        if serializer_class is PaymentSerializer:
+            serializer = compile_serializer(PaymentSerializer)
+            rows, next_cursor = paginate_keyset_rows(payments, cursor, page_size, serializer.columns)
+            results = serializer.render(rows)
+        else:
+            page, next_cursor = paginate_keyset(
+                payments_for_response().filter(booking__user=request.user), cursor, page_size
+            )
+            results = serializer_class(page, many=True).data
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = Response(paginated_response_data(request, results, next_cursor))
+    response['Cache-Control'] = 'private, no-cache'
+    return set_validators(response, etag=etag, last_modified=last_modified)
+
+
+def payments_for_response():
+    # Everything the serializers (including the booking summary) touch, in one query
+    return Payment.objects.select_related('booking__listing', 'booking__user')
+
+
+def payment_serializer_class(request):
+    if 'booking' in request.query_params.get('include', '').split(','):
+        return PaymentWithBookingSerializer
+    return PaymentSerializer
@@ -0,0 +1,93 @@
+"""
+Chapa webhook ingestion
+
+The receiver only checks the signature, stores the raw event and returns;
+verification against Chapa and the Payment transition happen later in
+process_payment_events, in batches, so Chapa's callbacks are acknowledged
+in milliseconds and its retries never tie up web workers.
+
+Signed webhooks (POST, x-chapa-signature / Chapa-Signature) carry an
+HMAC-SHA256 of the body keyed with CHAPA_WEBHOOK_SECRET. The unsigned GET
+callback to callback_url is accepted too: it only ever triggers a
+verification call, and Chapa's answer decides the payment status.
+"""
+import hashlib
+import hmac
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import PaymentEvent
+
+SIGNATURE_HEADERS = ('X-Chapa-Signature', 'Chapa-Signature')
+KICK_KEY = 'payment-events:kick'
+
+
+class InvalidEvent(Exception):
+    pass
+
+
+def sign(body, secret=None):
+    secret = settings.CHAPA_WEBHOOK_SECRET if secret is None else secret
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def valid_signature(request):
+    expected = sign(request.body)
+    return any(
+        hmac.compare_digest(expected, request.headers.get(header, ''))
+        for header in SIGNATURE_HEADERS
+    )
+
+
+def parse_event(request):
+    """
+    (tx_ref, event, raw payload) from a webhook POST or a callback GET
+    """
+    if request.method == 'GET':
+        tx_ref = request.GET.get('trx_ref') or request.GET.get('tx_ref')
+        payload = request.META.get('QUERY_STRING', '')
+        event = 'callback'
+    else:
+        payload = request.body.decode('utf-8', 'replace')
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            raise InvalidEvent('Body is not JSON')
+        if not isinstance(data, dict):
+            raise InvalidEvent('Body is not a JSON object')
+        tx_ref = data.get('tx_ref') or data.get('trx_ref')
+        event = str(data.get('event') or data.get('type') or '')[:50]
+    if not tx_ref:
+        raise InvalidEvent('Missing tx_ref')
+    return str(tx_ref)[:255], event, payload
+
+
+def record_event(tx_ref, event, payload):
+    """
+    Store the event once and make sure a consumer picks it up soon
+    """
+    digest = hashlib.sha256(f'{event}\n{payload}'.encode()).hexdigest()
+    with transaction.atomic():
+        PaymentEvent.objects.bulk_create(
+            [PaymentEvent(tx_ref=tx_ref, event=event, payload=payload, digest=digest)],
+            ignore_conflicts=True
+        )
+        kick_consumer()
+
+
+def kick_consumer():
+    """
+    Queue at most one consumer run per PAYMENT_EVENT_BATCH_DELAY window
+
+    The run goes through the outbox, so acknowledging Chapa never waits on
+    the broker. Events stored while a run is queued are picked up by it;
+    the periodic schedule covers the rest.
+    """
+    from .outbox import enqueue
+    from .tasks import process_payment_events
+
+    if cache.add(KICK_KEY, 1, max(1, int(settings.PAYMENT_EVENT_BATCH_DELAY))):
+        enqueue(process_payment_events)
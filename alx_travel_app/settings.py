@@ -51,7 +51,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its latency covers the whole middleware stack
+    'listings.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'listings.routing.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -88,9 +91,44 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # 0 closes connections after each request, as ASGI needs: there they
+        # are not reused across async contexts and would pile up. Under WSGI,
+        # set DATABASE_CONN_MAX_AGE (say 600) to keep them across requests,
+        # so listings/sqlite.py sets each one up only once
+        'CONN_MAX_AGE': int(os.getenv('DATABASE_CONN_MAX_AGE', '0')),
+        'CONN_HEALTH_CHECKS': True,
+        # File-backed so threaded tests see real SQLite locking rather than
+        # the shared-cache table locks of an in-memory database
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Read replicas (listings/routing.py): comma-separated SQLite files kept in
+# sync with the primary by an external tool (Litestream, LiteFS, ...); they
+# become aliases replica1, replica2, ... Views marked @replica_reads read
+# from them, except for clients that wrote in the last PRIMARY_STICKY_SECONDS
+DATABASES.update({
+    f'replica{number}': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'CONN_MAX_AGE': int(os.getenv('DATABASE_CONN_MAX_AGE', '0')),
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    }
+    for number, name in enumerate(filter(None, os.getenv('DATABASE_REPLICA_FILES', '').split(',')), 1)
+})
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['listings.routing.ReplicaRouter']
+PRIMARY_STICKY_SECONDS = int(os.getenv('PRIMARY_STICKY_SECONDS', '10'))
+
+# SQLite connection profile (listings/sqlite.py): 'production' for WAL,
+# synchronous=NORMAL, memory-mapped reads, a larger page cache, IMMEDIATE
+# transactions and a busy timeout; 'default' for SQLite's own settings
+SQLITE_PROFILE = os.getenv('SQLITE_PROFILE', 'production')
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+SQLITE_CACHE_KB = int(os.getenv('SQLITE_CACHE_KB', str(64 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -134,10 +172,88 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+if os.getenv('REDIS_CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_CACHE_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Listing payload cache: in-process LRU in front of CACHES['default']
+LISTING_CACHE_LOCAL_SIZE = int(os.getenv('LISTING_CACHE_LOCAL_SIZE', '1024'))
+LISTING_CACHE_LOCAL_TTL = int(os.getenv('LISTING_CACHE_LOCAL_TTL', '5'))
+LISTING_CACHE_TTL = int(os.getenv('LISTING_CACHE_TTL', '300'))
+
+# Listing pagination
+LISTINGS_PAGE_SIZE = int(os.getenv('LISTINGS_PAGE_SIZE', '50'))
+LISTINGS_MAX_PAGE_SIZE = int(os.getenv('LISTINGS_MAX_PAGE_SIZE', '500'))
+LISTINGS_STREAM_CHUNK_SIZE = int(os.getenv('LISTINGS_STREAM_CHUNK_SIZE', '2000'))
+
 # Chapa API Configuration
 CHAPA_SECRET_KEY = os.getenv('CHAPA_SECRET_KEY', 'CHASECK_TEST-your-test-secret-key')
 CHAPA_PUBLIC_KEY = os.getenv('CHAPA_PUBLIC_KEY', 'CHAPUBK_TEST-your-test-public-key')
 CHAPA_BASE_URL = os.getenv('CHAPA_BASE_URL', 'https://api.chapa.co/v1')
+# Shared HTTP client (listings/chapa.py): timeouts in seconds
+CHAPA_CONNECT_TIMEOUT = float(os.getenv('CHAPA_CONNECT_TIMEOUT', '3.05'))
+CHAPA_READ_TIMEOUT = float(os.getenv('CHAPA_READ_TIMEOUT', '10'))
+CHAPA_MAX_RETRIES = int(os.getenv('CHAPA_MAX_RETRIES', '2'))
+CHAPA_RETRY_BACKOFF = float(os.getenv('CHAPA_RETRY_BACKOFF', '0.25'))
+CHAPA_POOL_SIZE = int(os.getenv('CHAPA_POOL_SIZE', '20'))
+# Connections per event loop for the async payment views
+CHAPA_ASYNC_POOL_SIZE = int(os.getenv('CHAPA_ASYNC_POOL_SIZE', '200'))
+# Key for webhook signatures; Chapa signs with the secret key unless a
+# separate webhook secret is configured in the dashboard
+CHAPA_WEBHOOK_SECRET = os.getenv('CHAPA_WEBHOOK_SECRET', CHAPA_SECRET_KEY)
+
+# Webhook event consumer (listings.tasks.process_payment_events): events
+# per batch, at most one queued run per this many seconds, attempts before
+# an event is given up on, concurrent Chapa verify calls
+PAYMENT_EVENT_BATCH_SIZE = int(os.getenv('PAYMENT_EVENT_BATCH_SIZE', '200'))
+PAYMENT_EVENT_BATCH_DELAY = float(os.getenv('PAYMENT_EVENT_BATCH_DELAY', '1'))
+PAYMENT_EVENT_MAX_ATTEMPTS = int(os.getenv('PAYMENT_EVENT_MAX_ATTEMPTS', '5'))
+PAYMENT_EVENT_LOCK_TIMEOUT = int(os.getenv('PAYMENT_EVENT_LOCK_TIMEOUT', '300'))
+PAYMENT_VERIFY_CONCURRENCY = int(os.getenv('PAYMENT_VERIFY_CONCURRENCY', '10'))
+
+# Reconciliation (listings.tasks.reconcile_pending_payments): payments pending
+# longer than RECONCILE_AFTER are verified with Chapa, those older than
+# EXPIRE_AFTER are cancelled outright
+PAYMENT_RECONCILE_AFTER_MINUTES = int(os.getenv('PAYMENT_RECONCILE_AFTER_MINUTES', '30'))
+PAYMENT_EXPIRE_AFTER_MINUTES = int(os.getenv('PAYMENT_EXPIRE_AFTER_MINUTES', '1440'))
+PAYMENT_RECONCILE_CHUNK_SIZE = int(os.getenv('PAYMENT_RECONCILE_CHUNK_SIZE', '500'))
+PAYMENT_RECONCILE_LOCK_TIMEOUT = int(os.getenv('PAYMENT_RECONCILE_LOCK_TIMEOUT', '3600'))
+
+# Idempotency-Key replay for POST /payments/initiate/ (listings/idempotency.py):
+# how long results are kept, how long an in-flight request holds its key and
+# how long a duplicate waits for it, in seconds
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', '86400'))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', '60'))
+IDEMPOTENCY_WAIT = float(os.getenv('IDEMPOTENCY_WAIT', '30'))
+
+# Bearer token required by GET /metrics (listings/metrics.py); empty leaves
+# it open, for scrapers on a private network
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Transactional outbox (listings/outbox.py) drained by `manage.py outbox_relay`
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '500'))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '0.5'))
+OUTBOX_RETENTION_DAYS = int(os.getenv('OUTBOX_RETENTION_DAYS', '7'))
+# Single-email tasks the relay folds into one batch task per poll, sent
+# over a single SMTP connection, at most OUTBOX_COALESCE_LIMIT per batch
+OUTBOX_BATCHED_TASKS = {
+    'listings.tasks.send_payment_confirmation_email': 'listings.tasks.send_payment_emails',
+    'listings.tasks.send_payment_failure_email': 'listings.tasks.send_payment_emails',
+}
+OUTBOX_COALESCE_LIMIT = int(os.getenv('OUTBOX_COALESCE_LIMIT', '100'))
 
 # Email Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # For development
@@ -147,6 +263,9 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'noreply@alxtravel.com')
+# Retries of individual failed messages in a batch, backing off exponentially
+EMAIL_MAX_RETRIES = int(os.getenv('EMAIL_MAX_RETRIES', '3'))
+EMAIL_RETRY_BACKOFF = int(os.getenv('EMAIL_RETRY_BACKOFF', '30'))
 
 # Celery Configuration
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
@@ -155,3 +274,43 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Nothing reads task return values; tasks that should store them opt back in
+CELERY_TASK_IGNORE_RESULT = True
+# Payment state changes and notifications run on separate queues, so an email
+# backlog never delays a verification. Run a worker per queue:
+#   celery -A alx_travel_app worker -Q payments
+#   celery -A alx_travel_app worker -Q notifications
+CELERY_TASK_ROUTES = {
+    'listings.tasks.process_payment_events': {'queue': 'payments'},
+    'listings.tasks.reconcile_pending_payments': {'queue': 'payments'},
+    'listings.tasks.send_payment_emails': {'queue': 'notifications'},
+    'listings.tasks.send_payment_confirmation_email': {'queue': 'notifications'},
+    'listings.tasks.send_payment_failure_email': {'queue': 'notifications'},
+}
+# Tasks here run for seconds, so a worker reserves one at a time instead of
+# holding a prefetched backlog other workers could be running
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.getenv('CELERY_WORKER_PREFETCH_MULTIPLIER', '1'))
+# Outbound email per worker, in batch tasks of up to OUTBOX_COALESCE_LIMIT
+# messages (Celery rate limit syntax, e.g. '30/m'; empty for none)
+EMAIL_TASK_RATE_LIMIT = os.getenv('EMAIL_TASK_RATE_LIMIT', '30/m') or None
+# Long tasks are acknowledged when they finish, so a worker that dies mid-run
+# hands them to another worker instead of losing them (at least once, like
+# the outbox)
+CELERY_TASK_ANNOTATIONS = {
+    'listings.tasks.process_payment_events': {'acks_late': True},
+    'listings.tasks.reconcile_pending_payments': {'acks_late': True},
+    'listings.tasks.send_payment_emails': {'acks_late': True, 'rate_limit': EMAIL_TASK_RATE_LIMIT},
+    'listings.tasks.send_payment_confirmation_email': {'rate_limit': EMAIL_TASK_RATE_LIMIT},
+    'listings.tasks.send_payment_failure_email': {'rate_limit': EMAIL_TASK_RATE_LIMIT},
+}
+CELERY_BEAT_SCHEDULE = {
+    # Safety net for events whose immediate run was lost or retried
+    'process-payment-events': {
+        'task': 'listings.tasks.process_payment_events',
+        'schedule': 60.0,
+    },
+    'reconcile-pending-payments': {
+        'task': 'listings.tasks.reconcile_pending_payments',
+        'schedule': 15 * 60.0,
+    },
+}
@@ -11,8 +11,11 @@ import requests
 import json
 from datetime import datetime, timedelta
 
-# Add the Django project to the Python path
-sys.path.append('/home/ashu/Desktop/ALX/alx_travel_app_0x02/alx_travel_app')
+# Add the Django project (next to this script, or ALX_TRAVEL_PROJECT_DIR) to the Python path
+sys.path.append(os.getenv(
+    'ALX_TRAVEL_PROJECT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alx_travel_app'),
+))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_travel_app.settings')
 django.setup()
 
@@ -228,6 +231,7 @@ def main():
         display_payment_summary()
         
         print("\n✅ All tests completed successfully!")
+        print("\nTo load-test every API endpoint: python manage.py bench_api")
         print("\nTo test the actual API endpoints:")
         print("1. Start the Django server: python manage.py runserver")
         print("2. Access Swagger UI: http://localhost:8000/swagger/")